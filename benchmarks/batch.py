@@ -0,0 +1,24 @@
+import os
+import sys
+from typing import List
+
+from benchmarks.common import measure
+from benchmarks.compiler import DOCUMENT, make_json
+from pylpc.batch import parse_many
+from pylpc.pylpc import ParseError
+
+def run(inputs: List[str], workers: int) -> None:
+    for outcome in parse_many(make_json, inputs, workers=workers):
+        assert not isinstance(outcome, ParseError)
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    inputs = [DOCUMENT * (1 + i % 8) for i in range(count)]
+    size = sum(len(input) for input in inputs)
+
+    print(f"Parsing {count} JSON-like inputs, {size} characters in total, on {os.cpu_count()} CPUs")
+    print(f"{'workers':>10} {'seconds':>10} {'MB/s':>10}")
+
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        seconds = measure(lambda: run(inputs, workers))
+        print(f"{workers:>10} {seconds:>10.4f} {size / seconds / 1e6:>10.2f}")
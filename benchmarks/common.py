@@ -0,0 +1,44 @@
+import time
+from typing import Callable, List, Sequence, Tuple
+
+SIZES = [10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+
+def format_size(size: int) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return f"{size:g} {unit}"
+
+        size //= 1024
+
+    return f"{size} B"
+
+def repeat_to_size(chunk: str, size: int) -> str:
+    return (chunk * (size // len(chunk) + 1))[:size]
+
+def measure(func: Callable[[], object], repeat: int = 1) -> float:
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+def report_scaling(title: str, rows: Sequence[Tuple[int, float]]) -> None:
+    print(title)
+    print(f"{'size':>10} {'seconds':>10} {'MB/s':>10} {'us/KB':>10}")
+
+    for size, seconds in rows:
+        print(f"{format_size(size):>10} {seconds:>10.4f} {size / seconds / 1e6:>10.2f} {seconds * 1e6 / (size / 1024):>10.2f}")
+
+    print()
+
+def run_scaling(title: str, make_input: Callable[[int], object], func: Callable[[object], object], sizes: List[int] = SIZES) -> None:
+    rows = []
+
+    for size in sizes:
+        data = make_input(size)
+        rows.append((size, measure(lambda: func(data))))
+
+    report_scaling(title, rows)
@@ -0,0 +1,56 @@
+import sys
+from typing import Any, Callable, List, Tuple
+
+from benchmarks.common import measure
+from pylpc.compiler import compile
+from pylpc.parsers import Between, Char, FirstSuccess, Map, Maybe, MaybeValue, Reference, Seq, Terminal, ZeroOrMore
+from pylpc.pylpc import Parser, Regex, StringStream
+
+DOCUMENT = """{"id": 1024, "name": "widget", "tags": ["a", "b", "c"], "price": 12.5, "stock": null,
+ "dims": {"w": 3, "h": 4.25, "d": [1, 2, 3]}, "active": true, "notes": "escaped \\"quotes\\" here"},
+"""
+
+def make_json() -> Parser[Any]:
+    ws = Terminal(Regex("[ \\t\\r\\n]*"))
+    token = lambda c: Char(c) << ws
+    value : Reference[Any] = Reference()
+
+    string = Map(Terminal(Regex('"(?:[^"\\\\]|\\\\.)*"')) << ws, lambda r: r.value[1:-1])
+    number = Map(Terminal(Regex("-?[0-9]+(?:\\.[0-9]+)?(?:[eE][+-]?[0-9]+)?")) << ws, lambda r: float(r.value))
+    literal = Map(Terminal(Regex("true|false|null")) << ws, lambda r: {"true": True, "false": False, "null": None}[r.value])
+
+    def items(maybe: MaybeValue) -> List[Any]:
+        if not maybe.IsSuccess():
+            return []
+
+        first, rest = maybe.ExtractSuccess()
+        return [first.value] + [item.value for item in rest.value]
+
+    def separated(item: Parser[Any]) -> Parser[List[Any]]:
+        return Map(Maybe(Seq(item, ZeroOrMore(token(',') >> item))), lambda r: items(r.value))
+
+    member = Seq(string, token(':'), Parser(value))
+    obj = Map(Between(token('{'), separated(member), token('}')), lambda r: {member[0].value: member[2].value for member in r.value})
+    array = Between(token('['), separated(Parser(value)), token(']'))
+    value.set(FirstSuccess([obj, array, string, number, literal]))
+
+    return ws >> ZeroOrMore(Parser(value) << Maybe(token(','))) << Terminal(Regex("$"))
+
+def run(parser: Parser[Any], data: str) -> None:
+    stream = StringStream(data)
+    parser.parse(stream)
+    assert stream.is_eos()
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200 * 1024
+    data = DOCUMENT * max(1, size // len(DOCUMENT))
+    interpreted = make_json()
+    backends : List[Tuple[str, Callable[[], Parser[Any]]]] = [("interpreted", lambda: interpreted), ("compiled", lambda: compile(interpreted))]
+
+    print(f"Parsing {len(data)} characters of JSON-like input")
+    print(f"{'backend':>12} {'seconds':>10} {'MB/s':>10}")
+
+    for name, make in backends:
+        parser = make()
+        seconds = measure(lambda: run(parser, data), repeat=3)
+        print(f"{name:>12} {seconds:>10.4f} {len(data) / seconds / 1e6:>10.2f}")
@@ -0,0 +1,51 @@
+import sys
+import time
+from typing import Any
+
+from benchmarks.common import measure
+from pylpc.parsers import Between, Char, FirstSuccess, Map, Memo, Reference, Seq, Terminal, ZeroOrMore
+from pylpc.pylpc import Parser, Regex, StringStream
+
+STATEMENT = "total = (price + 12) * count - discount(code, 3);\n"
+
+def make_grammar() -> Parser[Any]:
+    ws = Terminal(Regex("[ \\t\\n]*"))
+    token = lambda pattern: Terminal(Regex(pattern)) << ws
+    expression : Reference[Any] = Reference()
+
+    arguments = Seq(Parser(expression), ZeroOrMore(token(",") >> Parser(expression)))
+    call = Seq(token("[a-z]+"), Between(token("\\("), arguments, token("\\)")))
+    atom : Parser[Any] = FirstSuccess([call, token("[a-z]+"), token("[0-9]+"), Between(token("\\("), Parser(expression), token("\\)"))])
+    expression.set(Memo(Seq(atom, ZeroOrMore(Seq(token("[-+*/]"), atom)))))
+    statement = Memo(Map(Seq(token("[a-z]+"), token("="), Parser(expression), token(";")), lambda r: r.value[0].value))
+
+    return ws >> ZeroOrMore(statement) << Terminal(Regex("$"))
+
+if __name__ == "__main__":
+    max_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    grammar = make_grammar()
+
+    print("Re-parsing after replacing a number in the middle line (full: a new stream, incremental: StringStream.edit)")
+    print(f"{'lines':>10} {'full ms':>10} {'first ms':>10} {'edit ms':>10}")
+
+    lines = 100
+
+    while lines <= max_lines:
+        data = STATEMENT * lines
+        full = measure(lambda: grammar.parse(StringStream(data)), repeat=3)
+
+        stream = StringStream(data)
+        grammar.parse(stream)
+        offset = data.index("12", len(STATEMENT) * (lines // 2))
+        times = []
+
+        # The first edit after a parse goes through the whole memo table, the ones after it only near the edits
+        for i in range(6):
+            start = time.perf_counter()
+            stream.edit(offset, 2, str(10 + i))
+            stream.set_offset(0)
+            grammar.parse(stream)
+            times.append(time.perf_counter() - start)
+
+        print(f"{lines:>10} {full * 1000:>10.2f} {times[0] * 1000:>10.2f} {min(times[1:]) * 1000:>10.2f}")
+        lines *= 10
@@ -0,0 +1,70 @@
+import os
+import re
+import sys
+from typing import Callable, List
+
+from benchmarks.common import measure, repeat_to_size
+from pylpc.lexer import CompiledLexer, EOS_PATTERN_ID, Lexer, Pattern, Token, TokenStream
+from pylpc.pylpc import Parser, Regex, StringStream
+
+KEYWORDS = [
+    "and", "as", "assert", "async", "await", "break", "case", "catch", "class", "const", "continue", "def", "default",
+    "del", "do", "elif", "else", "enum", "except", "export", "extends", "false", "final", "finally", "for", "from",
+    "func", "global", "goto", "if", "import", "in", "interface", "is", "lambda", "let", "match", "module", "mut",
+    "new", "nil", "nonlocal", "not", "or", "package", "pass", "private", "protected", "pub", "public", "raise",
+    "return", "self", "static", "struct", "super", "switch", "this", "throw", "trait", "true", "try", "type", "var",
+    "while", "with", "yield",
+]
+
+OPERATORS = ["==", "!=", "<=", ">=", "&&", "||", "->", "=>", "+=", "-=", "=", "<", ">", "+", "-", "*", "/", "%", "(", ")", "{", "}", "[", "]", ";", ",", "."]
+
+def make_patterns() -> List[Pattern]:
+    patterns = [Pattern("WS", Regex("[\\s]+")), Pattern("COMMENT", Regex("//[^\\n]*"))]
+    patterns += [Pattern(keyword.upper(), Regex(keyword)) for keyword in KEYWORDS]
+    patterns += [Pattern(f"OP{idx}", Regex(re.escape(op))) for idx, op in enumerate(OPERATORS)]
+    patterns += [Pattern("ID", Regex("[a-zA-Z_][a-zA-Z0-9_]*")), Pattern("NUM", Regex("[0-9]+(?:\\.[0-9]+)?")), Pattern("STR", Regex('"(?:[^"\\\\]|\\\\.)*"'))]
+    return patterns
+
+SOURCE = """func fib(n) {
+    // naive recursion
+    if n <= 1 { return n; }
+    let result = fib(n - 1) + fib(n - 2);
+    return result * 1.0;
+}
+while counter != 10 && running { counter += 1; print("value", counter); }
+"""
+
+def lex_all(lexer: Parser[Token], data: str) -> int:
+    stream = StringStream(data)
+    count = 0
+
+    while lexer.parse(stream).value.id != EOS_PATTERN_ID():
+        count += 1
+
+    return count
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50 * 1024
+    data = repeat_to_size(SOURCE, size)
+    patterns = make_patterns()
+    backends : List[Callable[[List[Pattern]], Parser[Token]]] = [Lexer, CompiledLexer]
+
+    print(f"Lexing {len(data)} characters with {len(patterns)} patterns")
+    print(f"{'backend':>14} {'seconds':>10} {'tokens/s':>12}")
+
+    for backend in backends:
+        counts : List[int] = []
+        seconds = measure(lambda: counts.append(lex_all(backend(patterns), data)))
+        print(f"{backend.__name__:>14} {seconds:>10.4f} {counts[0] / seconds:>12.0f}")
+
+    # tokenize_parallel makes a TokenInfo per token, while a TokenStream keeps the arrays the workers send back
+    print()
+    print(f"Tokenizing with CompiledLexer on {os.cpu_count()} CPUs")
+    print(f"{'workers':>14} {'seconds':>10} {'tokens/s':>12} {'stream s':>10}")
+    lexer = CompiledLexer(patterns)
+
+    for workers in sorted({1, 2, os.cpu_count() or 1}):
+        counts = []
+        seconds = measure(lambda: counts.append(sum(1 for _ in lexer.tokenize_parallel(data, workers=workers))))
+        stream_seconds = measure(lambda: TokenStream(lexer, data, workers=workers))
+        print(f"{workers:>14} {seconds:>10.4f} {counts[0] / seconds:>12.0f} {stream_seconds:>10.4f}")
@@ -0,0 +1,31 @@
+import random
+import re
+import sys
+from typing import Any, List
+
+from benchmarks.common import measure
+from benchmarks.lexer import KEYWORDS, OPERATORS
+from pylpc.compiler import compile
+from pylpc.parsers import Keywords, Longest, Terminal, ZeroOrMore
+from pylpc.pylpc import Parser, Regex, StringStream
+
+def make_grammar(choice: Parser[str]) -> Parser[Any]:
+    return ZeroOrMore(choice << Terminal(Regex(" *"))) << Terminal(Regex("$"))
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    literals : List[str] = KEYWORDS + OPERATORS
+    data = " ".join(random.Random(0).choice(literals) for _ in range(count))
+    grammars = [
+        ("Longest", make_grammar(Longest([Terminal(Regex(re.escape(literal)), literal) for literal in literals]))),
+        ("Keywords", make_grammar(Keywords(literals))),
+    ]
+
+    print(f"Matching {count} of {len(literals)} keywords and operators, {len(data)} characters")
+    print(f"{'choice':>10} {'compiled':>10} {'seconds':>10} {'matches/s':>12}")
+
+    for name, grammar in grammars:
+        for compiled in [False, True]:
+            parser = compile(grammar) if compiled else grammar
+            seconds = measure(lambda: parser.parse(StringStream(data)), repeat=3)
+            print(f"{name:>10} {str(compiled):>10} {seconds:>10.4f} {count / seconds:>12.0f}")
@@ -0,0 +1,25 @@
+import sys
+
+from benchmarks.common import measure
+from pylpc.parsers import Char, Letters, Seq, ZeroOrMore
+from pylpc.pylpc import StringStream
+
+def parse_lines(data: str) -> None:
+    parser = ZeroOrMore(Seq(Letters(), Char('\n')))
+    stream = StringStream(data)
+    parser.parse(stream)
+    assert stream.is_eos()
+
+if __name__ == "__main__":
+    max_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    print("Parsing with a position lookup per parser call (linear scaling expected: constant us/line)")
+    print(f"{'lines':>10} {'seconds':>10} {'us/line':>10}")
+
+    lines = 10000
+
+    while lines <= max_lines:
+        data = "abc\n" * lines
+        seconds = measure(lambda: parse_lines(data))
+        print(f"{lines:>10} {seconds:>10.4f} {seconds * 1e6 / lines:>10.2f}")
+        lines *= 10
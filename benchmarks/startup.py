@@ -0,0 +1,70 @@
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, List
+
+# Each measurement runs in a fresh interpreter, like a short-lived worker: import the library, build a 200-rule grammar
+# and a 200-pattern lexer, and parse one small input.
+RULES = 200
+
+def build() -> Any:
+    from pylpc.lexer import CompiledLexer, Pattern
+    from pylpc.parsers import Char, FirstSuccess, Map, Maybe, Named, Reference, Seq, Terminal
+    from pylpc.pylpc import Parser, Regex
+
+    ws = Terminal(Regex("[ \\t\\n]*"))
+    rules : List[Reference[Any]] = [Reference() for _ in range(RULES)]
+
+    for i, rule in enumerate(rules):
+        keyword = Terminal(Regex(f"kw{i}(?![a-z0-9_])"))
+        identifier = Terminal(Regex("[a-z_][a-z0-9_]*"))
+        number = Map(Terminal(Regex(f"[0-9]+(?:\\.[0-9]{{{i % 9 + 1}}})?")), lambda r: float(r.value))
+        value : Parser[Any] = FirstSuccess([identifier, number, Parser(rules[(i * 7 + 1) % RULES])])
+        rule.set(Named(f"rule{i}", Seq(keyword << ws, value << ws, Maybe(Char(';')))))
+
+    lexer = CompiledLexer([Pattern(f"P{i}", Regex(f"tok{i}[a-z]*|#{i}")) for i in range(RULES)] + [Pattern("WS", Regex("\\s+"))])
+    return Seq(Parser(rules[0]), lexer)
+
+def child(mode: str, path: str) -> None:
+    start = time.perf_counter()
+    from pylpc import cache
+    from pylpc.compiler import compile
+
+    grammar = build()
+
+    if mode == "compiled":
+        grammar = compile(grammar)
+    elif mode == "cached":
+        grammar = cache.load(grammar, path, compiled=True)
+
+    grammar.parse("kw0 kw1 kw8 x;tok5")
+    print(time.perf_counter() - start)
+
+def measure_startup(mode: str, path: str, repeat: int) -> float:
+    seconds : List[float] = []
+
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child", mode, path], check=True, capture_output=True, text=True).stdout
+        seconds.append(float(output))
+
+    return statistics.median(seconds)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 9
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "grammar.cache")
+        measure_startup("cached", path, 1) # Writes the cache
+
+        print(f"Startup with a {RULES}-rule grammar and a {RULES}-pattern lexer (median of {repeat} fresh interpreters)")
+        print(f"{'mode':>10} {'ms':>10}")
+
+        for mode in ["plain", "compiled", "cached"]:
+            print(f"{mode:>10} {measure_startup(mode, path, repeat) * 1000:>10.1f}")
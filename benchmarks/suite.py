@@ -0,0 +1,211 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from benchmarks.common import format_size, repeat_to_size
+from benchmarks.compiler import DOCUMENT, make_json
+from benchmarks.lexer import SOURCE, make_patterns
+from benchmarks.tokens import make_grammar
+from pylpc import __version__
+from pylpc.compiler import compile
+from pylpc.lexer import CompiledLexer, EOS_PATTERN_ID, Lexer, LexerParser, Pattern, TokenStream
+from pylpc.parsers import Between, Char, FirstSuccess, Map, Reference, Seq, Terminal, ZeroOrMore
+from pylpc.pylpc import Parser, Regex, StringStream
+
+SIZES = [1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024]
+
+# A workload builds its parser once, makes an input of about the given size and parses it, returning the number of
+# tokens it produced or None if it doesn't produce tokens
+class Workload(NamedTuple):
+    name : str
+    make_input : Callable[[int], str]
+    make_runner : Callable[[], Callable[[str], Optional[int]]]
+
+# Parsers need whole documents, so inputs are made of whole repeats of a unit
+def repeat_units(unit: str, size: int) -> str:
+    return unit * max(1, size // len(unit))
+
+def parse_all(parser: Parser[Any]) -> Callable[[str], Optional[int]]:
+    def run(data: str) -> Optional[int]:
+        stream = StringStream(data)
+        parser.parse(stream)
+        assert stream.is_eos()
+        return None
+
+    return run
+
+# Lexes into a TokenStream first, which is counted in the time
+def parse_tokens(lexer: LexerParser, parser: Parser[Any]) -> Callable[[str], Optional[int]]:
+    def run(data: str) -> Optional[int]:
+        stream = TokenStream(lexer, data)
+        parser.parse(stream)
+        assert stream.is_eos()
+        return stream.get_length()
+
+    return run
+
+def make_lexemes(token_stream: bool) -> Callable[[str], Optional[int]]:
+    lexer = CompiledLexer(make_patterns())
+    return parse_tokens(lexer, make_grammar(lexer)) if token_stream else parse_all(make_grammar(lexer))
+
+def lex_all(lexer: Parser[Any]) -> Callable[[str], Optional[int]]:
+    def run(data: str) -> Optional[int]:
+        stream = StringStream(data)
+        count = 0
+
+        while lexer.parse(stream).value.id != EOS_PATTERN_ID():
+            count += 1
+
+        return count
+
+    return run
+
+def make_arithmetic() -> Parser[Any]:
+    ws = Terminal(Regex("[ \\n]*"))
+    token = lambda pattern: Terminal(Regex(pattern)) << ws
+    expression : Reference[Any] = Reference()
+
+    def fold(result: Any) -> float:
+        value = result.value[0].value
+
+        for operation in result.value[1].value:
+            operator, operand = operation.value[0].value, operation.value[1].value
+            value = value + operand if operator == "+" else value - operand if operator == "-" else value * operand if operator == "*" else value / (operand or 1)
+
+        return value
+
+    number = Map(token("[0-9]+(?:\\.[0-9]+)?"), lambda r: float(r.value))
+    factor = FirstSuccess([number, Between(token("\\("), Parser(expression), token("\\)"))])
+    term = Map(Seq(factor, ZeroOrMore(Seq(token("[*/]"), factor))), fold)
+    expression.set(Map(Seq(term, ZeroOrMore(Seq(token("[-+]"), term))), fold))
+
+    return ws >> ZeroOrMore(Parser(expression) << token(";")) << Terminal(Regex("$"))
+
+ARITHMETIC = "1 + 2 * (3 - 4.5) / 6 - (7 * (8 + 9) - 10) * 11.25;\n"
+
+def make_nested(depth: int) -> str:
+    return "[" * depth + "1" + ", 2]" * depth + ",\n"
+
+# Declarations that all share a long prefix and differ only in their last token, so every alternative but the last one
+# gets most of the way through the line before failing
+def make_backtracking() -> Parser[Any]:
+    ws = Terminal(Regex("[ \\n]*"))
+    token = lambda pattern: Terminal(Regex(pattern)) << ws
+    names = Seq(token("[a-z]+"), ZeroOrMore(token(",") >> token("[a-z]+")))
+    declaration = FirstSuccess([Seq(names, token(":"), token(type_name), token(";")) for type_name in ["int", "str", "bool", "list", "dict", "float"]])
+
+    return ws >> ZeroOrMore(declaration) << Terminal(Regex("$"))
+
+BACKTRACKING = "alpha, beta, gamma, delta, epsilon, zeta, eta, theta : float;\n"
+
+WORKLOADS = [
+    Workload("lexer-10", lambda size: repeat_to_size(SOURCE, size), lambda: lex_all(Lexer(make_patterns()[:2] + make_patterns()[-8:]))),
+    Workload("lexer-100", lambda size: repeat_to_size(SOURCE, size), lambda: lex_all(Lexer(make_patterns()))),
+    Workload("compiled-lexer-100", lambda size: repeat_to_size(SOURCE, size), lambda: lex_all(CompiledLexer(make_patterns()))),
+    Workload("json", lambda size: repeat_units(DOCUMENT, size), lambda: parse_all(make_json())),
+    Workload("json-compiled", lambda size: repeat_units(DOCUMENT, size), lambda: parse_all(compile(make_json()))),
+    Workload("lexemes", lambda size: repeat_units(SOURCE, size), lambda: make_lexemes(False)),
+    Workload("lexemes-token-stream", lambda size: repeat_units(SOURCE, size), lambda: make_lexemes(True)),
+    Workload("arithmetic", lambda size: repeat_units(ARITHMETIC, size), lambda: parse_all(make_arithmetic())),
+    Workload("nested", lambda size: repeat_units(make_nested(40), size), lambda: parse_all(make_json())),
+    Workload("backtracking", lambda size: repeat_units(BACKTRACKING, size), lambda: parse_all(make_backtracking())),
+]
+
+def run_workload(workload: Workload, size: int, repeat: int) -> Dict[str, Any]:
+    data = workload.make_input(size)
+    run = workload.make_runner()
+    seconds : List[float] = []
+    tokens : Optional[int] = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = run(data)
+        seconds.append(time.perf_counter() - start)
+
+    # Memory is measured in a separate run, since tracing allocations slows parsing down several times
+    tracemalloc.start()
+    run(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = min(seconds)
+
+    return {
+        "workload": workload.name,
+        "size": len(data),
+        "seconds": best,
+        "median_seconds": statistics.median(seconds),
+        "mb_per_s": len(data) / best / 1e6,
+        "tokens_per_s": None if tokens is None else tokens / best,
+        "peak_memory": peak,
+    }
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    previous = {(r["workload"], r["size"]): r for r in baseline["results"]}
+    regressions : List[str] = []
+
+    for result in results:
+        old = previous.get((result["workload"], result["size"]))
+
+        if old is not None and result["mb_per_s"] < old["mb_per_s"] * (1 - threshold):
+            regressions.append(f"{result['workload']} at {format_size(result['size'])}: {old['mb_per_s']:.3f} -> {result['mb_per_s']:.3f} MB/s")
+
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Runs the benchmark suite and writes the results as JSON")
+    parser.add_argument("--workloads", nargs="+", choices=[w.name for w in WORKLOADS], default=[w.name for w in WORKLOADS])
+    parser.add_argument("--min-size", type=int, default=SIZES[0])
+    parser.add_argument("--max-size", type=int, default=1024 * 1024, help=f"inputs go up to {format_size(SIZES[-1])}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    parser.add_argument("--compare", help="results of an earlier run to check for throughput regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative throughput drop reported as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = [size for size in SIZES if args.min_size <= size <= args.max_size]
+    results : List[Dict[str, Any]] = []
+
+    for workload in WORKLOADS:
+        if workload.name in args.workloads:
+            for size in sizes:
+                result = run_workload(workload, size, args.repeat)
+                results.append(result)
+                print(f"{workload.name:>20} {format_size(size):>10} {result['mb_per_s']:>10.3f} MB/s {result['peak_memory'] / 1024:>12.0f} KB peak", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "pylpc": __version__,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.threshold)
+
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+
+        return 1 if len(regressions) != 0 else 0
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+import sys
+
+from benchmarks.common import SIZES, repeat_to_size, run_scaling
+from pylpc.parsers import Digits, FirstSuccess, Letters, Whitespaces, ZeroOrMore
+from pylpc.pylpc import StringStream
+
+# A single line keeps position computation out of the measurement so only terminal matching is timed.
+WORDS = "alpha 123 beta 4567 gamma 89 delta "
+
+def lex(data: object) -> None:
+    parser = ZeroOrMore(FirstSuccess([Letters(), Digits(), Whitespaces()]))
+    stream = StringStream(str(data))
+    parser.parse(stream)
+    assert stream.is_eos()
+
+if __name__ == "__main__":
+    sizes = [size for size in SIZES if len(sys.argv) < 2 or size <= int(sys.argv[1])]
+    run_scaling("Terminal matching (linear scaling expected: constant us/KB)", lambda size: repeat_to_size(WORDS, size), lex, sizes)
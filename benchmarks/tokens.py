@@ -0,0 +1,53 @@
+import sys
+from typing import Any
+
+from benchmarks.common import measure
+from benchmarks.lexer import OPERATORS, SOURCE, make_patterns
+from pylpc.lexer import CompiledLexer, EOSLexeme, Lexeme, LexerParser, TokenStream
+from pylpc.parsers import Between, FirstSuccess, Maybe, Reference, Seq, ZeroOrMore
+from pylpc.pylpc import Parser, StringStream
+
+# A statement grammar for the lexer benchmark's source, written entirely with lexemes
+def make_grammar(lexer: LexerParser) -> Parser[Any]:
+    trivia = ZeroOrMore(FirstSuccess([Lexeme(lexer, "WS"), Lexeme(lexer, "COMMENT")]))
+    token = lambda id: Lexeme(lexer, id) << trivia
+    op = lambda value: token(f"OP{OPERATORS.index(value)}")
+    expression : Reference[Any] = Reference()
+    statement : Reference[Any] = Reference()
+
+    arguments = Maybe(Seq(Parser(expression), ZeroOrMore(op(",") >> Parser(expression))))
+    call = Seq(token("ID"), Maybe(Between(op("("), arguments, op(")"))))
+    atom : Parser[Any] = FirstSuccess([token("NUM"), token("STR"), call, Between(op("("), Parser(expression), op(")"))])
+    operator = FirstSuccess([op(value) for value in ["==", "!=", "<=", ">=", "&&", "||", "<", ">", "+", "-", "*", "/", "%"]])
+    expression.set(Seq(atom, ZeroOrMore(Seq(operator, atom))))
+
+    block = Between(op("{"), ZeroOrMore(Parser(statement)), op("}"))
+    parameters = Maybe(Seq(token("ID"), ZeroOrMore(op(",") >> token("ID"))))
+    statement.set(FirstSuccess([
+        Seq(token("FUNC"), token("ID"), Between(op("("), parameters, op(")")), block),
+        Seq(token("IF"), Parser(expression), block),
+        Seq(token("WHILE"), Parser(expression), block),
+        Seq(token("LET"), token("ID"), op("="), Parser(expression), op(";")),
+        Seq(token("RETURN"), Parser(expression), op(";")),
+        Seq(token("ID"), FirstSuccess([op("="), op("+="), op("-=")]), Parser(expression), op(";")),
+        Seq(Parser(expression), op(";")),
+    ]))
+
+    return trivia >> ZeroOrMore(Parser(statement)) << EOSLexeme(lexer)
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    data = SOURCE * repeats
+    lexer = CompiledLexer(make_patterns())
+    grammar = make_grammar(lexer)
+    tokens = TokenStream(lexer, data).get_length()
+
+    print(f"Parsing {len(data)} characters, {tokens} tokens, with a grammar of lexemes")
+    print(f"{'stream':>14} {'lex ms':>10} {'parse ms':>10} {'total ms':>10} {'tokens/s':>12}")
+
+    total = measure(lambda: grammar.parse(StringStream(data)), repeat=3)
+    print(f"{'StringStream':>14} {'':>10} {'':>10} {total * 1000:>10.2f} {tokens / total:>12.0f}")
+
+    lex = measure(lambda: TokenStream(lexer, data), repeat=3)
+    parse = measure(lambda: grammar.parse(TokenStream(lexer, data)), repeat=3) - lex
+    print(f"{'TokenStream':>14} {lex * 1000:>10.2f} {parse * 1000:>10.2f} {(lex + parse) * 1000:>10.2f} {tokens / (lex + parse):>12.0f}")
@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+from typing import Any, Callable, Iterable, Iterator, Optional, Sized, Tuple, TypeVar, Union
+
+from pylpc.pylpc import ParseError, ParseResult, Parser, StringStream
+
+T = TypeVar('T')
+
+# An input is either the text to parse or a (name, text) pair, where the name is used for the stream's locations
+Input = Union[str, Tuple[str, str]]
+Outcome = Union[ParseResult[T], ParseError]
+
+# The grammar built by each worker process's initializer
+_worker_parser : Optional[Parser[Any]] = None
+
+def _parse_input(parser: Parser[T], input: Input) -> Outcome[T]:
+    stream = StringStream(input) if isinstance(input, str) else StringStream(input[1], input[0])
+
+    try:
+        return parser.parse(stream)
+    except ParseError as e:
+        return e
+
+def _init_worker(grammar: Callable[[], Parser[Any]]) -> None:
+    global _worker_parser
+    _worker_parser = grammar()
+
+def _parse_in_worker(job: Tuple[int, Input]) -> Tuple[int, Outcome[Any]]:
+    assert _worker_parser is not None
+    return job[0], _parse_input(_worker_parser, job[1])
+
+def _get_workers(workers: Optional[int]) -> int:
+    if workers is None:
+        return os.cpu_count() or 1
+
+    if workers < 0:
+        raise ValueError("workers must be non-negative")
+
+    return workers
+
+# Enough chunks for each worker to get several, so a slow chunk at the end doesn't leave the others idle, but no more
+# than that, since every chunk is a round trip to a worker
+def _get_chunk_size(inputs: Iterable[Input], workers: int) -> int:
+    if not isinstance(inputs, Sized):
+        return 16
+
+    return max(1, min(256, len(inputs) // (workers * 4)))
+
+def _parse_all(grammar: Callable[[], Parser[T]], inputs: Iterable[Input], workers: Optional[int], chunk_size: Optional[int], ordered: bool) -> Iterator[Tuple[int, Outcome[T]]]:
+    count = _get_workers(workers)
+
+    if chunk_size is not None and chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+
+    if count <= 1:
+        parser = grammar()
+
+        for index, input in enumerate(inputs):
+            yield index, _parse_input(parser, input)
+
+        return
+
+    chunk_size = _get_chunk_size(inputs, count) if chunk_size is None else chunk_size
+
+    with multiprocessing.Pool(count, _init_worker, (grammar,)) as pool:
+        jobs = enumerate(inputs)
+        yield from pool.imap(_parse_in_worker, jobs, chunk_size) if ordered else pool.imap_unordered(_parse_in_worker, jobs, chunk_size)
+
+# Parses each of the inputs with the grammar that the grammar callable builds and yields, in the order of the inputs,
+# its ParseResult or the ParseError it failed with. With more than one worker the inputs are parsed in a pool of worker
+# processes, each of which calls grammar once to build its own copy, so grammar has to be picklable, like a module-level
+# function, even when the grammar it builds isn't. Inputs are sent to the workers in chunks of chunk_size, and results
+# have to be picklable to be sent back. workers defaults to the number of CPUs; 0 or 1 parses in this process.
+def parse_many(grammar: Callable[[], Parser[T]], inputs: Iterable[Input], workers: Optional[int] = None, chunk_size: Optional[int] = None) -> Iterator[Outcome[T]]:
+    for _, outcome in _parse_all(grammar, inputs, workers, chunk_size, True):
+        yield outcome
+
+# Like parse_many, but yields each outcome as soon as it is ready along with the index of its input
+def parse_many_unordered(grammar: Callable[[], Parser[T]], inputs: Iterable[Input], workers: Optional[int] = None, chunk_size: Optional[int] = None) -> Iterator[Tuple[int, Outcome[T]]]:
+    return _parse_all(grammar, inputs, workers, chunk_size, False)
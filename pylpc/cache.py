@@ -0,0 +1,189 @@
+import dataclasses
+import hashlib
+import marshal
+import os
+import pickle
+import sys
+from types import CodeType
+from typing import Any, Dict, List, Optional, Tuple, TypeVar
+
+from pylpc import __version__
+from pylpc.compiler import _Compiler, _Layout, _compile_source
+from pylpc.parsers import Reference
+from pylpc.pylpc import FunctionParser, Parser, Regex, RegexAnalysis
+
+T = TypeVar('T')
+
+# Generated code is marshalled and regex analyses depend on the re module, so a cache only applies to the interpreter
+# and library version that wrote it. The format is bumped whenever what is stored changes meaning.
+_CACHE_FORMAT = 5
+_CACHE_TAG = f"pylpc-{__version__}-{_CACHE_FORMAT}-{sys.implementation.cache_tag}"
+
+_SIMPLE_TYPES = (type(None), bool, int, float, complex, str, bytes)
+
+class _Fingerprint:
+    def __init__(self) -> None:
+        self.__hash = hashlib.sha256()
+        self.__visited : Dict[int, int] = {}
+        self.__keep : List[Any] = [] # Keeps visited objects alive so their ids can't be reused
+        self.__regexes : Dict[str, Regex] = {}
+
+    def get_digest(self) -> str:
+        return self.__hash.hexdigest()
+
+    def get_regexes(self) -> List[Regex]:
+        return list(self.__regexes.values())
+
+    # The objects visited, in the order they were first seen, and that order by object id
+    def get_objects(self) -> List[Any]:
+        return self.__keep
+
+    def get_indices(self) -> Dict[int, int]:
+        return self.__visited
+
+    def __write(self, *parts: Any) -> None:
+        self.__hash.update((repr(parts) + "\n").encode("utf-8", "surrogatepass"))
+
+    def visit(self, node: Any) -> None:
+        if isinstance(node, _SIMPLE_TYPES + (Regex,)):
+            self.__value(node)
+            return
+
+        # Shared and recursive objects are written once and referred to by the order they were first seen in
+        key = id(node)
+
+        if key in self.__visited:
+            self.__write("seen", self.__visited[key])
+            return
+
+        self.__visited[key] = len(self.__visited)
+        self.__keep.append(node)
+
+        if isinstance(node, Reference):
+            self.__write("Reference", node.is_left_recursive())
+            self.visit(node.get())
+        elif isinstance(node, Parser):
+            self.__write(type(node).__module__, type(node).__qualname__, node.get_kind())
+
+            if type(node) is FunctionParser:
+                self.visit(node._parse)
+
+            for arg in node.get_args():
+                self.visit(arg)
+
+            self.__write("children", len(node.get_children()))
+
+            for child in node.get_children():
+                self.visit(child)
+        else:
+            self.__value(node)
+
+    def __value(self, value: Any) -> None:
+        if isinstance(value, _SIMPLE_TYPES):
+            self.__write(value)
+        elif isinstance(value, Regex):
+            self.__write("Regex", value.get_pattern())
+            self.__regexes.setdefault(value.get_pattern(), value)
+        elif isinstance(value, (tuple, list, frozenset)):
+            self.__write(type(value).__name__, len(value))
+
+            for item in (sorted(value, key=repr) if isinstance(value, frozenset) else value):
+                self.visit(item)
+        elif dataclasses.is_dataclass(value) and not isinstance(value, type):
+            self.__write(type(value).__qualname__)
+
+            for field in dataclasses.fields(value):
+                self.visit(getattr(value, field.name))
+        elif isinstance(value, CodeType):
+            self.__write("code", value.co_code, value.co_names, len(value.co_consts))
+
+            for constant in value.co_consts:
+                self.visit(constant)
+        elif callable(value) and hasattr(value, "__code__"):
+            self.__write(getattr(value, "__module__", None), getattr(value, "__qualname__", None))
+            self.visit(value.__code__)
+
+            for cell in getattr(value, "__closure__", None) or ():
+                try:
+                    self.visit(cell.cell_contents)
+                except ValueError:
+                    self.__write("empty cell")
+        else:
+            # Only the type is stable across runs for arbitrary objects
+            self.__write(type(value).__module__, type(value).__qualname__)
+
+# A hash of the grammar's structure: combinator kinds, regex patterns, arguments and the code of the functions in it.
+# Objects it can't describe contribute only their type, so differing grammars can share a fingerprint, but only when
+# they differ in objects that compiled code takes from the grammar it is loaded for rather than from its source.
+def fingerprint(parser: Parser[Any]) -> str:
+    visitor = _Fingerprint()
+    visitor.visit(parser)
+    return visitor.get_digest()
+
+def _read(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "rb") as file:
+            cache = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError):
+        return {}
+
+    if not isinstance(cache, dict) or cache.get("tag") != _CACHE_TAG:
+        return {}
+
+    return cache.get("grammars", {})
+
+def _write(path: str, grammars: Dict[str, Any]) -> None:
+    # Written next to the cache and renamed over it, so concurrent readers never see a partial file
+    temporary = f"{path}.{os.getpid()}.tmp"
+
+    try:
+        with open(temporary, "wb") as file:
+            pickle.dump({"tag": _CACHE_TAG, "grammars": grammars}, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+
+        raise
+
+# Loads what a previous run derived from the same grammar out of the cache file at path: the analyses of its regexes,
+# which lexer dispatch tables and first sets are built from, and with compiled=True the code generated for it, which is
+# bound to this grammar's objects without generating it again. Whatever is missing is computed and written back to the
+# cache. Cache files are read with pickle.load, which can run arbitrary code, so only use a path in a trusted directory.
+def load(parser: Parser[T], path: str, compiled: bool = False) -> Parser[T]:
+    visitor = _Fingerprint()
+    visitor.visit(parser)
+    key = visitor.get_digest()
+
+    grammars = _read(path)
+    entry : Dict[str, Any] = grammars.get(key, {})
+    changed = len(entry) == 0
+    Regex.add_analyses({pattern: RegexAnalysis(*analysis) for pattern, analysis in entry.get("regexes", {}).items()})
+
+    if changed:
+        entry["regexes"] = {regex.get_pattern(): tuple(regex.get_analysis()) for regex in visitor.get_regexes()}
+
+    result : Parser[T] = parser
+
+    if compiled:
+        compiler = _Compiler()
+        stored : Optional[Tuple[Tuple[Any, ...], bytes]] = entry.get("compiled")
+
+        if stored is not None:
+            code = marshal.loads(stored[1])
+            compiler.restore(_Layout(*stored[0]), visitor.get_objects())
+        else:
+            code = _compile_source(compiler.generate(parser))
+            layout = compiler.get_layout(visitor.get_indices())
+
+            if layout is not None:
+                entry["compiled"], changed = (tuple(layout), marshal.dumps(code)), True
+
+        result = compiler.load(code)
+
+    if changed:
+        grammars[key] = entry
+        _write(path, grammars)
+
+    return result
@@ -0,0 +1,460 @@
+import builtins
+from types import CodeType
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, TypeVar, cast
+
+from pylpc.parsers import CallbackNode, CommitNode, CountNode, EOSNode, ErrorNode, FailureNode, FirstSuccessNode, LiteralsNode, LongestNode, MapNode, MaybeNode, MaybeValue, MemoNode, NamedNode, Reference, SatisfyNode, SeqNode, SuccessNode, TerminalNode, TryNode, TryValue, ValueNode
+from pylpc.parsers import _Alternatives, _furthest_failure, _needs_full_scan
+from pylpc.pylpc import LShiftNode, Location, ParseError, ParseFailure, ParseOutcome, ParseResult, Parser, RShiftNode, StringStream
+
+T = TypeVar('T')
+
+# Every generated function has this signature and returns the outcome together with the offset it ends at
+RuleFunction = Callable[[StringStream, str, str, int], Tuple[ParseOutcome[Any], int]]
+
+_ARGUMENTS = "stream, data, name, pos"
+
+_SEQUENCE_TYPES = (SeqNode, LShiftNode, RShiftNode)
+
+# Nodes whose code is a block that leaves the outcome in r and the offset in pos, so it can be pasted into its parent
+_INLINE_TYPES = (TerminalNode, LiteralsNode, ValueNode, EOSNode, ErrorNode, MapNode, MaybeNode, TryNode, CommitNode, NamedNode, SuccessNode, CallbackNode)
+
+# Nodes that need early returns, and so a function of their own
+_FUNCTION_TYPES = _SEQUENCE_TYPES + (CountNode, LongestNode, FirstSuccessNode, SatisfyNode, FailureNode, MemoNode)
+
+# How each object the generated code refers to is derived from a node of the grammar
+_RECIPES : Dict[str, Callable[[Any], Any]] = {
+    "node": lambda node: node,
+    "parse": lambda node: node._parse,
+    "arg": lambda node: node.get_args()[0],
+    "args": lambda node: node.get_args(),
+    "children": lambda node: node.get_children(),
+    "alternatives": lambda node: _Alternatives(node.get_children()),
+    "matcher": lambda node: node.get_args()[0]._get_matcher(),
+    "pattern": lambda node: (node.get_args()[0].get_pattern(),),
+    "value": lambda node: node.get_args()[1],
+    "match": lambda node: node._match,
+    "expected": lambda node: node._get_expected(),
+    "memo key": lambda node: id(node.get_children()[0]),
+}
+
+# Everything besides the code that loading it takes, with the grammar nodes the code refers to given by their index in
+# a traversal of the grammar that visits equal grammars in the same order
+class _Layout(NamedTuple):
+    source : str
+    root : Tuple[str, int]
+    constants : Tuple[Tuple[str, int, str], ...]
+    rules : Tuple[Tuple[str, int, str], ...]
+
+class CompiledParser(Parser[T]):
+    __slots__ = ("__parser", "__function", "__source")
+    _kind = "Compiled"
+
+    def __init__(self, parser: Parser[T], function: RuleFunction, source: str) -> None:
+        self.__parser : Parser[T] = parser
+        self.__function : RuleFunction = function
+        self.__source : str = source
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        data = stream._get_buffer()
+
+        if data is None:
+            return self.__parser._parse(stream)
+
+        # The generated code reads the data directly, so how far it looked isn't known
+        result, end = self.__function(stream, data, stream.get_name(), stream.get_offset())
+        stream.set_offset(end)
+        stream._look_at(len(data))
+        return result
+
+    def get_source(self) -> str:
+        return self.__source
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
+
+def _indent(lines: List[str], amount: int = 1) -> List[str]:
+    return ["    " * amount + line for line in lines]
+
+class _Compiler:
+    def __init__(self) -> None:
+        self.__namespace : Dict[str, Any] = {
+            "Location": Location, "ParseResult": ParseResult, "PF": ParseFailure, "ParseError": ParseError,
+            "MaybeValue": MaybeValue, "TryValue": TryValue, "furthest_failure": _furthest_failure, "needs_full_scan": _needs_full_scan,
+        }
+        self.__constants : Dict[int, str] = {}
+        self.__derivations : List[Tuple[str, Any, str]] = []
+        self.__functions : Dict[int, str] = {}
+        self.__definitions : List[str] = []
+        self.__pending : List[Tuple[str, Any]] = []
+        self.__rules : List[Tuple[str, Parser[Any], str]] = []
+        self.__counter : int = 0
+        self.__parser : Optional[Parser[Any]] = None
+        self.__root : str = ""
+        self.__source : str = ""
+
+    # Generates the source for the grammar and returns it, to be compiled and handed to load()
+    def generate(self, parser: Parser[T]) -> str:
+        self.__parser = parser
+        self.__root = self.__function(parser)
+
+        while len(self.__pending) != 0:
+            name, node = self.__pending.pop()
+            self.__definitions.append("\n".join(self.__define(name, node)))
+
+        self.__source = "\n\n".join(self.__definitions) + "\n"
+        return self.__source
+
+    # The layout of the generated code, with the index of each node given by indices, or None if a node has none
+    def get_layout(self, indices: Dict[int, int]) -> Optional[_Layout]:
+        nodes = [self.__parser] + [node for _, node, _ in self.__derivations] + [target for _, target, _ in self.__rules]
+
+        if any(id(node) not in indices for node in nodes):
+            return None
+
+        constants = tuple((name, indices[id(node)], recipe) for name, node, recipe in self.__derivations)
+        rules = tuple((rule, indices[id(target)], body) for rule, target, body in self.__rules)
+        return _Layout(self.__source, (self.__root, indices[id(self.__parser)]), constants, rules)
+
+    # Prepares to load code generated for an equal grammar, instead of generating it, given this grammar's nodes in the
+    # order the layout's indices refer to
+    def restore(self, layout: _Layout, nodes: Sequence[Any]) -> None:
+        self.__source, (self.__root, root) = layout.source, layout.root
+        self.__parser = nodes[root]
+        self.__rules = [(rule, nodes[target], body) for rule, target, body in layout.rules]
+
+        for name, node, recipe in layout.constants:
+            self.__namespace[name] = _RECIPES[recipe](nodes[node])
+
+    def load(self, code: CodeType) -> CompiledParser[Any]:
+        exec(code, self.__namespace)
+
+        for name, target, body in self.__rules:
+            self.__namespace[name] = CompiledParser(target, self.__namespace[body], self.__source)
+
+        return CompiledParser(cast(Parser[Any], self.__parser), self.__namespace[self.__root], self.__source)
+
+    def __name(self, prefix: str) -> str:
+        self.__counter += 1
+        return f"{prefix}{self.__counter}"
+
+    def __constant(self, node: Any, recipe: str = "node") -> str:
+        value = _RECIPES[recipe](node)
+        key = id(value)
+
+        if key not in self.__constants:
+            self.__constants[key] = self.__name("c")
+            self.__namespace[self.__constants[key]] = value
+            self.__derivations.append((self.__constants[key], node, recipe))
+
+        return self.__constants[key]
+
+    def __location(self, offset: str = "pos") -> str:
+        return f"Location(name, None, stream, {offset})"
+
+    # Parsers made from functions, lexers and anything else the compiler doesn't know run as they are, at the same offset
+    def __opaque(self, node: Any) -> List[str]:
+        return [f"stream.set_offset(pos); r = {self.__constant(node, 'parse')}(stream); pos = stream.get_offset()"]
+
+    def __target(self, node: Any) -> Any:
+        # Parser(...) around another parser or a Reference only forwards to it
+        while type(node) is Parser and len(node.get_children()) != 0:
+            node = node.get_children()[0]
+
+        return node
+
+    def __function(self, node: Any) -> str:
+        node = self.__target(node)
+        key = id(node)
+
+        if key not in self.__functions:
+            self.__functions[key] = self.__name("n")
+            self.__constant(node) # Keeps the node alive so its id can't be reused while compiling
+            self.__pending.append((self.__functions[key], node))
+
+        return self.__functions[key]
+
+    def __call(self, node: Any) -> List[str]:
+        return [f"r, pos = {self.__function(node)}({_ARGUMENTS})"]
+
+    def __block(self, node: Any) -> List[str]:
+        node = self.__target(node)
+
+        if isinstance(node, Reference):
+            return self.__call(node) if node.get() is not None else self.__opaque(node)
+        elif type(node) in _INLINE_TYPES:
+            return self.__inline(node)
+        elif type(node) in _FUNCTION_TYPES:
+            return self.__call(node)
+
+        return self.__opaque(node)
+
+    def __define(self, name: str, node: Any) -> List[str]:
+        header = f"def {name}({_ARGUMENTS}):"
+
+        if isinstance(node, Reference):
+            target = node.get()
+
+            if target is None:
+                return [header] + _indent(self.__opaque(node) + ["return r, pos"])
+            elif node.is_left_recursive():
+                # The reference still grows the rule, with the compiled body once the source is loaded. Its seeds are
+                # shared with any parser the compiler can't see into that reaches the same rule.
+                rule, body = self.__name("c"), self.__name("n")
+                self.__rules.append((rule, target, body))
+                call = f"stream.set_offset(pos); r = {self.__constant(node)}._grow(stream, {rule}); return r, stream.get_offset()"
+                return [header, "    " + call, "", f"def {body}({_ARGUMENTS}):"] + _indent(self.__block(target) + ["return r, pos"])
+
+            return [header] + _indent(self.__block(target) + ["return r, pos"])
+        elif type(node) in _SEQUENCE_TYPES:
+            lines : List[str] = []
+            value = self.__sequence(node, lines, None)
+            return [header] + _indent(lines + [f"return {value}, pos"])
+        elif type(node) is CountNode:
+            return [header] + _indent(self.__count(node))
+        elif type(node) is LongestNode:
+            return [header] + _indent(self.__longest(node))
+        elif type(node) is FirstSuccessNode:
+            return [header] + _indent(self.__first_success(node))
+        elif type(node) is SatisfyNode:
+            return [header] + _indent(self.__satisfy(node))
+        elif type(node) is FailureNode:
+            return [header] + _indent(self.__failure(node))
+        elif type(node) is MemoNode:
+            return [header] + _indent(self.__memo(node))
+
+        return [header] + _indent(self.__block(node) + ["return r, pos"])
+
+    def __inline(self, node: Any) -> List[str]:
+        children, args = node.get_children(), node.get_args()
+
+        if isinstance(node, TerminalNode):
+            lines = [
+                f"m = {self.__constant(node, 'matcher')}(data, pos)",
+                "if m is None:",
+                f"    r = PF({self.__location()}, 'No match found for regular expression: {{}}', {self.__constant(node, 'pattern')})",
+            ]
+
+            if args[1] is None:
+                return lines + ["else:", f"    s = m[0]; r = ParseResult({self.__location()}, s); pos += len(s)"]
+
+            return lines + [
+                f"elif m[0] != {self.__constant(node, 'value')}:",
+                f"    r = PF({self.__location()}, \"Expected '{{}}', but found '{{}}'\", ({self.__constant(node, 'value')}, m[0]))",
+                "else:",
+                f"    s = m[0]; r = ParseResult({self.__location()}, s); pos += len(s)",
+            ]
+        elif isinstance(node, LiteralsNode):
+            return [
+                f"n = {self.__constant(node, 'match')}(data, pos)",
+                "if n < 0:",
+                f"    r = PF({self.__location()}, \"Expected one of {{}}, but found '{{}}'\", ({self.__constant(node, 'expected')}, data[pos:pos + 1]))",
+                "else:",
+                f"    r = ParseResult({self.__location()}, data[pos:pos + n]); pos += n",
+            ]
+        elif isinstance(node, ValueNode):
+            return [f"r = ParseResult({self.__location()}, {self.__constant(node, 'arg')})"]
+        elif isinstance(node, EOSNode):
+            return [
+                "if pos < len(data):",
+                f"    r = PF({self.__location()}, \"Expected EOS, but found '{{}}'\", (data[pos],))",
+                "else:",
+                f"    r = ParseResult({self.__location()}, None)",
+            ]
+        elif isinstance(node, ErrorNode):
+            return [f"r = PF({self.__location()}, {self.__constant(node, 'arg')})"]
+        elif isinstance(node, CommitNode):
+            start = self.__name("s")
+            return [
+                f"{start} = pos",
+                *self.__block(children[0]),
+                "if r.__class__ is PF:",
+                "    if not r.committed: r = r.commit()",
+                "else:",
+                f"    stream.commit({start})",
+            ]
+        elif isinstance(node, TryNode):
+            commits = self.__name("c")
+            return [
+                f"{commits} = stream._get_commits()",
+                *self.__block(children[0]),
+                "if r.__class__ is PF:",
+                f"    stream._set_commits({commits})",
+                "    r = ParseResult(r.location, TryValue.CreateError(r.to_error()))",
+                "else:",
+                "    r = ParseResult(r.location, TryValue.CreateSuccess(r.value))",
+            ]
+
+        lines = self.__block(children[0])
+
+        if isinstance(node, MaybeNode):
+            return lines + [
+                "if r.__class__ is PF:",
+                "    if not r.committed: r = ParseResult(r.location, MaybeValue.CreateNone())",
+                "else:",
+                "    r = ParseResult(r.location, MaybeValue.CreateSome(r.value))",
+            ]
+        elif isinstance(node, NamedNode):
+            return lines + ["if r.__class__ is PF:", f"    r = PF.combine(PF(r.location, 'Unable to parse {{}}', {self.__constant(node, 'args')}), r)"]
+        elif isinstance(node, SuccessNode):
+            return lines + ["if r.__class__ is PF and not r.committed:", f"    r = ParseResult({self.__location()}, {self.__constant(node, 'arg')})"]
+
+        # Map and Callback: a function raising ParseError fails the node, leaving the offset where it started
+        start = self.__name("s")
+        call = f"r = ParseResult(r.location, {self.__constant(node, 'arg')}(r))" if isinstance(node, MapNode) else f"{self.__constant(node, 'arg')}(r)"
+        return [f"{start} = pos", *lines, "if r.__class__ is not PF:", "    try:", f"        {call}", "    except ParseError as e:", f"        r = PF.from_error(e); pos = {start}"]
+
+    # Nested Seq, << and >> run in one function. A failure leaves the offset where the outermost enclosing node that
+    # resets on it started, or where the failing step left it if there is none, exactly as the nodes would one by one.
+    def __sequence(self, node: Any, lines: List[str], reset: Optional[str]) -> str:
+        children = node.get_children()
+        start = self.__name("s")
+        lines.append(f"{start} = pos")
+
+        if isinstance(node, SeqNode):
+            values = [self.__step(child, lines, reset or start) for child in children]
+
+            if len(values) == 0:
+                return f"ParseResult({self.__location(start)}, ())"
+
+            return f"ParseResult({values[0]}.location, ({', '.join(values)},))"
+        elif isinstance(node, LShiftNode):
+            kept = self.__step(children[0], lines, reset)
+            self.__step(children[1], lines, reset or start)
+            return kept
+
+        self.__step(children[0], lines, reset)
+        return self.__step(children[1], lines, reset or start)
+
+    def __step(self, node: Any, lines: List[str], reset: Optional[str]) -> str:
+        node = self.__target(node)
+
+        if type(node) in _SEQUENCE_TYPES:
+            return self.__sequence(node, lines, reset)
+
+        result = self.__name("r")
+        lines.extend(self.__block(node))
+        lines.append(f"if r.__class__ is PF: return r, {reset or 'pos'}")
+        lines.append(f"{result} = r")
+        return result
+
+    def __count(self, node: CountNode) -> List[str]:
+        min, max = node.get_args()
+        loop = "while True:" if max is None else f"while len(results) < {max}:"
+        failed = ["if r.committed: return r, start"] + (["break"] if min == 0 else [
+            f"if len(results) >= {min}: break",
+            f"return PF.combine(r, PF({self.__location()}, 'Expected at least {{}}, but found only {{}}', ({min}, len(results)))), start",
+        ])
+
+        return [
+            "start = pos",
+            "results = []",
+            loop,
+            *_indent(self.__block(node.get_children()[0])),
+            "    if r.__class__ is PF:",
+            *_indent(failed, 2),
+            "    results.append(r)",
+            f"return ParseResult({self.__location('start')} if len(results) == 0 else results[0].location, results), pos",
+        ]
+
+    def __alternatives(self, node: Any) -> Tuple[str, str, str]:
+        children = node.get_children()
+        functions = "(" + "".join(f"{self.__function(child)}, " for child in children) + ")"
+        return self.__constant(node, "alternatives"), self.__constant(node, "children"), functions
+
+    def __longest(self, node: LongestNode) -> List[str]:
+        alternatives, parsers, functions = self.__alternatives(node)
+        attempt = [
+            "commits = stream._get_commits()[0]",
+            f"r, pos = {functions}[i]({_ARGUMENTS.replace('pos', 'start')})",
+            "if r.__class__ is not PF:",
+            "    if stream._get_commits()[0] != commits:",
+            "        return r, pos",
+            "    if result is None or pos - start > greatest_length:",
+            "        result, greatest_length = r, pos - start",
+            "elif r.committed:",
+            "    return r, start",
+            "elif result is None:",
+            "    failures[i] = r",
+        ]
+
+        return [
+            "start, greatest_length, result, failures = pos, 0, None, {}",
+            "stream.set_offset(start)",
+            f"for i in {alternatives}.get_viable(stream):",
+            *_indent(attempt),
+            f"if result is None and needs_full_scan(stream, start, {parsers}, failures):",
+            f"    for i in range({len(node.get_children())}):",
+            "        if i not in failures:",
+            *_indent(attempt, 3),
+            "if result is None:",
+            "    return furthest_failure(stream, start, [failures[i] for i in sorted(failures)]), start",
+            "return result, start + greatest_length",
+        ]
+
+    def __first_success(self, node: FirstSuccessNode) -> List[str]:
+        alternatives, parsers, functions = self.__alternatives(node)
+        attempt = [
+            f"r, pos = {functions}[i]({_ARGUMENTS})",
+            "if r.__class__ is not PF or r.committed: return r, pos",
+            "failures[i] = r",
+        ]
+
+        return [
+            "start, failures = pos, {}",
+            "stream.set_offset(start)",
+            f"for i in {alternatives}.get_viable(stream):",
+            *_indent(attempt),
+            f"if needs_full_scan(stream, start, {parsers}, failures):",
+            f"    for i in range({len(node.get_children())}):",
+            "        if i not in failures:",
+            *_indent(attempt, 3),
+            "return furthest_failure(stream, start, [failures[i] for i in sorted(failures)]), pos",
+        ]
+
+    def __satisfy(self, node: SatisfyNode) -> List[str]:
+        return [
+            "start = pos",
+            *self.__block(node.get_children()[0]),
+            "if r.__class__ is PF: return r, pos",
+            "try:",
+            f"    if {self.__constant(node, 'arg')}(r): return r, pos",
+            "except ParseError as e:",
+            "    return PF.from_error(e), start",
+            "return PF(r.location, 'Predicate not satisfied!'), start",
+        ]
+
+    def __failure(self, node: FailureNode) -> List[str]:
+        return [
+            "start, commits = pos, stream._get_commits()",
+            *self.__block(node.get_children()[0]),
+            "stream._set_commits(commits)",
+            f"if r.__class__ is not PF: return PF({self.__location('start')}, 'Unexpected Success'), start",
+            f"return ParseResult({self.__location()}, r.to_error()), pos",
+        ]
+
+    def __memo(self, node: MemoNode) -> List[str]:
+        # The key is the same one the interpreted Memo uses, but kept out of the source so the source is reproducible
+        key = self.__constant(node, "memo key")
+        return [
+            "table = stream.get_memo_table()",
+            f"entry = table.get({key}, pos)",
+            "if entry is not None: return entry",
+            "start, commits = pos, stream._get_commits()[0]",
+            *self.__block(node.get_children()[0]),
+            f"if stream._get_commits()[0] == commits: table.set({key}, start, (r, pos))",
+            "return r, pos",
+        ]
+
+# Generates Python source for the grammar, one function per rule with terminals matched and offsets tracked inline, and
+# loads it with exec. The compiled parser gives the same results and failures as the original one. References are
+# resolved when compiling, and streams that don't keep their input in memory are parsed by the original parser.
+def compile(parser: Parser[T]) -> Parser[T]:
+    compiler = _Compiler()
+    source = compiler.generate(parser)
+    return compiler.load(_compile_source(source))
+
+def _compile_source(source: str) -> CodeType:
+    return builtins.compile(source, "<pylpc compiled grammar>", "exec")
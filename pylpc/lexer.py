@@ -1,7 +1,11 @@
+from array import array
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
-from typing import List, Optional, OrderedDict
-from pylpc.parsers import Char, Longest, Map, Satisfy, Terminal
-from pylpc.pylpc import ParseError, ParseResult, Parser, Location, Regex, StringStream
+import multiprocessing
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, NamedTuple, Optional, OrderedDict, Sequence, Tuple, Union, cast
+from pylpc.batch import _get_workers
+from pylpc.parsers import Char, LiteralEntry, Longest, Map, Terminal, _build_literal_table
+from pylpc.pylpc import EOF, FirstSet, ParseFailure, ParseOutcome, ParseResult, Parser, Location, Position, Regex, RegexMatch, StringStream, char
 
 def EOS_PATTERN_ID():
     return "<EOS>"
@@ -19,16 +23,388 @@ class Token:
     id : str
     text : str
 
-def Lexer(patterns: List[Pattern]) -> Parser[Token]:
+def _get_pattern_ids(patterns: List[Pattern]) -> List[str]:
+    ids = [EOS_PATTERN_ID()]
+
+    for pattern in patterns:
+        if pattern.id in ids or pattern.id == UNKNOWN_PATTERN_ID():
+            raise ValueError(f"Pattern already exists with id: {pattern.id}")
+
+        ids.append(pattern.id)
+
+    ids.append(UNKNOWN_PATTERN_ID())
+    return ids
+
+class TokenInfo(NamedTuple):
+    id : str
+    text : str
+    offset : int
+
+# Finds the pattern index and length of the token at the stream's offset without moving the stream
+Scanner = Callable[[StringStream], Tuple[int, int]]
+
+class LexerParser(Parser[Token]):
+    __slots__ = ("__pattern_ids", "__scan", "__patterns")
+    _kind = "Lexer"
+
+    def __init__(self, pattern_ids: List[str], scan: Scanner, patterns: Sequence[Pattern] = ()) -> None:
+        def function(stream: StringStream) -> ParseOutcome[Token]:
+            if isinstance(stream, TokenStream):
+                return stream._next_token(self)
+
+            token = stream.get_token()
+
+            if token is None:
+                token = stream._lex_token(scan)
+                stream.ignore(len(token.value))
+
+            return ParseResult(token.location, Token(pattern_ids[token.id], token.value))
+
+        self._parse = function
+        self.__pattern_ids : List[str] = pattern_ids
+        self.__scan : Scanner = scan
+        self.__patterns : Tuple[Pattern, ...] = tuple(patterns)
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return None
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return ()
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__patterns,)
+
+    # Lexers are compared by identity: lexemes of different lexers never match each other's tokens
+    def __eq__(self, other: object) -> bool:
+        return self is other
+
+    __hash__ = object.__hash__
+
+    def get_pattern_ids(self) -> List[str]:
+        return self.__pattern_ids
+
+    def _get_scanner(self) -> Scanner:
+        return self.__scan
+
+    # The id of the token at the stream's offset, without moving the stream
+    def _peek_id(self, stream: StringStream) -> str:
+        if isinstance(stream, TokenStream) and stream.get_lexer() is self:
+            return self.__pattern_ids[stream.get_ids()[stream.get_offset()]]
+
+        token = stream.peek_token()
+
+        if token is None:
+            token = stream._lex_token(self.__scan)
+
+        return self.__pattern_ids[token.id]
+
+    # Yields every token up to and including EOS without going through the stream's token cache
+    def tokenize(self, input: Union[StringStream, str]) -> Iterator[TokenInfo]:
+        stream = input if isinstance(input, StringStream) else StringStream(input)
+        pattern_ids, scan = self.__pattern_ids, self.__scan
+
+        while True:
+            offset = stream.get_offset()
+            idx, length = scan(stream)
+            text = stream.get_data(offset, length)
+            stream.ignore(length)
+
+            yield TokenInfo(pattern_ids[idx], text, offset)
+
+            if idx == 0:
+                return
+
+    # Like tokenize, but splits the input after newlines into about chunk_size characters per chunk and lexes the chunks
+    # in a pool of worker processes, each of which rebuilds the lexer from its patterns. Each chunk is sent with the
+    # _LEX_OVERLAP characters after it, and the workers send back the pattern indices and offsets of the tokens as
+    # arrays, which are joined here without making an object per token until they are yielded. A chunk is lexed as if a
+    # token started where it does, so where the sequential lexer wouldn't have had a token boundary there, such as
+    # inside a multi-line comment, the tokens are lexed again in this process until they line up with the chunk's. So
+    # are the tokens whose patterns may have looked past the text the worker had.
+    # Lexes sequentially when there is only one worker, the input has no newlines to split at, the stream has no
+    # in-memory buffer, or chunk_size isn't given and the input is shorter than _MIN_PARALLEL_LEX_SIZE.
+    def tokenize_parallel(self, input: Union[StringStream, str], workers: Optional[int] = None, chunk_size: Optional[int] = None) -> Iterator[TokenInfo]:
+        stream = input if isinstance(input, StringStream) else StringStream(input)
+        tokens = self._lex_parallel(stream, workers, chunk_size)
+
+        if tokens is None:
+            return self.tokenize(stream)
+
+        return self.__get_token_infos(cast(str, stream._get_buffer()), *tokens)
+
+    def __get_token_infos(self, data: str, ids: array, starts: array) -> Iterator[TokenInfo]:
+        pattern_ids = self.__pattern_ids
+
+        for i in range(len(ids) - 1):
+            yield TokenInfo(pattern_ids[ids[i]], data[starts[i]:starts[i + 1]], starts[i])
+
+        yield TokenInfo(pattern_ids[0], "", starts[-1])
+
+    # The pattern indices and offsets of the tokens from the stream's offset on, ending with EOS, lexed as
+    # tokenize_parallel does, or None if they should be lexed sequentially. Leaves the stream at its end.
+    def _lex_parallel(self, stream: StringStream, workers: Optional[int], chunk_size: Optional[int]) -> Optional[Tuple[array, array]]:
+        data = stream._get_buffer()
+        count = _get_workers(workers)
+
+        if chunk_size is not None and chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+
+        if data is None or count <= 1 or len(self.__patterns) + 2 != len(self.__pattern_ids):
+            return None
+
+        start = stream.get_offset()
+
+        if chunk_size is None and len(data) - start < _MIN_PARALLEL_LEX_SIZE:
+            return None
+
+        splits = _get_split_points(data, start, chunk_size or max(1 << 16, (len(data) - start) // (count * 4)))
+
+        if len(splits) == 2:
+            return None
+
+        return self.__stitch(stream, data, splits, count)
+
+    def __stitch(self, stream: StringStream, data: str, splits: List[int], count: int) -> Tuple[array, array]:
+        scan = self.__scan
+        ids, starts = array('l'), array('q')
+        chunks = ((data[splits[i]:splits[i + 1] + _LEX_OVERLAP], splits[i], splits[i + 1], splits[i + 1] + _LEX_OVERLAP >= len(data)) for i in range(len(splits) - 1))
+
+        with multiprocessing.Pool(min(count, len(splits) - 1), _init_lex_worker, (self.__patterns,)) as pool:
+            # The sequential lexer's position: every token before it has been added
+            offset = splits[0]
+
+            for chunk_ids, chunk_starts, unsure, end in pool.imap(_lex_chunk, chunks):
+                idx, next_unsure = bisect_left(chunk_starts, offset), 0
+
+                while offset < end:
+                    # From a token the chunk also starts at, its tokens are the sequential lexer's up to one it can't tell
+                    if idx < len(chunk_starts) and chunk_starts[idx] == offset:
+                        next_unsure = bisect_left(unsure, idx, next_unsure)
+                        stop = unsure[next_unsure] if next_unsure < len(unsure) else len(chunk_starts)
+
+                        if stop > idx:
+                            ids.extend(chunk_ids[idx:stop])
+                            starts.extend(chunk_starts[idx:stop])
+                            idx, offset = stop, chunk_starts[stop] if stop < len(chunk_starts) else end
+                            continue
+
+                    stream.set_offset(offset)
+                    token_idx, length = scan(stream)
+                    ids.append(token_idx)
+                    starts.append(offset)
+                    offset += length
+                    idx = bisect_left(chunk_starts, offset, idx)
+
+        ids.append(0)
+        starts.append(offset)
+        stream.set_offset(offset)
+        return ids, starts
+
+# The offsets that split data from start on into chunks of about chunk_size characters, each but the last ending just
+# after a newline, including start and the end of data
+def _get_split_points(data: str, start: int, chunk_size: int) -> List[int]:
+    splits = [start]
+
+    while True:
+        split = data.find("\n", splits[-1] + chunk_size - 1) + 1
+
+        if split == 0 or split >= len(data):
+            break
+
+        splits.append(split)
+
+    splits.append(len(data))
+    return splits
+
+# How many characters after its chunk each worker of LexerParser.tokenize_parallel is sent, so that the tokens near the
+# end of the chunk can be lexed there
+_LEX_OVERLAP = 1 << 12
+
+# Where worker processes are spawned instead of forked, starting them takes a few hundred milliseconds, which is about
+# what two workers save on an input of this many characters, so shorter inputs are lexed sequentially
+_MIN_PARALLEL_LEX_SIZE = 1 << 20
+
+# The lexer of each worker process of LexerParser.tokenize_parallel
+_worker_scan : Optional[Scanner] = None
+
+def _init_lex_worker(patterns: Tuple[Pattern, ...]) -> None:
+    global _worker_scan
+    _worker_scan = CompiledLexer(list(patterns))._get_scanner()
+
+# Lexes the tokens starting in [start, end) of the text, which starts at start, and returns their pattern indices, their
+# offsets, the indices of the tokens whose patterns may have looked past the text, unless the text goes to the end of
+# the input, and the offset after the last token, which can be past end
+def _lex_chunk(chunk: Tuple[str, int, int, bool]) -> Tuple[array, array, array, int]:
+    text, start, end, complete = chunk
+    scan, stream = cast(Scanner, _worker_scan), StringStream(text)
+    ids, starts, unsure = array('l'), array('q'), array('l')
+    offset = 0
+
+    while offset < end - start:
+        saved = stream._start_reach()
+        idx, length = scan(stream)
+
+        if stream._get_reach_since(saved) >= len(text) and not complete:
+            unsure.append(len(ids))
+
+        ids.append(idx)
+        starts.append(start + offset)
+        offset += length
+        stream.set_offset(offset)
+
+    return ids, starts, unsure, start + offset
+
+# A stream over the tokens of one lexing pass, kept as parallel arrays of pattern indices and start offsets; a token's
+# length is the distance to the next start, and the last entry is the EOS token at the end of the input. The stream's
+# offsets are token indices, while its locations resolve to where the tokens start in the input. Lexemes of the lexer
+# that made it compare pattern indices instead of lexing again, and that lexer reads the tokens as they are. Parsers that
+# match characters can't read it, and compiled parsers parse it with the parsers they were compiled from.
+# With more than one worker, large inputs are lexed in worker processes as LexerParser.tokenize_parallel does, and the
+# arrays they send back become the stream's.
+class TokenStream(StringStream):
+    def __init__(self, lexer: LexerParser, input: Union[StringStream, str], name: Optional[str] = None, workers: Optional[int] = 1) -> None:
+        source = input if isinstance(input, StringStream) else StringStream(input, name)
+        super().__init__("", source.get_name() if name is None else name)
+
+        self.__lexer : LexerParser = lexer
+        self.__source : StringStream = source
+        self.__data : Optional[str] = source._get_buffer()
+        self.__ids : array = array('l')
+        self.__starts : array = array('q')
+        self.__mismatch : Optional[Tuple[int, Location, str]] = None
+
+        tokens = lexer._lex_parallel(source, workers, None)
+
+        if tokens is not None:
+            self.__ids, self.__starts = tokens
+            self._set_length(len(self.__ids) - 1)
+            return
+
+        scan, ids, starts = lexer._get_scanner(), self.__ids, self.__starts
+        offset = source.get_offset()
+
+        while True:
+            idx, length = scan(source)
+            ids.append(idx)
+            starts.append(offset)
+
+            if idx == 0:
+                break
+
+            offset += length
+            source.set_offset(offset)
+
+        self._set_length(len(ids) - 1)
+
+    def get_lexer(self) -> LexerParser:
+        return self.__lexer
+
+    def get_source(self) -> StringStream:
+        return self.__source
+
+    def get_ids(self) -> array:
+        return self.__ids
+
+    def get_starts(self) -> array:
+        return self.__starts
+
+    def __get_text(self, index: int) -> str:
+        start, end = self.__starts[index], self.__starts[index + 1] if index < len(self.__ids) - 1 else self.__starts[index]
+
+        if self.__data is not None:
+            return self.__data[start:end]
+
+        return self.__source.get_data(start, end - start)
+
+    def _next_token(self, lexer: LexerParser) -> ParseOutcome[Token]:
+        if lexer is not self.__lexer:
+            raise Exception("A TokenStream can only be read by the lexer that made it")
+
+        index = self.get_offset()
+        idx = self.__ids[index]
+
+        if idx != 0:
+            self.set_offset(index + 1)
+
+        return ParseResult(self.get_location(index), Token(lexer.get_pattern_ids()[idx], self.__get_text(index)))
+
+    def _match_lexeme(self, idx: int, value: Optional[str], expected: str) -> ParseOutcome[str]:
+        index = self.get_offset()
+
+        if self.__ids[index] == idx:
+            text = self.__get_text(index)
+
+            if value is None or text == value:
+                if idx != 0:
+                    self.set_offset(index + 1)
+
+                return ParseResult(self.get_location(index), text)
+
+        # Alternatives mostly fail on the same token one after another, so what they report about it is kept
+        if self.__mismatch is None or self.__mismatch[0] != index:
+            id, text = self.__lexer.get_pattern_ids()[self.__ids[index]], self.__get_text(index)
+            self.__mismatch = (index, self.get_location(index), id if len(text) == 0 else f"{id}({text})")
+
+        return ParseFailure(self.__mismatch[1], "Expected {}, but found '{}'", (expected, self.__mismatch[2]))
+
+    # Reading the stream reads whole tokens
+    def get(self) -> char:
+        if self.is_eos():
+            return EOF
+
+        index = self.get_offset()
+        self.set_offset(index + 1)
+        return self.__get_text(index)
+
+    def peek(self) -> char:
+        return EOF if self.is_eos() else self.__get_text(self.get_offset())
+
+    def match(self, regex: Regex) -> Optional[RegexMatch]:
+        raise Exception("A TokenStream can only be parsed with its lexer and lexemes")
+
+    # Its data is tokens, so parsers that compare characters, like Literals, can't read it either
+    def _read_chars(self, offset: int, length: int) -> str:
+        raise Exception("A TokenStream can only be parsed with its lexer and lexemes")
+
+    def _get_buffer(self) -> Optional[str]:
+        return None
+
+    def edit(self, offset: int, deleted: int, inserted: str) -> None:
+        raise Exception("A TokenStream can't be edited")
+
+    def get_data(self, start: int = 0, length: Optional[int] = None) -> str:
+        assert start >= 0 and (length is None or length >= 0)
+
+        if length is None:
+            length = self.get_length() - start
+
+        if start + length > self.get_length():
+            raise Exception("Parameters out of range of data!")
+
+        return self.__source.get_data(self.__starts[start], self.__starts[start + length] - self.__starts[start])
+
+    # The token that the position is in
+    def get_offset_from_pos(self, pos: Position) -> int:
+        return max(0, bisect_right(self.__starts, self.__source.get_offset_from_pos(pos)) - 1)
+
+    def get_position_from_offset(self, offset: int) -> Position:
+        assert offset >= 0
+
+        if offset > self.get_length():
+            raise Exception("Offset is out of range of data!")
+
+        return self.__source.get_position_from_offset(self.__starts[offset])
+
+def Lexer(patterns: List[Pattern]) -> LexerParser:
     parsers = OrderedDict[str, Parser[Token]]()
     
-    def eos_function(loc: Location, stream: StringStream) -> ParseResult[Token]:
+    def eos_function(stream: StringStream) -> ParseOutcome[Token]:
         if stream.is_eos():
-            return ParseResult(loc, Token(EOS_PATTERN_ID(), ""))
+            return ParseResult(stream.get_location(), Token(EOS_PATTERN_ID(), ""))
 
-        raise ParseError.expectation(f"'{EOS_PATTERN_ID()}'", f"'{stream.peek()}'", loc)
+        return ParseFailure(stream.get_location(), "Expected '{}', but found '{}'", (EOS_PATTERN_ID(), stream.peek()))
 
-    parsers[EOS_PATTERN_ID()] = Parser(eos_function)
+    parsers[EOS_PATTERN_ID()] = Parser.create(eos_function)
 
     for pattern in patterns:
         if pattern.id in parsers:
@@ -42,30 +418,132 @@ def Lexer(patterns: List[Pattern]) -> Parser[Token]:
     parsers[UNKNOWN_PATTERN_ID()] = Map(Char(), lambda result: Token(UNKNOWN_PATTERN_ID(), result.value)) 
 
     longest = Longest(list(parsers.values()))
-    pattern_ids = {idx: id for idx, id in enumerate(parsers)}
-    token_idxs = {id: idx for idx, id in pattern_ids.items()}
+    token_idxs = {id: idx for idx, id in enumerate(parsers)}
 
-    def function(loc: Location, stream: StringStream) -> ParseResult[Token]:
-        token = stream.get_token()
-            
-        if token is None:
-            result = longest.parse(stream)
-            token = stream.set_token(result.location.position, len(result.value.text), token_idxs[result.value.id])
-        
-        return ParseResult(token.location, Token(pattern_ids[token.id], token.value))
+    def scan(stream: StringStream) -> Tuple[int, int]:
+        offset = stream.get_offset()
+        result = cast(ParseResult[Token], longest._parse(stream))
+        stream.set_offset(offset)
 
-    return Parser(function)
+        return token_idxs[result.value.id], len(result.value.text)
 
-def Lexeme(lexer: Parser[Token], id: str, value: Optional[str] = None) -> Parser[str]:
-    def predicate(result: ParseResult[Token]) -> bool:
-        if result.value.id != id or (value is not None and result.value.text != value):
-            expected =  "'" + id + ("" if value is None or len(value) == 0 else f"({value})") + "'"
-            found =  "'" + result.value.id + ("" if len(result.value.text) == 0 else f"({result.value.text})") + "'"
-            raise ParseError.expectation(expected, found, result.location)
+    return LexerParser(list(parsers), scan, patterns)
+
+ScanCandidates = Tuple[Tuple[int, Regex], ...]
+
+# Maps each character to the patterns whose matches can start with it, in declaration order, and to a table of the
+# literal patterns among them, like keywords and operators, which are looked up instead of matched. Patterns whose first
+# characters can't be determined are candidates for every character.
+def _build_dispatch_table(patterns: List[Pattern]) -> Tuple[Dict[char, Tuple[ScanCandidates, LiteralEntry[int]]], ScanCandidates]:
+    literals = [pattern.regex.get_literal() for pattern in patterns]
+    first_chars = [pattern.regex.get_first_chars() for pattern in patterns]
+    table_chars = set(c for chars in first_chars if chars is not None for c in chars)
+    fallback = tuple((idx + 1, pattern.regex) for idx, pattern in enumerate(patterns) if first_chars[idx] is None)
+    literal_table = _build_literal_table([(literal, idx + 1) for idx, literal in enumerate(literals) if literal is not None])
+    table : Dict[char, Tuple[ScanCandidates, LiteralEntry[int]]] = {}
+
+    for c in table_chars:
+        candidates = tuple((idx + 1, pattern.regex) for idx, pattern in enumerate(patterns) if literals[idx] is None and (first_chars[idx] is None or c in cast(FrozenSet[str], first_chars[idx])))
+        table[c] = (candidates, literal_table.get(c, ()))
+
+    return table, fallback
+
+def CompiledLexer(patterns: List[Pattern]) -> LexerParser:
+    pattern_ids = _get_pattern_ids(patterns)
+    unknown_idx = len(pattern_ids) - 1
+    table : Optional[Dict[char, Tuple[ScanCandidates, LiteralEntry[int]]]] = None
+    fallback : Tuple[ScanCandidates, LiteralEntry[int]] = ((), ())
+
+    # Same result as the Longest in Lexer: the longest non-empty match wins and ties go to the pattern declared first.
+    # EOS only applies at the end of the stream and UNKNOWN consumes one character when nothing else matched.
+    # The dispatch table is built on the first scan, so creating the lexer doesn't analyze its patterns.
+    def scan(stream: StringStream) -> Tuple[int, int]:
+        nonlocal table, fallback
+
+        if stream.is_eos():
+            return 0, 0
+
+        if table is None:
+            table, fallback_candidates = _build_dispatch_table(patterns)
+            fallback = (fallback_candidates, ())
+
+        best_idx, best_length = unknown_idx, 0
+        candidates, literals = table.get(stream.peek(), fallback)
+
+        for idx, regex in candidates:
+            regex_match = stream.match(regex)
+
+            if regex_match is not None and len(regex_match[0]) > best_length:
+                best_idx, best_length = idx, len(regex_match[0])
+
+        # Only literals at least as long as the longest regex match can win, the same length only if declared earlier
+        if len(literals) != 0:
+            data, offset = stream._get_buffer(), stream.get_offset()
+            stream._look_at(offset + literals[0][0])
+
+            for length, values in literals:
+                if length < best_length:
+                    break
+
+                literal_idx = values.get(data[offset:offset + length] if data is not None else stream._read_chars(offset, length))
+
+                if literal_idx is not None:
+                    if length > best_length or literal_idx < best_idx:
+                        best_idx, best_length = literal_idx, length
 
-        return True
+                    break
 
-    return Map(Satisfy(lexer, predicate), lambda result: result.value.text)
+        return (best_idx, best_length) if best_length != 0 else (unknown_idx, 1)
+
+    return LexerParser(pattern_ids, scan, patterns)
+
+class LexemeNode(Parser[str]):
+    __slots__ = ("__lexer", "__id", "__value", "__expected", "__idx")
+    _kind = "Lexeme"
+
+    def __init__(self, lexer: Parser[Token], id: str, value: Optional[str] = None) -> None:
+        self.__lexer : Parser[Token] = lexer
+        self.__id : str = id
+        self.__value : Optional[str] = value
+        self.__expected : str = "'" + id + ("" if value is None or len(value) == 0 else f"({value})") + "'"
+
+        # The pattern index tokens of this lexeme have in a TokenStream, or -1 if the lexer has no such pattern
+        pattern_ids = lexer.get_pattern_ids() if isinstance(lexer, LexerParser) else []
+        self.__idx : int = pattern_ids.index(id) if id in pattern_ids else -1
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[str]:
+        if isinstance(stream, TokenStream) and stream.get_lexer() is self.__lexer:
+            return stream._match_lexeme(self.__idx, self.__value, self.__expected)
+
+        stream_start = stream.get_offset()
+        result = self.__lexer._parse(stream)
+
+        if isinstance(result, ParseFailure):
+            return result
+
+        token = result.value
+
+        if token.id != self.__id or (self.__value is not None and token.text != self.__value):
+            stream.set_offset(stream_start)
+
+            if len(token.text) == 0:
+                return ParseFailure(result.location, "Expected {}, but found '{}'", (self.__expected, token.id))
+
+            return ParseFailure(result.location, "Expected {}, but found '{}({})'", (self.__expected, token.id, token.text))
+
+        return ParseResult(result.location, token.text)
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet(frozenset((self.__id,)), False, self.__lexer)
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__lexer,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__id, self.__value)
+
+def Lexeme(lexer: Parser[Token], id: str, value: Optional[str] = None) -> Parser[str]:
+    return LexemeNode(lexer, id, value)
 
 def EOSLexeme(lexer) -> Parser[str]:
     return Lexeme(lexer, EOS_PATTERN_ID())
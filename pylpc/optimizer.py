@@ -0,0 +1,258 @@
+from operator import itemgetter
+import sys
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from pylpc.lexer import Lexeme, LexemeNode
+from pylpc.parsers import Callback, CallbackNode, Commit, CommitNode, Count, CountNode, Failure, FailureNode, FirstSuccess, FirstSuccessNode, Longest, LongestNode, Map, MapNode, Maybe, MaybeNode, Memo, MemoNode, Named, NamedNode, Reference, Satisfy, SatisfyNode, Seq, SeqNode, SeqValue, Success, SuccessNode, TerminalNode, Try, TryNode
+from pylpc.pylpc import FirstSet, LShiftNode, ParseFailure, ParseOutcome, ParseResult, Parser, RShiftNode, Regex, StringStream
+
+# Rebuilds a parser of the given kind from (optimized) children and its original arguments
+_REBUILDERS : Dict[str, Callable[[Tuple[Any, ...], Tuple[Any, ...]], Parser[Any]]] = {
+    "Memo": lambda children, args: Memo(children[0]),
+    "Try": lambda children, args: Try(children[0]),
+    "Commit": lambda children, args: Commit(children[0]),
+    "Count": lambda children, args: Count(children[0], *args),
+    "Maybe": lambda children, args: Maybe(children[0]),
+    "Longest": lambda children, args: Longest(list(children)),
+    "FirstSuccess": lambda children, args: FirstSuccess(list(children)),
+    "Named": lambda children, args: Named(args[0], children[0]),
+    "Satisfy": lambda children, args: Satisfy(children[0], *args),
+    "Success": lambda children, args: Success(children[0], *args),
+    "Failure": lambda children, args: Failure(children[0]),
+    "Callback": lambda children, args: Callback(children[0], *args),
+    "Lexeme": lambda children, args: Lexeme(children[0], *args),
+}
+
+_SEQUENCE_KINDS = ("Seq", "LShift", "RShift")
+
+# Only the library's own nodes are rewritten; subclasses and parsers made from bare functions may do anything
+_NODE_TYPES = frozenset((Parser, MapNode, MemoNode, TryNode, CommitNode, CountNode, SeqNode, MaybeNode, LongestNode, FirstSuccessNode, NamedNode,
+                         SatisfyNode, SuccessNode, FailureNode, CallbackNode, TerminalNode, LexemeNode, LShiftNode, RShiftNode))
+
+def _is_node(parser: Any, *kinds: str) -> bool:
+    return type(parser) in _NODE_TYPES and (len(kinds) == 0 or parser.get_kind() in kinds)
+
+# How a flattened sequence puts the value of the original tree back together: an index into the flat list of results,
+# or a nested Seq of such shapes
+Shape = Union[int, Tuple['Shape', ...]]
+Builder = Callable[[List[ParseResult[Any]]], ParseResult[Any]]
+
+def _make_builder(shape: Shape) -> Builder:
+    if isinstance(shape, int):
+        return itemgetter(shape)
+
+    if len(shape) > 1 and all(isinstance(s, int) for s in shape):
+        getter = itemgetter(*shape)
+
+        def build_flat(results: List[ParseResult[Any]]) -> ParseResult[Any]:
+            values = getter(results)
+            return ParseResult(values[0].location, values)
+
+        return build_flat
+
+    builders = [_make_builder(s) for s in shape]
+
+    def build(results: List[ParseResult[Any]]) -> ParseResult[Any]:
+        values = tuple([builder(results) for builder in builders])
+        return ParseResult(values[0].location, values)
+
+    return build
+
+def _is_fusable(parser: Any) -> bool:
+    return _is_node(parser, "Terminal") and parser.get_args()[0].is_self_contained()
+
+# Each terminal of a fused regex must match on its own, without the following ones making it backtrack. Atomic groups
+# do exactly that; before Python 3.11 they are emulated with a lookahead and a backreference.
+if sys.version_info >= (3, 11):
+    _ATOMIC_GROUP = "(?>(?P<{name}>{pattern}))"
+else: # pragma: no cover
+    _ATOMIC_GROUP = "(?=(?P<{name}>{pattern}))(?P={name})"
+
+# Adjacent terminals matched by a single regex, so the combined match is exactly what the terminals would have matched
+# one after another. When it fails the terminals are run one by one to report the same failure they would have.
+class _FusedTerminals(Parser[SeqValue]):
+    __slots__ = ("__terminals", "__regex", "__names", "__expected", "__sequential")
+    _kind = "FusedTerminals"
+
+    def __init__(self, terminals: List[Parser[str]]) -> None:
+        arguments : List[Tuple[Regex, Optional[str]]] = [t.get_args() for t in terminals]
+        self.__terminals : Tuple[Parser[str], ...] = tuple(terminals)
+        self.__names : List[str] = [f"_t{i}" for i in range(len(terminals))]
+        self.__regex : Regex = Regex("".join(_ATOMIC_GROUP.format(name=name, pattern=r.get_pattern()) for name, (r, _) in zip(self.__names, arguments)))
+        self.__expected : List[Tuple[int, str]] = [(i, value) for i, (_, value) in enumerate(arguments) if value is not None]
+        self.__sequential : Parser[SeqValue] = Seq(*terminals)
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[SeqValue]:
+        regex_match = stream.match(self.__regex)
+
+        if regex_match is not None:
+            texts = regex_match.group(*self.__names)
+
+            if all(texts[i] == value for i, value in self.__expected):
+                results : List[ParseResult[Any]] = []
+                offset = stream.get_offset()
+
+                for text in texts:
+                    results.append(ParseResult(stream.get_location(offset), text))
+                    offset += len(text)
+
+                stream.set_offset(offset)
+                return ParseResult(results[0].location, tuple(results))
+
+        return self.__sequential._parse(stream)
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return self.__sequential.get_first_set()
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return self.__terminals
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__regex,)
+
+# A flattened tree of Seq, << and >>, run as a single loop. Fused steps contribute all of their results.
+class _Sequence(Parser[Any]):
+    __slots__ = ("__steps", "__shape", "__plan", "__build")
+    _kind = "Sequence"
+
+    def __init__(self, steps: List[Parser[Any]], spliced: List[bool], shape: Shape) -> None:
+        self.__steps : Tuple[Parser[Any], ...] = tuple(steps)
+        self.__shape : Shape = shape
+        self.__plan : List[Tuple[Parser[Any], bool]] = list(zip(steps, spliced))
+        self.__build : Builder = _make_builder(shape)
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[Any]:
+        stream_start = stream.get_offset()
+        results : List[ParseResult[Any]] = []
+
+        for step, splice in self.__plan:
+            result = step._parse(stream)
+
+            if isinstance(result, ParseFailure):
+                stream.set_offset(stream_start)
+                return result
+
+            if splice:
+                results.extend(result.value)
+            else:
+                results.append(result)
+
+        return self.__build(results)
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet.sequence([step.get_first_set() for step in self.__steps])
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return self.__steps
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__shape,)
+
+class _Optimizer:
+    def __init__(self) -> None:
+        self.__done : Dict[int, Any] = {}
+
+    def optimize(self, node: Any) -> Any:
+        key = id(node)
+
+        if key not in self.__done:
+            if isinstance(node, Reference):
+                # Registered before the target is optimized so that recursive rules refer back to the copy
+                reference : Reference[Any] = Reference(node.is_left_recursive())
+                self.__done[key] = reference
+                target = node.get()
+
+                if target is not None:
+                    reference.set(self.optimize(target))
+            else:
+                self.__done[key] = self.__optimize_parser(node)
+
+        return self.__done[key]
+
+    def __optimize_parser(self, parser: Any) -> Any:
+        if not _is_node(parser):
+            return parser
+
+        kind, children, args = parser.get_kind(), parser.get_children(), parser.get_args()
+
+        if kind in _SEQUENCE_KINDS and (kind != "Seq" or len(children) != 0):
+            return self.__optimize_sequence(parser)
+        elif kind == "Map":
+            return self.__optimize_map(parser)
+        elif kind == "Parser" and len(children) != 0:
+            child = self.optimize(children[0])
+            return child if isinstance(child, Parser) else Parser(child)
+        elif kind in _REBUILDERS:
+            optimized = tuple(self.optimize(child) for child in children)
+
+            if all(o is c for o, c in zip(optimized, children)):
+                return parser
+
+            return _REBUILDERS[kind](optimized, args)
+
+        return parser
+
+    def __optimize_map(self, parser: Parser[Any]) -> Parser[Any]:
+        funcs : List[Callable[[ParseResult[Any]], Any]] = []
+        node : Any = parser
+
+        while _is_node(node, "Map"):
+            funcs.insert(0, node.get_args()[0])
+            node = node.get_children()[0]
+
+        func = funcs[0]
+
+        for outer in funcs[1:]:
+            func = (lambda inner, outer: lambda result: outer(ParseResult(result.location, inner(result))))(func, outer)
+
+        return Map(self.optimize(node), func)
+
+    def __flatten(self, node: Any, steps: List[Any]) -> Shape:
+        if _is_node(node, *_SEQUENCE_KINDS):
+            kind, children = node.get_kind(), node.get_children()
+
+            if kind == "Seq" and len(children) != 0:
+                return tuple(self.__flatten(child, steps) for child in children)
+            elif kind == "LShift":
+                kept = self.__flatten(children[0], steps)
+                self.__flatten(children[1], steps)
+                return kept
+            elif kind == "RShift":
+                self.__flatten(children[0], steps)
+                return self.__flatten(children[1], steps)
+
+        steps.append(self.optimize(node))
+        return len(steps) - 1
+
+    def __optimize_sequence(self, parser: Parser[Any]) -> Parser[Any]:
+        leaves : List[Any] = []
+        shape = self.__flatten(parser, leaves)
+
+        # Fused steps splice one result per terminal back in, so the shape's leaf indices stay valid
+        steps : List[Parser[Any]] = []
+        spliced : List[bool] = []
+        i = 0
+
+        while i < len(leaves):
+            j = i
+
+            while j < len(leaves) and _is_fusable(leaves[j]):
+                j += 1
+
+            if j - i >= 2:
+                steps.append(_FusedTerminals(leaves[i:j]))
+                spliced.append(True)
+                i = j
+            else:
+                steps.append(leaves[i])
+                spliced.append(False)
+                i += 1
+
+        return _Sequence(steps, spliced, shape)
+
+# Returns a parser with the same results and failures as the given one, with its combinator tree rewritten to do less
+# work per parse: nested Seq, << and >> (and so Prefixed, Suffixed and Between) become a single sequential step, adjacent
+# terminals in them are fused into one regex and chains of Map are composed. Parsers made from bare functions are kept
+# as they are, and References are copied, so setting the original ones later does not affect the optimized grammar.
+def optimize(parser: Parser[Any]) -> Parser[Any]:
+    return _Optimizer().optimize(parser)
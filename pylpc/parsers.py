@@ -1,32 +1,192 @@
-import re
-from typing import Any, Callable, Generic, List, Optional, Tuple, TypeVar, Union, cast
+from typing import Any, Callable, Dict, Generic, Hashable, List, Optional, Sequence, Tuple, TypeVar, Union, cast
 
-from pylpc.pylpc import T, Location, char, ParseError, ParseResult, Parser, Regex, StringStream
+from pylpc.pylpc import EOF, T, FirstSet, Location, MemoEntry, char, ParseError, ParseFailure, ParseOutcome, ParseResult, Parser, Regex, RegexMatch, StringStream
 
 T1 = TypeVar("T1")
 T2 = TypeVar("T2")
 T3 = TypeVar("T3")
 T4 = TypeVar("T4")
 T5 = TypeVar("T5")
+V = TypeVar("V")
+
+class MapNode(Parser[T1]):
+    __slots__ = ("__parser", "__func")
+    _kind = "Map"
+
+    def __init__(self, parser: Parser[T], func: Callable[[ParseResult[T]], T1]) -> None:
+        self.__parser : Parser[T] = parser
+        self.__func : Callable[[ParseResult[T]], T1] = func
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[T1]:
+        stream_start = stream.get_offset()
+        result = self.__parser._parse(stream)
+
+        if isinstance(result, ParseFailure):
+            return result
+
+        try:
+            return ParseResult(result.location, self.__func(result))
+        except ParseError as e:
+            stream.set_offset(stream_start)
+            return ParseFailure.from_error(e)
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return self.__parser.get_first_set()
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__func,)
 
 def Map(parser: Parser[T], func: Callable[[ParseResult[T]], T1]) -> Parser[T1]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[T1]:
-        result = parser.parse(stream)
-        location = result.location
+    return MapNode(parser, func)
+
+class MemoNode(Parser[T]):
+    __slots__ = ("__parser", "__key")
+    _kind = "Memo"
+
+    def __init__(self, parser: Parser[T]) -> None:
+        self.__parser : Parser[T] = parser
+        self.__key : int = id(parser)
+
+    # Entries are stored with how far the parse looked, and a hit counts as looking as far for enclosing entries. A
+    # parse that crossed a commit isn't stored, since a hit wouldn't commit again.
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        table = stream.get_memo_table()
+        offset = stream.get_offset()
+        record = table._get_record(self.__key, offset)
 
-        return ParseResult[T1](location, func(result))
+        if record is None:
+            saved, commits = stream._start_reach(), stream._get_commits()[0]
+            result = self.__parser._parse(stream)
+            looked = stream._get_reach_since(saved)
 
-    return Parser[T1](function)
+            if stream._get_commits()[0] == commits:
+                table.set(self.__key, offset, (result, stream.get_offset()), looked)
+
+            return result
+
+        value, length, reach = record
+        stream.set_offset(offset + length)
+        stream._look_at(stream.get_length() if reach is None else offset + reach)
+        return value
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return self.__parser.get_first_set()
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
+
+def Memo(parser: Parser[T]) -> Parser[T]:
+    return MemoNode(parser)
 
 class Reference(Generic[T]):
-    def __init__(self) -> None:
+    def __init__(self, left_recursive: bool = False) -> None:
         self.__reference : List[List[Parser[T]]] = [[]]
+        self.__left_recursive : bool = left_recursive
+        self.__seeds : Dict[Tuple[int, int], Tuple[MemoEntry, int]] = {}
 
     def set(self, parser: Parser[T]) -> None:
         self.__reference[0] = [parser]
+        Parser._grammar_version += 1
+
+    def get(self) -> Optional[Parser[T]]:
+        return self.__reference[0][0] if len(self.__reference[0]) != 0 else None
+
+    def is_left_recursive(self) -> bool:
+        return self.__left_recursive
+
+    def get_first_set(self) -> Optional[FirstSet]:
+        parser = self.get()
+        return None if parser is None else parser.get_first_set()
 
     def __call__(self, loc: Location, stream: StringStream) -> ParseResult[T]:
-        return self.__reference[0][0].parse(stream)
+        result = self._parse(stream)
+
+        if isinstance(result, ParseFailure):
+            raise result.to_error()
+
+        return result
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        if self.__left_recursive:
+            return self._grow(stream, self.__reference[0][0])
+
+        return self.__reference[0][0]._parse(stream)
+
+    # Growing-seed left recursion (Warth et al.): the rule is first parsed with its recursive calls failing, then
+    # re-parsed with each recursive call at the same offset returning the previous result until it stops growing.
+    # When rules are mutually left-recursive, the inner one is grown again on every iteration of the outer one, since
+    # its result depends on the outer seed, and only stored once it no longer depends on a seed that is still growing.
+    # Memo parsers inside the recursive cycle would cache results from earlier iterations, so don't use them there.
+    # The rule is parsed with the given parser, so equivalent ones (a compiled target) can share the seeds.
+    def _grow(self, stream: StringStream, parser: Parser[T]) -> ParseOutcome[T]:
+        offset = stream.get_offset()
+        seed_key = (id(stream), offset)
+        seed = self.__seeds.get(seed_key)
+
+        if seed is None:
+            table = stream.get_memo_table()
+            record = table._get_record(id(self), offset)
+
+            if record is None:
+                depth, involved = stream._get_growing()
+                stream._set_growing(depth + 1, depth + 1)
+                saved, commits = stream._start_reach(), stream._get_commits()[0]
+
+                try:
+                    entry = self.__grow_seed(stream, seed_key, parser, depth + 1)
+                finally:
+                    used = stream._get_growing()[1]
+                    stream._set_growing(depth, min(involved, used))
+                    reach = stream._get_reach_since(saved)
+
+                if used > depth and stream._get_commits()[0] == commits:
+                    table.set(id(self), offset, entry, reach)
+            else:
+                entry = (record[0], offset + record[1])
+                stream._look_at(stream.get_length() if record[2] is None else offset + record[2])
+        else:
+            entry, seed_depth = seed
+            depth, involved = stream._get_growing()
+            stream._set_growing(depth, min(involved, seed_depth))
+
+        value, end = entry
+        stream.set_offset(end)
+        return value
+
+    def __grow_seed(self, stream: StringStream, seed_key: Tuple[int, int], parser: Parser[T], depth: int) -> MemoEntry:
+        offset = stream.get_offset()
+        entry : MemoEntry = (ParseFailure(stream.get_location(), "Left-recursive rule has no base case here"), offset)
+        self.__seeds[seed_key] = (entry, depth)
+
+        try:
+            while True:
+                stream.set_offset(offset)
+                result = parser._parse(stream)
+
+                if isinstance(result, ParseFailure):
+                    if isinstance(entry[0], ParseFailure) or result.committed:
+                        entry = (result, offset)
+
+                    break
+
+                end = stream.get_offset()
+
+                if not isinstance(entry[0], ParseFailure) and end <= entry[1]:
+                    break
+
+                entry = (result, end)
+                self.__seeds[seed_key] = (entry, depth)
+        finally:
+            del self.__seeds[seed_key]
+
+        stream.set_offset(offset)
+        return entry
 
 class TryValue(Generic[T]):
     def __init__(self, variant: Union[T, ParseError], is_success: bool) -> None:
@@ -58,45 +218,125 @@ class TryValue(Generic[T]):
 TryResult = ParseResult[TryValue[T]]    
 TryParser = Parser[TryValue[T]]
 
+class TryNode(Parser[TryValue[T]]):
+    __slots__ = ("__parser",)
+    _kind = "Try"
+
+    def __init__(self, parser: Parser[T]) -> None:
+        self.__parser : Parser[T] = parser
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[TryValue[T]]:
+        commits = stream._get_commits()
+        result = self.__parser._parse(stream)
+
+        if isinstance(result, ParseFailure):
+            stream._set_commits(commits)
+            return ParseResult(result.location, TryValue.CreateError(result.to_error()))
+
+        return ParseResult(result.location, TryValue.CreateSuccess(result.value))
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet.union([self.__parser.get_first_set(), FirstSet(frozenset(), True)])
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
+
 def Try(parser: Parser[T]) -> TryParser[T]:
-    def function(loc: Location, stream: StringStream) -> TryResult[T]:
-        try:
-            result = parser.parse(stream)
-            return TryResult(result.location, TryValue.CreateSuccess(result.value))
-        except ParseError as e:
-            return TryResult(e.get_location(), TryValue.CreateError(e))
+    return TryNode(parser)
+
+class CommitNode(Parser[T]):
+    __slots__ = ("__parser",)
+    _kind = "Commit"
+
+    def __init__(self, parser: Parser[T]) -> None:
+        self.__parser : Parser[T] = parser
 
-    return TryParser[T](function)
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        offset = stream.get_offset()
+        result = self.__parser._parse(stream)
+
+        if isinstance(result, ParseFailure):
+            return result if result.committed else result.commit()
+
+        stream.commit(offset)
+        return result
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return self.__parser.get_first_set()
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
+
+# Once the parser starts, nothing enclosing it backtracks: if it fails, the alternatives, options and repetitions around
+# it fail too instead of trying something else, up to the nearest Try, and if it succeeds, a Longest around it takes
+# that alternative without trying the rest. A cut after a keyword is the keyword followed by Commit over the rest of the
+# rule. Once it succeeds, the token cache and memo table drop what they hold before where it started, so memory stays
+# flat on long inputs, and results that crossed it aren't memoized. A Try that catches a failure undoes the commits
+# made since it started, but what was dropped stays dropped.
+def Commit(parser: Parser[T]) -> Parser[T]:
+    return CommitNode(parser)
 
 CountValue = list[ParseResult[T]]
 CountResult = ParseResult[CountValue[T]]    
 CountParser = Parser[CountValue[T]]
 
-def Count(parser: Parser[T], min: int, max: Optional[int]) -> CountParser[T]:
-    if min < 0:
-        raise ValueError("min must be non-negative")
-    elif max is not None:
-        if max < 0:
-            raise ValueError("max must be non-negative")
-        if max < min:
-            raise ValueError(f"max must be at least min: {max} < {min}")
+class CountNode(Parser[CountValue[T]]):
+    __slots__ = ("__parser", "__min", "__max")
+    _kind = "Count"
+
+    def __init__(self, parser: Parser[T], min: int, max: Optional[int]) -> None:
+        if min < 0:
+            raise ValueError("min must be non-negative")
+        elif max is not None:
+            if max < 0:
+                raise ValueError("max must be non-negative")
+            if max < min:
+                raise ValueError(f"max must be at least min: {max} < {min}")
 
-    def function(loc: Location, stream: StringStream) -> CountResult[T]:
-        results = CountValue[T]()
+        self.__parser : Parser[T] = parser
+        self.__min : int = min
+        self.__max : Optional[int] = max
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[CountValue[T]]:
+        parser, min, max = self.__parser, self.__min, self.__max
+        stream_start = stream.get_offset()
+        results : CountValue[T] = []
 
         while max is None or len(results) < max:
-            try:
-                results.append(parser.parse(stream))
-            except ParseError as e:
-                if len(results) >= min:
+            result = parser._parse(stream)
+
+            if isinstance(result, ParseFailure):
+                if result.committed:
+                    stream.set_offset(stream_start)
+                    return result
+                elif len(results) >= min:
                     break
 
-                error = ParseError.expectation(f"at least {min}", f"only {len(results)}", Location(stream.get_name(), stream.get_position()))
-                raise ParseError.combine(e, error)
+                error = ParseFailure(stream.get_location(), "Expected at least {}, but found only {}", (min, len(results)))
+                stream.set_offset(stream_start)
+                return ParseFailure.combine(result, error)
+
+            results.append(result)
+
+        return ParseResult(stream.get_location(stream_start) if len(results) == 0 else results[0].location, results)
 
-        return CountResult[T](loc if len(results) == 0 else results[0].location, results)
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet.union([self.__parser.get_first_set()] + ([] if self.__min > 0 else [FirstSet(frozenset(), True)]))
 
-    return CountParser[T](function)
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__min, self.__max)
+
+def Count(parser: Parser[T], min: int, max: Optional[int]) -> CountParser[T]:
+    return CountNode(parser, min, max)
 
 def ManyOrOne(parser: Parser[T]) -> CountParser[T]:
     return Count(parser, 1, None)
@@ -114,12 +354,39 @@ SeqValue = tuple[ParseResult[Any], ...]
 SeqResult = ParseResult[SeqValue]    
 SeqParser = Parser[SeqValue]
 
-def Seq(*parsers: Parser[Any]) -> SeqParser:
-    def function(loc: Location, stream: StringStream) -> SeqResult:
-        results = SeqValue([parser.parse(stream) for parser in parsers])
-        return SeqResult(loc if len(results) == 0 else results[0].location, results)
+class SeqNode(Parser[SeqValue]):
+    __slots__ = ("__parsers",)
+    _kind = "Seq"
+
+    def __init__(self, *parsers: Parser[Any]) -> None:
+        self.__parsers : Tuple[Parser[Any], ...] = parsers
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[SeqValue]:
+        stream_start = stream.get_offset()
+        results : List[ParseResult[Any]] = []
+
+        for parser in self.__parsers:
+            result = parser._parse(stream)
+
+            if isinstance(result, ParseFailure):
+                stream.set_offset(stream_start)
+                return result
+
+            results.append(result)
+
+        return ParseResult(stream.get_location(stream_start) if len(results) == 0 else results[0].location, SeqValue(results))
 
-    return SeqParser(function)
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet.sequence([parser.get_first_set() for parser in self.__parsers])
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return self.__parsers
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
+
+def Seq(*parsers: Parser[Any]) -> SeqParser:
+    return SeqNode(*parsers)
 
 Seq2Parser = Parser[Tuple[ParseResult[T1], ParseResult[T2]]]
 def Seq2(p1: Parser[T1], p2: Parser[T2]) -> Seq2Parser[T1, T2]:
@@ -161,82 +428,265 @@ class MaybeValue(Generic[T]):
 MaybeResult = ParseResult[MaybeValue[T]]    
 MaybeParser = Parser[MaybeValue[T]]
 
-def Maybe(parser: Parser[T]) -> MaybeParser[T]:
-    def function(loc: Location, stream: StringStream) -> MaybeResult[T]:
-        try:
-            result = parser.parse(stream)
-            return MaybeResult(result.location, MaybeValue.CreateSome(result.value))
-        except ParseError as e:
-            return MaybeResult(e.get_location(), MaybeValue.CreateNone())
+class MaybeNode(Parser[MaybeValue[T]]):
+    __slots__ = ("__parser",)
+    _kind = "Maybe"
 
-    return MaybeParser[T](function)
+    def __init__(self, parser: Parser[T]) -> None:
+        self.__parser : Parser[T] = parser
 
-def Longest(parsers: List[Parser[T]]) -> Parser[T]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[T]:
+    def _parse(self, stream: StringStream) -> ParseOutcome[MaybeValue[T]]:
+        result = self.__parser._parse(stream)
+
+        if isinstance(result, ParseFailure):
+            return result if result.committed else ParseResult(result.location, MaybeValue.CreateNone())
+
+        return ParseResult(result.location, MaybeValue.CreateSome(result.value))
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet.union([self.__parser.get_first_set(), FirstSet(frozenset(), True)])
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
+
+def Maybe(parser: Parser[T]) -> MaybeParser[T]:
+    return MaybeNode(parser)
+
+# Groups a choice's alternatives by the first characters (or token ids) they can start with, so that at a given offset
+# only the viable ones are tried. Alternatives without a usable first set are viable everywhere. The table is built on
+# first use and rebuilt whenever the grammar changes.
+class _Alternatives:
+    def __init__(self, parsers: Sequence[Parser[Any]]) -> None:
+        self.__parsers : Sequence[Parser[Any]] = parsers
+        self.__all : Tuple[int, ...] = ()
+        self.__version : int = -1
+        self.__lexer : Optional[Parser[Any]] = None
+        self.__peek_id : Callable[[StringStream], Optional[Hashable]] = self.__parse_id
+        self.__table : Optional[Dict[Hashable, Tuple[int, ...]]] = None
+        self.__default : Tuple[int, ...] = ()
+
+    def get_first_set(self) -> Optional[FirstSet]:
+        return FirstSet.union([parser.get_first_set() for parser in self.__parsers])
+
+    def get_viable(self, stream: StringStream) -> Tuple[int, ...]:
+        if self.__version != Parser._grammar_version:
+            self.__build()
+
+        if self.__table is None:
+            return self.__all
+
+        if self.__lexer is None:
+            return self.__table.get(stream.peek(), self.__default)
+
+        id = self.__peek_id(stream)
+        return self.__all if id is None else self.__table.get(id, self.__default)
+
+    def __parse_id(self, stream: StringStream) -> Optional[Hashable]:
+        stream_start = stream.get_offset()
+        result = cast(Parser[Any], self.__lexer)._parse(stream)
+        stream.set_offset(stream_start)
+
+        return None if isinstance(result, ParseFailure) else result.value.id
+
+    def __build(self) -> None:
+        first_sets = [parser.get_first_set() for parser in self.__parsers]
+        known = [(i, f) for i, f in enumerate(first_sets) if f is not None and not f.nullable]
+
+        self.__all = tuple(range(len(self.__parsers)))
+        self.__version = Parser._grammar_version
+        self.__table = None
+
+        if len(known) == 0:
+            return
+
+        # Alternatives keyed on something other than the first one's kind are simply treated as always viable
+        lexer = known[0][1].lexer
+        keyed = {i: f.elements for i, f in known if f.lexer is lexer or len(f.elements) == 0}
+        buckets : Dict[Hashable, List[int]] = {}
+
+        for i, elements in keyed.items():
+            for element in elements:
+                buckets.setdefault(element, []).append(i)
+
+        self.__lexer = lexer
+        self.__peek_id = getattr(lexer, "_peek_id", self.__parse_id) # Lexers can find the id without making the token
+        self.__default = tuple(i for i in self.__all if i not in keyed)
+        self.__table = {key: tuple(sorted(indices + list(self.__default))) for key, indices in buckets.items()}
+
+# Picks the failures that got furthest, as both choice combinators report them
+def _furthest_failure(stream: StringStream, stream_start: int, failures: Sequence[ParseFailure]) -> ParseFailure:
+    errors : List[ParseFailure] = []
+    errors_length = 0
+
+    for failure in failures:
+        e_length = stream.get_offset_from_location(failure.location)
+
+        if e_length == errors_length:
+            errors.append(failure)
+        elif e_length > errors_length:
+            errors, errors_length = [failure], e_length
+
+    return errors.pop() if len(errors) == 1 else ParseFailure(stream.get_location(stream_start), "No option parsed!", (), errors)
+
+# Alternatives skipped by the dispatch fail where they start, so they only change the reported failure when none of the
+# tried alternatives got any further; that is when they are run to reproduce the failure a full scan would give.
+def _needs_full_scan(stream: StringStream, stream_start: int, parsers: Sequence[Parser[Any]], failures: Dict[int, ParseFailure]) -> bool:
+    return len(failures) != len(parsers) and all(stream.get_offset_from_location(f.location) <= stream_start for f in failures.values())
+
+class LongestNode(Parser[T]):
+    __slots__ = ("__parsers", "__alternatives")
+    _kind = "Longest"
+
+    def __init__(self, parsers: Sequence[Parser[T]]) -> None:
+        self.__parsers : Tuple[Parser[T], ...] = tuple(parsers)
+        self.__alternatives : _Alternatives = _Alternatives(self.__parsers)
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        parsers = self.__parsers
         stream_start, greatest_length = stream.get_offset(), 0
         result : Optional[ParseResult[T]] = None
-        errors : List[ParseError] = []
+        failures : Dict[int, ParseFailure] = {}
+
+        # Returns a committed failure or a success that crossed a commit, either of which ends the choice
+        def attempt(i: int) -> Optional[ParseOutcome[T]]:
+            nonlocal result, greatest_length
+            commits = stream._get_commits()[0]
+            parse_result = parsers[i]._parse(stream)
+
+            if not isinstance(parse_result, ParseFailure):
+                if stream._get_commits()[0] != commits:
+                    return parse_result
 
-        for parser in parsers:
-            try:
-                parse_result = parser.parse(stream)
                 length = stream.get_offset() - stream_start
 
                 if result is None or length > greatest_length:
                     result = parse_result
                     greatest_length = length
-                    errors.clear() # We put this here to save memory
-            except ParseError as e:
-                if result is None:
-                    e_length = stream.get_offset_from_pos(e.get_location().position)
-                    errors_length = 0 if len(errors) == 0 else stream.get_offset_from_pos(errors[0].get_location().position)
-
-                    if e_length == errors_length:
-                        errors.append(e)
-                    elif e_length > errors_length:
-                        errors = [e]
+            elif parse_result.committed:
+                stream.set_offset(stream_start)
+                return parse_result
+            elif result is None:
+                failures[i] = parse_result
 
             stream.set_offset(stream_start)
+            return None
+
+        for i in self.__alternatives.get_viable(stream):
+            outcome = attempt(i)
+
+            if outcome is not None:
+                return outcome
+
+        if result is None and _needs_full_scan(stream, stream_start, parsers, failures):
+            for i in range(len(parsers)):
+                if i not in failures:
+                    outcome = attempt(i)
+
+                    if outcome is not None:
+                        return outcome
 
         if result is None:
-            raise errors.pop() if len(errors) == 1 else ParseError(loc, "No option parsed!", errors)
+            return _furthest_failure(stream, stream_start, [failures[i] for i in sorted(failures)])
 
         stream.set_offset(stream_start + greatest_length)
         return result
 
-    return Parser(function)
+    def _first_set(self) -> Optional[FirstSet]:
+        return self.__alternatives.get_first_set()
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return self.__parsers
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
+
+def Longest(parsers: List[Parser[T]]) -> Parser[T]:
+    return LongestNode(parsers)
+
+class FirstSuccessNode(Parser[T]):
+    __slots__ = ("__parsers", "__alternatives")
+    _kind = "FirstSuccess"
+
+    def __init__(self, parsers: Sequence[Parser[T]]) -> None:
+        self.__parsers : Tuple[Parser[T], ...] = tuple(parsers)
+        self.__alternatives : _Alternatives = _Alternatives(self.__parsers)
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        parsers = self.__parsers
+        stream_start = stream.get_offset()
+        failures : Dict[int, ParseFailure] = {}
+
+        for i in self.__alternatives.get_viable(stream):
+            result = parsers[i]._parse(stream)
+
+            if not isinstance(result, ParseFailure) or result.committed:
+                return result
+
+            failures[i] = result
+
+        if _needs_full_scan(stream, stream_start, parsers, failures):
+            for i, parser in enumerate(parsers):
+                if i not in failures:
+                    result = parser._parse(stream)
+
+                    if not isinstance(result, ParseFailure) or result.committed:
+                        return result
+
+                    failures[i] = result
+
+        return _furthest_failure(stream, stream_start, [failures[i] for i in sorted(failures)])
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return self.__alternatives.get_first_set()
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return self.__parsers
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
 
 def FirstSuccess(parsers: List[Parser[T]]) -> Parser[T]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[T]:
-        stream_start, greatest_length = stream.get_offset(), 0
-        errors : List[ParseError] = []
+    return FirstSuccessNode(parsers)
 
-        for parser in parsers:
-            try:
-                return parser.parse(stream)
-            except ParseError as e:
-                e_length = stream.get_offset_from_pos(e.get_location().position)
-                errors_length = 0 if len(errors) == 0 else stream.get_offset_from_pos(errors[0].get_location().position)
+# Called instead of parsing Named rules directly while pylpc.profiling has a profile active
+_named_hook : Optional[Callable[['NamedNode[Any]', StringStream], ParseOutcome[Any]]] = None
 
-                if e_length == errors_length:
-                    errors.append(e)
-                elif e_length > errors_length:
-                    errors = [e]
+class NamedNode(Parser[T]):
+    __slots__ = ("__name", "__parser")
+    _kind = "Named"
 
-            stream.set_offset(stream_start)
+    def __init__(self, name: str, parser: Parser[T]) -> None:
+        self.__name : str = name
+        self.__parser : Parser[T] = parser
 
-        raise errors.pop() if len(errors) == 1 else ParseError(loc, "No option parsed!", errors)
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        if _named_hook is not None:
+            return _named_hook(self, stream)
 
-    return Parser(function)
+        return self._parse_rule(stream)
 
-def Named(name: str, parser: Parser[T]) -> Parser[T]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[T]:
-        try:
-            return parser.parse(stream)
-        except ParseError as e:
-            raise ParseError.combine(ParseError(e.get_location(), f"Unable to parse {name}"), e)
+    def _parse_rule(self, stream: StringStream) -> ParseOutcome[T]:
+        result = self.__parser._parse(stream)
+
+        if isinstance(result, ParseFailure):
+            return ParseFailure.combine(ParseFailure(result.location, "Unable to parse {}", (self.__name,)), result)
 
-    return Parser(function)
+        return result
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return self.__parser.get_first_set()
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__name,)
+
+def Named(name: str, parser: Parser[T]) -> Parser[T]:
+    return NamedNode(name, parser)
 
 def Prefixed(prefix: Parser[T1], parser: Parser[T2]) -> Parser[T2]:
     return prefix >> parser
@@ -247,11 +697,27 @@ def Suffixed(parser: Parser[T1], suffix: Parser[T2]) -> Parser[T1]:
 def Between(prefix: Parser[T1], parser: Parser[T], suffix: Parser[T2]) -> Parser[T]:
     return Suffixed(Prefixed(prefix, parser), suffix)
 
-def Value(value: T) -> Parser[T]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[T]:
-        return ParseResult(loc, value)
+class ValueNode(Parser[T]):
+    __slots__ = ("__value",)
+    _kind = "Value"
+
+    def __init__(self, value: T) -> None:
+        self.__value : T = value
 
-    return Parser(function)
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        return ParseResult(stream.get_location(), self.__value)
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet(frozenset(), True)
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return ()
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__value,)
+
+def Value(value: T) -> Parser[T]:
+    return ValueNode(value)
 
 def Separate() -> Parser[T]:
     raise NotImplementedError()
@@ -265,67 +731,172 @@ def LookAhead() -> Parser[T]:
 def Chain() -> Parser[T]:
     raise NotImplementedError()
 
-def Satisfy(parser: Parser[T], predicate: Callable[[ParseResult[T]], bool]) -> Parser[T]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[T]:
-        result = parser.parse(stream)
+class SatisfyNode(Parser[T]):
+    __slots__ = ("__parser", "__predicate")
+    _kind = "Satisfy"
 
-        if predicate(result):
-            return result
-        else:
-            raise ParseError(result.location, "Predicate not satisfied!")
+    def __init__(self, parser: Parser[T], predicate: Callable[[ParseResult[T]], bool]) -> None:
+        self.__parser : Parser[T] = parser
+        self.__predicate : Callable[[ParseResult[T]], bool] = predicate
 
-    return Parser(function)
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        stream_start = stream.get_offset()
+        result = self.__parser._parse(stream)
+
+        if isinstance(result, ParseFailure):
+            return result
 
-def Success(parser: Parser, default: T) -> Parser[T]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[T]:
         try:
-            return parser.parse(stream)
+            if self.__predicate(result):
+                return result
         except ParseError as e:
-            return ParseResult(loc, default)
+            stream.set_offset(stream_start)
+            return ParseFailure.from_error(e)
+
+        stream.set_offset(stream_start)
+        return ParseFailure(result.location, "Predicate not satisfied!")
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return self.__parser.get_first_set()
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__predicate,)
+
+def Satisfy(parser: Parser[T], predicate: Callable[[ParseResult[T]], bool]) -> Parser[T]:
+    return SatisfyNode(parser, predicate)
+
+class SuccessNode(Parser[T]):
+    __slots__ = ("__parser", "__default")
+    _kind = "Success"
+
+    def __init__(self, parser: Parser[Any], default: T) -> None:
+        self.__parser : Parser[Any] = parser
+        self.__default : T = default
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        result = self.__parser._parse(stream)
+
+        if isinstance(result, ParseFailure):
+            return result if result.committed else ParseResult(stream.get_location(), self.__default)
+
+        return result
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet.union([self.__parser.get_first_set(), FirstSet(frozenset(), True)])
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__default,)
+
+def Success(parser: Parser, default: T) -> Parser[T]:
+    return SuccessNode(parser, default)
+
+class FailureNode(Parser[ParseError]):
+    __slots__ = ("__parser",)
+    _kind = "Failure"
+
+    def __init__(self, parser: Parser[Any]) -> None:
+        self.__parser : Parser[Any] = parser
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[ParseError]:
+        stream_start, commits = stream.get_offset(), stream._get_commits()
+        result = self.__parser._parse(stream)
+        stream._set_commits(commits)
+
+        if not isinstance(result, ParseFailure):
+            stream.set_offset(stream_start)
+            return ParseFailure(stream.get_location(), "Unexpected Success")
+
+        return ParseResult(stream.get_location(), result.to_error())
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet(frozenset(), True)
 
-    return Parser(function)
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
 
 def Failure(parser: Parser[T]) -> Parser[ParseError]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[ParseError]:
-        error : Optional[ParseError] = None
+    return FailureNode(parser)
 
-        try:
-            parser.parse(stream)
-        except ParseError as e:
-            error = e
+class CallbackNode(Parser[T]):
+    __slots__ = ("__parser", "__func")
+    _kind = "Callback"
 
-        if error is None:
-            raise ParseError(loc, "Unexpected Success")
+    def __init__(self, parser: Parser[T], func: Callable[[ParseResult[T]], None]) -> None:
+        self.__parser : Parser[T] = parser
+        self.__func : Callable[[ParseResult[T]], None] = func
 
-        return ParseResult(loc, error)
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        stream_start = stream.get_offset()
+        result = self.__parser._parse(stream)
 
-    return Parser(function)
+        if not isinstance(result, ParseFailure):
+            try:
+                self.__func(result)
+            except ParseError as e:
+                stream.set_offset(stream_start)
+                return ParseFailure.from_error(e)
 
-def Callback(parser: Parser[T], func: Callable[[ParseResult[T]], None]) -> Parser[T]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[T]:
-        result = parser.parse(stream)
-        
-        func(result)
         return result
 
-    return Parser(function)
+    def _first_set(self) -> Optional[FirstSet]:
+        return self.__parser.get_first_set()
 
-def Terminal(regex: Regex, value: Optional[str] = None) -> Parser[str]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[str]:
-        regex_match : Optional[re.Match] = regex.match(stream.get_data(stream.get_offset()))
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser,)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__func,)
+
+def Callback(parser: Parser[T], func: Callable[[ParseResult[T]], None]) -> Parser[T]:
+    return CallbackNode(parser, func)
+
+class TerminalNode(Parser[str]):
+    __slots__ = ("__regex", "__value")
+    _kind = "Terminal"
+
+    def __init__(self, regex: Regex, value: Optional[str] = None) -> None:
+        self.__regex : Regex = regex
+        self.__value : Optional[str] = value
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[str]:
+        regex_match : Optional[RegexMatch] = stream.match(self.__regex)
 
         if regex_match is None:
-            raise ParseError(loc, f"No match found for regular expression: {regex.get_pattern()}")
-                
+            return ParseFailure(stream.get_location(), "No match found for regular expression: {}", (self.__regex.get_pattern(),))
+
         string = regex_match[0]
 
-        if value is not None and string != value:
-            raise ParseError.expectation(f"'{value}'", f"'{string}'", loc)
+        if self.__value is not None and string != self.__value:
+            return ParseFailure(stream.get_location(), "Expected '{}', but found '{}'", (self.__value, string))
 
+        loc = stream.get_location()
         stream.ignore(len(string))
         return ParseResult(loc, string)
 
-    return Parser(function)
+    def _first_set(self) -> Optional[FirstSet]:
+        if self.__value is not None:
+            return FirstSet(frozenset(self.__value[:1]), len(self.__value) == 0)
+
+        chars = self.__regex.get_first_chars()
+        return None if chars is None else FirstSet(chars, self.__regex.is_nullable())
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return ()
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__regex, self.__value)
+
+def Terminal(regex: Regex, value: Optional[str] = None) -> Parser[str]:
+    return TerminalNode(regex, value)
 
 def Char(value: Optional[char] = None) -> Parser[char]:
     return Terminal(Regex("[\\S\\s]"), value)
@@ -357,17 +928,131 @@ def Whitespace(value: Optional[char] = None) -> Parser[char]:
 def Whitespaces(value: Optional[str] = None) -> Parser[str]:
     return Terminal(Regex("[\\s]+"), value)
 
-def EOS() -> Parser[None]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[None]:
+# The lengths of the literals starting with a character, longest first, each with a dict from those literals to their
+# values. Looking up a slice of each length in turn finds the longest literal in one pass.
+LiteralEntry = Tuple[Tuple[int, Dict[str, V]], ...]
+
+# The entry for each first character. A literal given more than once keeps its first value.
+LiteralTable = Dict[char, LiteralEntry[V]]
+
+def _build_literal_table(literals: Sequence[Tuple[str, V]]) -> LiteralTable[V]:
+    buckets : Dict[char, Dict[int, Dict[str, V]]] = {}
+
+    for literal, value in literals:
+        buckets.setdefault(literal[0], {}).setdefault(len(literal), {}).setdefault(literal, value)
+
+    return {c: tuple(sorted(lengths.items(), reverse=True)) for c, lengths in buckets.items()}
+
+def _is_word_char(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+class LiteralsNode(Parser[str]):
+    __slots__ = ("__literals", "__words", "__table", "__max_length", "__expected")
+    _kind = "Literals"
+
+    def __init__(self, literals: Sequence[str], words: bool) -> None:
+        if any(len(literal) == 0 for literal in literals):
+            raise ValueError("Literals must not be empty")
+
+        self.__literals : Tuple[str, ...] = tuple(literals)
+        self.__words : bool = words
+        self.__table : LiteralTable[bool] = _build_literal_table([(literal, words and _is_word_char(literal[-1])) for literal in literals])
+        self.__max_length : int = max((len(literal) for literal in literals), default=0)
+        self.__expected : str = ", ".join(f"'{literal}'" for literal in self.__literals)
+
+    # The length of the longest literal at pos in data, or -1 if there is none. A literal that ends in a word character
+    # only counts with words set if no word character follows it.
+    def _match(self, data: str, pos: int) -> int:
+        for length, values in self.__table.get(data[pos:pos + 1], ()):
+            needs_boundary = values.get(data[pos:pos + length])
+
+            if needs_boundary is not None and not (needs_boundary and _is_word_char(data[pos + length:pos + length + 1])):
+                return length
+
+        return -1
+
+    def _get_expected(self) -> str:
+        return self.__expected
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[str]:
+        data, pos = stream._get_buffer(), stream.get_offset()
+
+        if data is None:
+            data, pos = stream._read_chars(pos, self.__max_length + 1), 0
+        else:
+            stream._look_at(pos + self.__max_length)
+
+        length = self._match(data, pos)
+
+        if length < 0:
+            return ParseFailure(stream.get_location(), "Expected one of {}, but found '{}'", (self.__expected, stream.peek()))
+
+        location = stream.get_location()
+        stream.ignore(length)
+        return ParseResult(location, data[pos:pos + length])
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet(frozenset(self.__table), False)
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return ()
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__literals, self.__words)
+
+# Matches the longest of the literals at the stream's offset with a hash lookup per literal length instead of a regex per
+# literal, like a Longest of Terminals for each of them but failing with a single error
+def Literals(literals: Sequence[str]) -> Parser[str]:
+    return LiteralsNode(literals, False)
+
+# Like Literals, but keywords that end in a word character don't match the start of a longer word
+def Keywords(keywords: Sequence[str]) -> Parser[str]:
+    return LiteralsNode(keywords, True)
+
+class EOSNode(Parser[None]):
+    __slots__ = ()
+    _kind = "EOS"
+
+    def __init__(self) -> None:
+        pass
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[None]:
         if not stream.is_eos():
-            raise ParseError.expectation(f"EOS", f"'{stream.peek()}'", loc)
+            return ParseFailure(stream.get_location(), "Expected EOS, but found '{}'", (stream.peek(),))
+
+        return ParseResult(stream.get_location(), None)
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet(frozenset((EOF,)))
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return ()
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
+
+def EOS() -> Parser[None]:
+    return EOSNode()
+
+class ErrorNode(Parser[None]):
+    __slots__ = ("__message",)
+    _kind = "Error"
+
+    def __init__(self, message: str) -> None:
+        self.__message : str = message
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[None]:
+        return ParseFailure(stream.get_location(), self.__message)
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet(frozenset())
 
-        return ParseResult(loc, None)
+    def get_children(self) -> Tuple[Any, ...]:
+        return ()
 
-    return Parser(function)
+    def get_args(self) -> Tuple[Any, ...]:
+        return (self.__message,)
 
 def Error(message: str) -> Parser[None]:
-    def function(loc: Location, stream: StringStream) -> ParseResult[None]:
-        raise ParseError(loc, message)
+    return ErrorNode(message)
 
-    return Parser(function)
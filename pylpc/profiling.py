@@ -0,0 +1,123 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pylpc.parsers
+from pylpc.parsers import NamedNode
+from pylpc.pylpc import ParseFailure, ParseOutcome, StringStream
+
+@dataclass
+class RuleStats:
+    calls : int = 0
+    successes : int = 0
+    failures : int = 0
+    backtracks : int = 0 # Failures after the rule had read past where it started
+    consumed : int = 0 # Characters consumed by successful calls
+    inclusive : float = 0.0 # Seconds, not counting recursive calls twice
+    exclusive : float = 0.0 # Seconds, not counting the named rules called from it
+
+_SORT_KEYS = ("calls", "successes", "failures", "backtracks", "consumed", "inclusive", "exclusive")
+
+class Profile:
+    def __init__(self) -> None:
+        self.__stats : Dict[str, RuleStats] = {}
+        self.__stacks : Dict[Tuple[str, ...], float] = {}
+        self.__paths : List[Tuple[str, ...]] = [()]
+        self.__child_times : List[float] = [0.0]
+        self.__active : Dict[str, int] = {}
+
+    def get_stats(self) -> Dict[str, RuleStats]:
+        return self.__stats
+
+    # Exclusive seconds spent in each chain of named rules, outermost first
+    def get_stacks(self) -> Dict[Tuple[str, ...], float]:
+        return self.__stacks
+
+    def _call(self, node: NamedNode[Any], stream: StringStream) -> ParseOutcome[Any]:
+        name = node.get_args()[0]
+        stats = self.__stats.get(name)
+
+        if stats is None:
+            stats = self.__stats[name] = RuleStats()
+
+        path = self.__paths[-1] + (name,)
+        active = self.__active.get(name, 0)
+        offset, furthest = stream.get_offset(), stream._get_furthest()
+
+        self.__paths.append(path)
+        self.__child_times.append(0.0)
+        self.__active[name] = active + 1
+        stream._set_furthest(offset)
+        start = time.perf_counter()
+
+        try:
+            result = node._parse_rule(stream)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.__paths.pop()
+            exclusive = elapsed - self.__child_times.pop()
+            self.__child_times[-1] += elapsed
+            self.__active[name] = active
+
+        reach = stream._get_furthest()
+        stream._set_furthest(max(furthest, reach))
+
+        stats.calls += 1
+        stats.exclusive += exclusive
+        self.__stacks[path] = self.__stacks.get(path, 0.0) + exclusive
+
+        if active == 0:
+            stats.inclusive += elapsed
+
+        if isinstance(result, ParseFailure):
+            stats.failures += 1
+
+            if reach > offset:
+                stats.backtracks += 1
+        else:
+            stats.successes += 1
+            stats.consumed += stream.get_offset() - offset
+
+        return result
+
+    def report(self, sort_by: str = "exclusive", limit: Optional[int] = None) -> str:
+        if sort_by not in _SORT_KEYS:
+            raise ValueError(f"Invalid sort key: {sort_by}")
+
+        rows = sorted(self.__stats.items(), key=lambda item: getattr(item[1], sort_by), reverse=True)[:limit]
+        width = max([len("rule")] + [len(name) for name, _ in rows])
+        lines = [f"{'rule':<{width}} {'calls':>10} {'ok':>10} {'failed':>10} {'backtracks':>10} {'chars':>10} {'incl ms':>10} {'excl ms':>10}"]
+
+        for name, s in rows:
+            lines.append(f"{name:<{width}} {s.calls:>10} {s.successes:>10} {s.failures:>10} {s.backtracks:>10} {s.consumed:>10} {s.inclusive * 1000:>10.2f} {s.exclusive * 1000:>10.2f}")
+
+        return "\n".join(lines)
+
+    # One "outer;inner microseconds" line per chain of named rules, the folded format flamegraph.pl and speedscope read
+    def get_folded(self) -> str:
+        return "".join(f"{';'.join(path)} {round(seconds * 1e6)}\n" for path, seconds in sorted(self.__stacks.items()))
+
+    def write_folded(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.get_folded())
+
+_active : Optional[Profile] = None
+
+# Records statistics for every Named parser called inside the block. Otherwise Named parsers only check that no profile
+# is active. Compiled parsers inline Named, so profile the grammar before compiling it.
+@contextmanager
+def profile() -> Iterator[Profile]:
+    global _active
+
+    if _active is not None:
+        raise Exception("A profile is already active")
+
+    _active = Profile()
+    pylpc.parsers._named_hook = _active._call
+
+    try:
+        yield _active
+    finally:
+        pylpc.parsers._named_hook = None
+        _active = None
@@ -1,10 +1,25 @@
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_right
 from dataclasses import dataclass
-from typing import Callable, Dict, Generic, List, Optional, Type, TypeVar, Union
+from heapq import heapify, heappop, heappush
+import itertools
+import mmap
+import os
+from typing import Any, BinaryIO, Callable, Dict, FrozenSet, Generic, Hashable, List, Iterator, NamedTuple, Optional, OrderedDict, Sequence, Set, Tuple, Type, TypeVar, Union, cast
 import re
+import sys
+
+try:
+    from re import _parser as sre_parse # type: ignore[attr-defined] # Python 3.11+
+except ImportError: # pragma: no cover
+    import sre_parse # type: ignore
 
 char = str
 EOF : char = ''
 
+_NEWLINE = re.compile('\n')
+
 @dataclass
 class Position:
     line : int
@@ -13,25 +28,731 @@ class Position:
     def __str__(self) -> str:
         return f"({self.line}, {self.column})"
 
-@dataclass
+# An edit of a stream's text, linked to the edit after it once there is one. The stream keeps the end of the chain,
+# where its next edit goes, and each location keeps the end as it was when it was made, so the edits no location
+# still needs are freed along with the locations.
+class _Edit:
+    __slots__ = ("start", "end", "delta", "next")
+
+    def __init__(self) -> None:
+        self.start : int = 0
+        self.end : int = 0
+        self.delta : int = 0
+        self.next : Optional[_Edit] = None
+
+    # Moves an offset from before this edit past it and every edit after it, returning the offset and the end of the
+    # chain. Offsets in deleted text move to where it was.
+    def follow(self, offset: int) -> Tuple[int, '_Edit']:
+        edit = self
+
+        while edit.next is not None:
+            if offset >= edit.end:
+                offset += edit.delta
+            elif offset > edit.start:
+                offset = edit.start
+
+            edit = edit.next
+
+        return offset, edit
+
 class Location:
-    name: str
-    position: Position = Position(1, 1)
+    __slots__ = ("name", "__position", "__stream", "__offset", "__version")
+
+    # A location created by a stream only stores its offset and resolves the line and column on first access. When the
+    # stream has been edited since, the offset is first moved past the edits, so locations in parse results reused
+    # after an edit stay correct.
+    def __init__(self, name: str, position: Optional[Position] = None, stream: Optional['StringStream'] = None, offset: Optional[int] = None) -> None:
+        assert (stream is None) == (offset is None)
+
+        self.name : str = name
+        self.__position : Optional[Position] = position if position is not None or stream is not None else Position(1, 1)
+        self.__stream : Optional[StringStream] = stream
+        self.__offset : Optional[int] = offset
+        self.__version : Optional[_Edit] = None if stream is None else stream._get_version()
+
+    def __follow_edits(self) -> None:
+        self.__offset, self.__version = cast(_Edit, self.__version).follow(cast(int, self.__offset))
+        self.__position = None
+
+    @property
+    def position(self) -> Position:
+        if self.__version is not None and self.__version.next is not None:
+            self.__follow_edits()
+
+        if self.__position is None:
+            self.__position = cast(StringStream, self.__stream).get_position_from_offset(cast(int, self.__offset))
+
+        return self.__position
+
+    @position.setter
+    def position(self, position: Position) -> None:
+        self.__position, self.__stream, self.__offset = position, None, None
+
+    @property
+    def offset(self) -> Optional[int]:
+        if self.__version is not None and self.__version.next is not None:
+            self.__follow_edits()
+
+        return self.__offset
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Location):
+            return NotImplemented
+
+        return self.name == other.name and self.position == other.position
+
+    __hash__ = None # type: ignore
+
+    def __repr__(self) -> str:
+        return f"Location(name={self.name!r}, position={self.position!r})"
 
     def __str__(self) -> str:
         return f"{self.name}:{self.position.line}:{self.position.column}"
 
+    # Pickled with the position resolved and without the stream, so sending a location to another process doesn't send
+    # the whole input along with it
+    def __getstate__(self) -> Tuple[str, Position, Optional[int]]:
+        return self.name, self.position, self.offset
+
+    def __setstate__(self, state: Tuple[str, Position, Optional[int]]) -> None:
+        self.name, self.__position, self.__offset = state
+        self.__stream, self.__version = None, None
+
+def _is_context_sensitive(parsed: Any) -> bool:
+    # Anchors, word boundaries and lookbehinds look at the characters before the match, so they behave
+    # differently when matching in place instead of on a slice that starts at the match position.
+    for op, av in parsed:
+        if op is sre_parse.AT and av in (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING, sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY):
+            return True
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            direction, subpattern = av
+
+            if direction < 0 or _is_context_sensitive(subpattern):
+                return True
+        elif op is sre_parse.SUBPATTERN:
+            if _is_context_sensitive(av[-1]):
+                return True
+        elif op is sre_parse.BRANCH:
+            if any(_is_context_sensitive(branch) for branch in av[1]):
+                return True
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) or op.name == "POSSESSIVE_REPEAT":
+            if _is_context_sensitive(av[2]):
+                return True
+        elif op is sre_parse.GROUPREF_EXISTS:
+            if _is_context_sensitive(av[1]) or (av[2] is not None and _is_context_sensitive(av[2])):
+                return True
+        elif op.name == "ATOMIC_GROUP":
+            if _is_context_sensitive(av):
+                return True
+
+    return False
+
+def _has_group_references(parsed: Any) -> bool:
+    if len(parsed.state.groupdict) != 0:
+        return True
+
+    for op, av in parsed:
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            return True
+        elif op is sre_parse.SUBPATTERN:
+            subpatterns = [av[-1]]
+        elif op is sre_parse.BRANCH:
+            subpatterns = av[1]
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) or op.name == "POSSESSIVE_REPEAT":
+            subpatterns = [av[2]]
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            subpatterns = [av[1]]
+        elif op.name == "ATOMIC_GROUP":
+            subpatterns = [av]
+        else:
+            continue
+
+        if any(_has_group_references(subpattern) for subpattern in subpatterns):
+            return True
+
+    return False
+
+_MAX_FIRST_CHARS_RANGE = 256
+_SPACE_CHARS : FrozenSet[str] = frozenset(c for c in map(chr, range(0x3001)) if c.isspace())
+
+# Returns the characters a non-empty match can start with (None if any character might) and whether the pattern
+# can match the empty string. Zero-width assertions are treated as empty matches, so the set may be too large.
+def _first_chars(parsed: Any, flags: int) -> Tuple[Optional[Set[str]], bool]:
+    chars : Optional[Set[str]] = set()
+
+    for op, av in parsed:
+        item_chars : Optional[Set[str]] = None
+        item_nullable = False
+
+        if op is sre_parse.LITERAL:
+            item_chars = {chr(av)}
+        elif op is sre_parse.IN:
+            item_chars = set()
+
+            for set_op, set_av in av:
+                if set_op is sre_parse.LITERAL:
+                    item_chars.add(chr(set_av))
+                elif set_op is sre_parse.RANGE and set_av[1] - set_av[0] < _MAX_FIRST_CHARS_RANGE:
+                    item_chars.update(chr(c) for c in range(set_av[0], set_av[1] + 1))
+                elif set_op is sre_parse.CATEGORY and set_av in (sre_parse.CATEGORY_SPACE, sre_parse.CATEGORY_UNI_SPACE):
+                    item_chars.update(_SPACE_CHARS)
+                else:
+                    item_chars = None
+                    break
+        elif op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            item_chars, item_nullable = set(), True
+        elif op is sre_parse.SUBPATTERN:
+            item_chars, item_nullable = _first_chars(av[-1], (flags | av[1]) & ~av[2] if len(av) == 4 else flags)
+        elif op.name == "ATOMIC_GROUP":
+            item_chars, item_nullable = _first_chars(av, flags)
+        elif op is sre_parse.BRANCH:
+            item_chars = set()
+
+            for branch in av[1]:
+                branch_chars, branch_nullable = _first_chars(branch, flags)
+                item_nullable = item_nullable or branch_nullable
+                item_chars = None if item_chars is None or branch_chars is None else item_chars | branch_chars
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) or op.name == "POSSESSIVE_REPEAT":
+            item_chars, item_nullable = _first_chars(av[2], flags)
+            item_nullable = item_nullable or av[0] == 0
+        elif op is sre_parse.GROUPREF_EXISTS:
+            item_chars, item_nullable = _first_chars(av[1], flags)
+
+            if av[2] is None:
+                item_nullable = True
+            else:
+                no_chars, no_nullable = _first_chars(av[2], flags)
+                item_nullable = item_nullable or no_nullable
+                item_chars = None if item_chars is None or no_chars is None else item_chars | no_chars
+
+        # Unicode matching also folds characters that str's case mappings don't pair with each other (ſ and s, K and k,
+        # İ and i), so the first characters are only known when case folding is limited to ASCII
+        if item_chars is not None and flags & sre_parse.SRE_FLAG_IGNORECASE:
+            if flags & sre_parse.SRE_FLAG_ASCII:
+                item_chars = {variant for c in item_chars for variant in (c, c.lower(), c.upper())}
+            else:
+                item_chars = None
+
+        chars = None if chars is None or item_chars is None else chars | item_chars
+
+        if not item_nullable:
+            return chars, False
+
+    return chars, True
+
+_SINGLE_CHAR_OPS = (sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.IN, sre_parse.ANY, sre_parse.CATEGORY)
+
+# Returns the most characters a match can advance by and the most characters from where it starts it can look at, or
+# None if either is unbounded. $ also looks at whether a newline is the last character.
+def _extent(parsed: Any) -> Optional[Tuple[int, int]]:
+    advance, examined = 0, 0
+
+    for op, av in parsed:
+        item : Optional[Tuple[int, int]] = None
+
+        if op in _SINGLE_CHAR_OPS:
+            item = (1, 1)
+        elif op is sre_parse.AT:
+            item = (0, 2 if av is sre_parse.AT_END else 1)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            # Lookbehinds only look at text the match has already looked at
+            body = _extent(av[1]) if av[0] > 0 else (0, 0)
+            item = None if body is None else (0, body[1])
+        elif op is sre_parse.SUBPATTERN:
+            item = _extent(av[-1])
+        elif op.name == "ATOMIC_GROUP":
+            item = _extent(av)
+        elif op in (sre_parse.BRANCH, sre_parse.GROUPREF_EXISTS):
+            branches = [_extent(branch) if branch is not None else (0, 0) for branch in (av[1] if op is sre_parse.BRANCH else av[1:])]
+            item = None if any(branch is None for branch in branches) else (max(b[0] for b in branches if b is not None), max(b[1] for b in branches if b is not None))
+        elif (op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) or op.name == "POSSESSIVE_REPEAT") and av[1] is not sre_parse.MAXREPEAT:
+            body = _extent(av[2])
+            item = None if body is None else (av[1] * body[0], (av[1] - 1) * body[0] + body[1] if av[1] > 0 else 0)
+
+        if item is None:
+            return None
+
+        examined = max(examined, advance + item[1])
+        advance += item[0]
+
+    return advance, examined
+
+# How many characters past where a match ends, or past where the pattern starts if it fails, the pattern can look at,
+# or None if that is unbounded. A pattern ending in a greedy unbounded repeat of a single character stops at the first
+# character the repeat doesn't match, so it only looks past that as far as the pattern before the repeat can.
+def _lookahead(parsed: Any) -> Optional[int]:
+    items = list(parsed)
+
+    while len(items) == 1 and (items[0][0] is sre_parse.SUBPATTERN or items[0][0].name == "ATOMIC_GROUP"):
+        items = list(items[0][1][-1] if items[0][0] is sre_parse.SUBPATTERN else items[0][1])
+
+    extent = _extent(items)
+
+    if extent is not None:
+        return max(extent[1] - 1, 0)
+    elif len(items) == 0:
+        return None
+
+    op, av = items[-1]
+
+    if (op is sre_parse.MAX_REPEAT or op.name == "POSSESSIVE_REPEAT") and len(av[2]) == 1 and av[2][0][0] in _SINGLE_CHAR_OPS:
+        prefix = _extent(items[:-1])
+
+        if prefix is not None:
+            return max(prefix[1], prefix[0] + av[0], 1) - 1
+
+    return None
+
+# Everything the library needs to know about a pattern besides its compiled form. Analyses are shared by pattern, and
+# can be preloaded (see pylpc.cache) so that regexes are only parsed and compiled when they are first used.
+class RegexAnalysis(NamedTuple):
+    in_place : bool
+    self_contained : bool
+    first_chars : Optional[FrozenSet[str]]
+    nullable : bool
+    literal : Optional[str] = None
+    lookahead : Optional[int] = None
+
+_REGEX_ANALYSES : Dict[str, RegexAnalysis] = {}
+
+# The text the pattern matches if that is the only text it matches
+def _get_literal(parsed: Any) -> Optional[str]:
+    if parsed.state.flags & sre_parse.SRE_FLAG_IGNORECASE:
+        return None
+
+    # The pattern was parsed inside a group
+    subpattern = parsed[0][1][-1]
+
+    if len(subpattern) == 0 or any(op is not sre_parse.LITERAL for op, _ in subpattern):
+        return None
+
+    return "".join(chr(av) for _, av in subpattern)
+
+def _analyze_regex(pattern: str) -> RegexAnalysis:
+    parsed = sre_parse.parse(f"({pattern})")
+    in_place = not _is_context_sensitive(parsed)
+    chars, nullable = _first_chars(parsed, parsed.state.flags)
+    return RegexAnalysis(in_place, in_place and not _has_group_references(parsed), None if chars is None else frozenset(chars), nullable, _get_literal(parsed), _lookahead(parsed))
+
+# A match of a pattern that looks at the text before where it starts, which is found in the text from pos on as if it
+# started there. Its positions are moved to where they are in the whole string, like those of a match found in place.
+class ShiftedMatch:
+    __slots__ = ("__match", "__pos", "string")
+
+    def __init__(self, match: re.Match, string: str, pos: int) -> None:
+        self.__match : re.Match = match
+        self.__pos : int = pos
+        self.string : str = string
+
+    @property
+    def pos(self) -> int:
+        return self.__pos
+
+    @property
+    def endpos(self) -> int:
+        return len(self.string)
+
+    @property
+    def re(self) -> re.Pattern:
+        return self.__match.re
+
+    @property
+    def lastindex(self) -> Optional[int]:
+        return self.__match.lastindex
+
+    @property
+    def lastgroup(self) -> Optional[str]:
+        return self.__match.lastgroup
+
+    @property
+    def regs(self) -> Tuple[Tuple[int, int], ...]:
+        return tuple(self.span(group) for group in range(len(self.__match.regs)))
+
+    def __getitem__(self, group: Union[int, str]) -> Any:
+        return self.__match[group]
+
+    def group(self, *groups: Union[int, str]) -> Any:
+        return self.__match.group(*groups)
+
+    def groups(self, default: Any = None) -> Tuple[Any, ...]:
+        return self.__match.groups(default)
+
+    def groupdict(self, default: Any = None) -> Dict[str, Any]:
+        return self.__match.groupdict(default)
+
+    def expand(self, template: str) -> str:
+        return self.__match.expand(template)
+
+    # Groups that didn't take part in the match stay at -1
+    def start(self, group: Union[int, str] = 0) -> int:
+        start = self.__match.start(group)
+        return start if start < 0 else start + self.__pos
+
+    def end(self, group: Union[int, str] = 0) -> int:
+        end = self.__match.end(group)
+        return end if end < 0 else end + self.__pos
+
+    def span(self, group: Union[int, str] = 0) -> Tuple[int, int]:
+        return self.start(group), self.end(group)
+
+    def __repr__(self) -> str:
+        return f"<ShiftedMatch object; span={self.span()!r}, match={self.__match[0]!r}>"
+
+# What Regex.match returns: positions are always in the string that was passed to it
+RegexMatch = Union[re.Match, ShiftedMatch]
+
 class Regex:
+    # Parsed and compiled on first use, so building a large grammar doesn't pay for patterns it never matches
     def __init__(self, pattern: str = "") -> None:
         self.__pattern : str = pattern
-        self.__regex : re.Pattern = re.compile(f"^({self.__pattern})")
+        self.__regex : Optional[re.Pattern] = None
+        self.__analysis : Optional[RegexAnalysis] = None
+        self.__in_place : bool = True
+
+    def get_analysis(self) -> RegexAnalysis:
+        if self.__analysis is None:
+            analysis = _REGEX_ANALYSES.get(self.__pattern)
+
+            if analysis is None:
+                analysis = _REGEX_ANALYSES[self.__pattern] = _analyze_regex(self.__pattern)
+
+            self.__analysis = analysis
+
+        return self.__analysis
+
+    @staticmethod
+    def get_analyses() -> Dict[str, RegexAnalysis]:
+        return dict(_REGEX_ANALYSES)
+
+    @staticmethod
+    def add_analyses(analyses: Dict[str, RegexAnalysis]) -> None:
+        _REGEX_ANALYSES.update(analyses)
+
+    # The characters a non-empty match can start with, or None if it could start with any character
+    def get_first_chars(self) -> Optional[FrozenSet[str]]:
+        return self.get_analysis().first_chars
+
+    def is_nullable(self) -> bool:
+        return self.get_analysis().nullable
+
+    # The text the pattern matches if it can match nothing else, like a keyword or an escaped operator
+    def get_literal(self) -> Optional[str]:
+        return self.get_analysis().literal
+
+    # How far past the end of a match, or past where it was tried if it failed, the pattern can look, or None if that
+    # isn't bounded
+    def get_lookahead(self) -> Optional[int]:
+        return self.get_analysis().lookahead
+
+    # Whether the pattern can be embedded in a larger one unchanged: it doesn't look at the text before the match and
+    # doesn't refer to groups by number or name
+    def is_self_contained(self) -> bool:
+        return self.get_analysis().self_contained
 
-    def match(self, string: str) -> Optional[re.Match]:
-        return self.__regex.search(string)
+    def __compile(self) -> re.Pattern:
+        self.__in_place = self.get_analysis().in_place
+        self.__regex = re.compile(f"({self.__pattern})")
+        return self.__regex
+
+    # Matches as if string started at pos. Patterns that look at the text before the match are matched on the rest of
+    # the string, and their matches are shifted back to positions in string.
+    def match(self, string: str, pos: int = 0) -> Optional[RegexMatch]:
+        regex = self.__regex if self.__regex is not None else self.__compile()
+
+        if self.__in_place or pos == 0:
+            return regex.match(string, pos)
+
+        regex_match = regex.match(string[pos:])
+        return None if regex_match is None else ShiftedMatch(regex_match, string, pos)
 
     def get_pattern(self) -> str:
         return self.__pattern
 
+    # The furthest offset in string that matching at pos may have looked at, given the match it returned. Patterns that
+    # can look arbitrarily far are taken to have looked at all of it, unless they failed on a character they can't
+    # start with.
+    def _get_reach(self, string: str, pos: int, regex_match: Optional[RegexMatch]) -> int:
+        analysis = self.__analysis if self.__analysis is not None else self.get_analysis()
+
+        if analysis.lookahead is not None:
+            return (pos if regex_match is None else pos + len(regex_match[0])) + analysis.lookahead
+        elif regex_match is None and analysis.first_chars is not None and not analysis.nullable and string[pos:pos + 1] not in analysis.first_chars:
+            return pos
+
+        return len(string)
+
+    # The fastest callable that behaves like match(), for code that matches many times
+    def _get_matcher(self) -> Callable[[str, int], Optional[RegexMatch]]:
+        regex = self.__regex if self.__regex is not None else self.__compile()
+        return regex.match if self.__in_place else self.match
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Regex) and self.__pattern == other.get_pattern()
+
+    def __hash__(self) -> int:
+        return hash(self.__pattern)
+
+    def __repr__(self) -> str:
+        return f"Regex({self.__pattern!r})"
+
+@dataclass
+class CacheStats:
+    hits : int = 0
+    misses : int = 0
+    evictions : int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return 0.0 if lookups == 0 else self.hits / lookups
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+# Entries are evicted least recently used first once there are more than max_size of them, and every entry before
+# a committed offset is dropped since the parser will never backtrack there again.
+# Once the text has been edited, entries from the end of the last edit on are stored at their offset less the length of
+# the text plus one, so the edits before them don't change their keys, and two heaps find the entries the next edit
+# changes: one of how far the entries before the end of the last edit looked and one of where the entries after it
+# start. An edit then only visits the entries between it and the last one and those that looked at it.
+class OffsetCache(ABC, Generic[K, V]):
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        if max_size is not None and max_size <= 0:
+            raise ValueError("max_size must be positive")
+
+        self.__max_size : Optional[int] = max_size
+        self.__entries : OrderedDict[K, V] = OrderedDict()
+        self.__committed : int = 0
+        self.__stats : CacheStats = CacheStats()
+        self.__gap : int = sys.maxsize
+        self.__end : int = 0
+        self.__reaches : Optional[List[Tuple[int, int, K]]] = None
+        self.__starts : List[Tuple[int, int, K]] = []
+        self.__pushes : Iterator[int] = itertools.count()
+
+    # The offset in a key, which is stored less the end for entries after the last edit
+    @abstractmethod
+    def _get_offset(self, key: K) -> int:
+        ...
+
+    # How far past its offset the entry looked, or None if that isn't known
+    @abstractmethod
+    def _get_reach(self, entry: V) -> Optional[int]:
+        ...
+
+    # The key moved by delta characters
+    @abstractmethod
+    def _shift(self, key: K, delta: int) -> K:
+        ...
+
+    def _lookup(self, key: K, offset: int) -> Optional[V]:
+        if offset >= self.__gap:
+            key = self._shift(key, -self.__end)
+
+        entry = self.__entries.get(key)
+
+        if entry is None:
+            self.__stats.misses += 1
+        else:
+            self.__stats.hits += 1
+
+            if self.__max_size is not None:
+                self.__entries.move_to_end(key)
+
+        return entry
+
+    def _peek(self, key: K, offset: int) -> Optional[V]:
+        return self.__entries.get(key if offset < self.__gap else self._shift(key, -self.__end))
+
+    def _store(self, key: K, offset: int, entry: V) -> None:
+        if offset < self.__committed:
+            return
+
+        if offset >= self.__gap:
+            key = self._shift(key, -self.__end)
+
+        self.__entries[key] = entry
+
+        if self.__reaches is not None:
+            self.__index(self.__reaches, key, offset, entry)
+
+        if self.__max_size is not None and len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+            self.__stats.evictions += 1
+
+    # Adds the entry to the heap for its side of the last edit. Entries that are gone stay in the heaps until they're
+    # popped, so the heaps are rebuilt once they hold more than twice as many.
+    def __index(self, reaches: List[Tuple[int, int, K]], key: K, offset: int, entry: V) -> None:
+        if offset < self.__gap:
+            reach = self._get_reach(entry)
+            heappush(reaches, (-sys.maxsize if reach is None else -offset - reach, next(self.__pushes), key))
+        else:
+            heappush(self.__starts, (offset - self.__end, next(self.__pushes), key))
+
+        if len(reaches) + len(self.__starts) > 2 * len(self.__entries) + 64:
+            self.__reindex()
+
+    def __reindex(self) -> None:
+        self.__reaches, self.__starts = [], []
+
+        for key, entry in self.__entries.items():
+            offset = self._get_offset(key)
+
+            if offset >= 0:
+                reach = self._get_reach(entry)
+                self.__reaches.append((-sys.maxsize if reach is None else -offset - reach, next(self.__pushes), key))
+            else:
+                self.__starts.append((offset, next(self.__pushes), key))
+
+        heapify(self.__reaches)
+        heapify(self.__starts)
+
+    def commit(self, offset: int) -> None:
+        if offset <= self.__committed:
+            return
+
+        self.__committed = offset
+        stale = []
+
+        for key in self.__entries:
+            stored = self._get_offset(key)
+
+            if (stored if stored >= 0 else stored + self.__end) < offset:
+                stale.append(key)
+
+        for key in stale:
+            del self.__entries[key]
+
+        self.__stats.evictions += len(stale)
+
+    def get_committed(self) -> int:
+        return self.__committed
+
+    # Lowers the committed offset again once the commit has been undone. What was dropped before it stays dropped.
+    def _uncommit(self, offset: int) -> None:
+        if offset < self.__committed:
+            self.__committed = offset
+
+    # Keeps the entries that an edit replacing the text in [start, end) with text delta characters longer, leaving it
+    # length characters long, can't have changed: the ones before it that stopped looking before it, and, moved by
+    # delta, the ones starting after it. The next parse starts over, so the committed offset is reset.
+    def edit(self, start: int, end: int, delta: int, length: int) -> None:
+        entries, count = self.__entries, len(self.__entries)
+        get_offset, get_reach, shift = self._get_offset, self._get_reach, self._shift
+        moved : List[Tuple[K, int, V]] = []
+
+        if self.__reaches is None:
+            self.__reaches = []
+
+            for key, value in entries.items():
+                reach = get_reach(value)
+                self.__reaches.append((-sys.maxsize if reach is None else -get_offset(key) - reach, next(self.__pushes), key))
+
+            heapify(self.__reaches)
+
+        reaches, starts = self.__reaches, self.__starts
+
+        while len(reaches) != 0 and -reaches[0][0] >= start:
+            key = heappop(reaches)[2]
+            entry = entries.get(key)
+
+            if entry is not None:
+                offset, reach = get_offset(key), get_reach(entry)
+
+                if offset >= end:
+                    del entries[key]
+                    moved.append((shift(key, delta), offset + delta, entry))
+                elif reach is None or offset + reach >= start:
+                    del entries[key]
+
+        while len(starts) != 0 and starts[0][0] + self.__end < end:
+            key = heappop(starts)[2]
+            entry = entries.pop(key, None)
+
+            if entry is not None:
+                offset, reach = get_offset(key) + self.__end, get_reach(entry)
+
+                if offset < start and reach is not None and offset + reach < start:
+                    moved.append((shift(key, self.__end), offset, entry))
+
+        self.__gap, self.__end, self.__committed = end + delta, length + 1, 0
+
+        for key, offset, entry in moved:
+            self._store(key, offset, entry)
+
+        self.__stats.evictions += count - len(entries)
+
+    def clear(self) -> None:
+        self.__entries.clear()
+        self.__gap, self.__end, self.__reaches, self.__starts = sys.maxsize, 0, None, []
+
+    def get_max_size(self) -> Optional[int]:
+        return self.__max_size
+
+    def get_stats(self) -> CacheStats:
+        return self.__stats
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+# The stored result (or the error it failed with) and the offset the stream was left at
+MemoEntry = Tuple[Union['ParseResult[Any]', 'ParseFailure'], int]
+
+# What the memo table keeps of an entry: the result, how far past its offset the stream was left and how far past it
+# the parse that made it looked, which decides whether it survives an edit before its offset. Entries stored without
+# a reach don't.
+MemoRecord = Tuple[Union['ParseResult[Any]', 'ParseFailure'], int, Optional[int]]
+
+class MemoTable(OffsetCache[Tuple[int, Hashable], MemoRecord]):
+    def _get_offset(self, key: Tuple[int, Hashable]) -> int:
+        return key[0]
+
+    def _get_reach(self, entry: MemoRecord) -> Optional[int]:
+        return entry[2]
+
+    def _shift(self, key: Tuple[int, Hashable], delta: int) -> Tuple[int, Hashable]:
+        return (key[0] + delta, key[1])
+
+    def get(self, key: Hashable, offset: int) -> Optional[MemoEntry]:
+        record = self._lookup((offset, key), offset)
+        return None if record is None else (record[0], offset + record[1])
+
+    def _get_record(self, key: Hashable, offset: int) -> Optional[MemoRecord]:
+        return self._lookup((offset, key), offset)
+
+    # The reach is the furthest offset the parse looked at, see StringStream._start_reach
+    def set(self, key: Hashable, offset: int, entry: MemoEntry, reach: Optional[int] = None) -> None:
+        result, end = entry
+        self._store((offset, key), offset, (result, end - offset, None if reach is None else reach - offset))
+
+# Tokens are kept with how far past their offset lexing them looked, like memo entries
+class TokenCache(OffsetCache[int, Tuple['StringStream.Token', Optional[int]]]):
+    def _get_offset(self, key: int) -> int:
+        return key
+
+    def _get_reach(self, entry: Tuple['StringStream.Token', Optional[int]]) -> Optional[int]:
+        return entry[1]
+
+    def _shift(self, key: int, delta: int) -> int:
+        return key + delta
+
+    def get(self, offset: int) -> Optional['StringStream.Token']:
+        entry = self._lookup(offset, offset)
+        return None if entry is None else entry[0]
+
+    def peek(self, offset: int) -> Optional['StringStream.Token']:
+        entry = self._peek(offset, offset)
+        return None if entry is None else entry[0]
+
+    def _get_entry(self, offset: int) -> Optional[Tuple['StringStream.Token', Optional[int]]]:
+        return self._lookup(offset, offset)
+
+    def _peek_entry(self, offset: int) -> Optional[Tuple['StringStream.Token', Optional[int]]]:
+        return self._peek(offset, offset)
+
+    def set(self, offset: int, token: 'StringStream.Token', reach: Optional[int] = None) -> None:
+        self._store(offset, offset, (token, None if reach is None else reach - offset))
+
 class StringStream:
     @dataclass(frozen=True)
     class Token:
@@ -42,13 +763,21 @@ class StringStream:
     def __init__(self, data: str, name: Optional[str] = None) -> None:
         self.__name : str = "" if name is None else name
         self.__data : str = data
+        self.__length : int = len(data)
         self.__offset : int = 0
-        self.__tokens : Dict[int, StringStream.Token] = {}
-        self.__line_starts : List[int] = [0]
-
-        for i, c in enumerate(data):
-            if c == '\n':
-                self.__line_starts.append(i + 1)
+        self.__tokens : TokenCache = TokenCache()
+        self.__memo_table : Optional[MemoTable] = None
+        self.__line_starts : Optional[array] = None
+        self.__line_cursor : int = 0
+        self.__line_shift : Tuple[int, int] = (0, 0)
+        self.__furthest : int = 0
+        self.__reach : int = 0
+        self.__measuring : int = 0
+        self.__growing : int = 0
+        self.__involved : int = 0
+        self.__commits : int = 0
+        self.__committed : int = 0
+        self.__edit : _Edit = _Edit()
 
     def get(self) -> char:
         if self.is_eos():
@@ -56,6 +785,10 @@ class StringStream:
         else:
             c : char = self.__data[self.__offset]
             self.__offset += 1
+
+            if self.__offset > self.__furthest:
+                self.__furthest = self.__offset
+
             return c
 
     def peek(self) -> char:
@@ -64,75 +797,303 @@ class StringStream:
         self.__offset = init_offset
         return peeked
 
+    def match(self, regex: Regex) -> Optional[RegexMatch]:
+        regex_match = regex.match(self.__data, self.__offset)
+
+        if self.__measuring != 0:
+            reach = regex._get_reach(self.__data, self.__offset, regex_match)
+
+            if reach > self.__reach:
+                self.__reach = reach
+
+        return regex_match
+
     def ignore(self, amt: int) -> None:
         assert amt >= 0
-        self.__offset = min(len(self.__data), self.__offset + amt)
+        self.__offset = min(self.__length, self.__offset + amt)
+
+        if self.__offset > self.__furthest:
+            self.__furthest = self.__offset
 
     def get_token(self) -> Optional[Token]:
-        token = self.__tokens.get(self.__offset)
-        
-        if token is not None:
-            self.ignore(len(token.value))
+        offset = self.__offset
+        entry = self.__tokens._get_entry(offset)
 
+        if entry is None:
+            return None
+
+        token, reach = entry
+        self.ignore(len(token.value))
+        self._look_at(self.__length if reach is None else offset + reach)
         return token
 
     def peek_token(self) -> Optional[Token]:
-        return self.__tokens.get(self.__offset)
+        entry = self.__tokens._peek_entry(self.__offset)
+
+        if entry is None:
+            return None
+
+        token, reach = entry
+        self._look_at(self.__length if reach is None else self.__offset + reach)
+        return token
+
+    # The reach is the furthest offset lexing the token looked at, see _start_reach
+    def set_token(self, position: Union[Position, int], length: int, id: int, reach: Optional[int] = None) -> Token:
+        offset = position if isinstance(position, int) else self.get_offset_from_pos(position)
+        token = StringStream.Token(id, self.get_location(offset), self.get_data(offset, length))
+
+        self.__tokens.set(offset, token, reach)
+        return token
+
+    # Caches the token that scan, which gives its pattern index and length without moving the stream, finds at the
+    # offset, with how far scanning looked. Does what _start_reach and _get_reach_since do, without the calls.
+    def _lex_token(self, scan: Callable[['StringStream'], Tuple[int, int]]) -> Token:
+        offset, furthest, reach = self.__offset, self.__furthest, self.__reach
+        self.__furthest = self.__reach = offset
+        self.__measuring += 1
+        idx, length = scan(self)
+        self.__measuring -= 1
 
-    def set_token(self, position: Position, length: int, id: int) -> Token:
-        offset = self.get_offset_from_pos(position)
-        token = StringStream.Token(id, Location(self.__name, position), self.get_data(offset, length))
+        looked = max(self.__furthest, self.__reach, offset + length)
+        self.__furthest = furthest if furthest > self.__furthest else self.__furthest
+        self.__reach = reach if reach > looked else looked
 
-        self.__tokens[offset] = token
+        token = StringStream.Token(idx, self.get_location(offset), self.get_data(offset, length))
+        self.__tokens.set(offset, token, looked)
         return token
 
     def clear_tokens(self) -> None:
         self.__tokens.clear()
 
+    def get_token_cache(self) -> TokenCache:
+        return self.__tokens
+
+    def set_token_cache(self, cache: TokenCache) -> None:
+        self.__tokens = cache
+
+    def get_memo_table(self) -> MemoTable:
+        if self.__memo_table is None:
+            self.__memo_table = MemoTable()
+
+        return self.__memo_table
+
+    def set_memo_table(self, table: MemoTable) -> None:
+        self.__memo_table = table
+
+    def commit(self, offset: Optional[int] = None) -> None:
+        offset = self.__offset if offset is None else offset
+        self.__commits += 1
+        self.__committed = max(self.__committed, offset)
+        self.__tokens.commit(offset)
+
+        if self.__memo_table is not None:
+            self.__memo_table.commit(offset)
+
     def get_name(self) -> str:
         return self.__name
 
+    # Replaces the deleted characters at offset with the inserted text. The line index, the token cache and the memo
+    # table are updated instead of being rebuilt, keeping the tokens and results that start after the edit, so parsing
+    # the stream again reuses them once it gets past it. Locations and offsets from before the edit that are reached
+    # through those results are moved past it.
+    def edit(self, offset: int, deleted: int, inserted: str) -> None:
+        if offset < 0 or deleted < 0 or offset + deleted > self.__length:
+            raise Exception("Parameters out of range of data!")
+
+        end, delta = offset + deleted, len(inserted) - deleted
+        self.__data = self.__data[:offset] + inserted + self.__data[end:]
+        self.__length = len(self.__data)
+
+        # The line starts after the edit aren't moved one by one, only those between it and the last edit are, so
+        # edits close to each other cost about as much as the text they change
+        if self.__line_starts is not None:
+            line_starts = self.__line_starts
+            first, last = self.__find_line(offset) + 1, self.__find_line(end) + 1
+            shifted, shift = self.__line_shift
+
+            if shift != 0 and shifted < first:
+                line_starts[shifted:first] = array('q', [start + shift for start in line_starts[shifted:first]])
+            elif shift != 0 and shifted > last:
+                line_starts[last:shifted] = array('q', [start - shift for start in line_starts[last:shifted]])
+
+            inserted_starts = array('q', [offset + newline.end() for newline in _NEWLINE.finditer(inserted)])
+            line_starts[first:last] = inserted_starts
+            self.__line_shift = (first + len(inserted_starts), shift + delta)
+            self.__line_cursor = 0
+
+        self.__tokens.edit(offset, end, delta, self.__length)
+
+        if self.__memo_table is not None:
+            self.__memo_table.edit(offset, end, delta, self.__length)
+
+        edit = self.__edit
+        edit.start, edit.end, edit.delta = offset, end, delta
+        edit.next = self.__edit = _Edit()
+        self.__offset = self.__furthest = self.__reach = edit.follow(self.__offset)[0]
+        self.__committed = 0
+
+    # Where the stream's next edit goes, which locations keep to tell whether they need to be moved
+    def _get_version(self) -> _Edit:
+        return self.__edit
+
+    # The furthest offset the stream has been at, which the profiler uses to tell whether a failed parse backtracked
+    def _get_furthest(self) -> int:
+        return self.__furthest
+
+    def _set_furthest(self, offset: int) -> None:
+        self.__furthest = offset
+
+    # Records that the text up to offset was looked at without the stream moving there, like a regex looking ahead
+    def _look_at(self, offset: int) -> None:
+        if offset > self.__reach:
+            self.__reach = offset
+
+    # Starts measuring how far the stream is looked at from its offset on, for cached entries, which are kept across
+    # an edit after them only if it couldn't have changed them. Returns what _get_reach_since needs to stop. Regexes
+    # are only asked how far they looked while something is measuring.
+    def _start_reach(self) -> Tuple[int, int]:
+        saved = (self.__furthest, self.__reach)
+        self.__furthest = self.__reach = self.__offset
+        self.__measuring += 1
+        return saved
+
+    # The furthest offset looked at since _start_reach, which is also counted as looked at by whatever enclosing parse
+    # started measuring before it
+    def _get_reach_since(self, saved: Tuple[int, int]) -> int:
+        furthest, reach = self.__furthest, self.__reach
+        reach = furthest if furthest > reach else reach
+
+        if saved[0] > furthest:
+            self.__furthest = saved[0]
+
+        self.__reach = saved[1] if saved[1] > reach else reach
+        self.__measuring -= 1
+        return reach
+
+    # How many left-recursive rules are growing seeds, and the shallowest of them whose seed the parse at the innermost
+    # one has used. A result that used the seed of an enclosing rule is only valid for that iteration of it.
+    def _get_growing(self) -> Tuple[int, int]:
+        return self.__growing, self.__involved
+
+    def _set_growing(self, depth: int, involved: int) -> None:
+        self.__growing, self.__involved = depth, involved
+
+    # How many commits have been made, which Longest compares to tell whether an alternative crossed one, and the
+    # offset committed to. A Try that catches a failure puts both back, since the parse goes on as if they weren't made.
+    def _get_commits(self) -> Tuple[int, int]:
+        return self.__commits, self.__committed
+
+    def _set_commits(self, commits: Tuple[int, int]) -> None:
+        self.__commits, committed = commits
+
+        if committed < self.__committed:
+            self.__committed = committed
+            self.__tokens._uncommit(committed)
+
+            if self.__memo_table is not None:
+                self.__memo_table._uncommit(committed)
+
+    def get_length(self) -> int:
+        return self.__length
+
+    # For streams that don't keep their data in memory and override the methods that read it
+    def _set_length(self, length: int) -> None:
+        self.__length = length
+        self.__offset = min(self.__offset, length)
+
     def get_offset(self) -> int:
         return self.__offset
 
+    # The whole input, for code that reads it directly; None for streams that don't keep it in memory
+    def _get_buffer(self) -> Optional[str]:
+        return self.__data
+
+    # Up to length characters from offset on, for code that compares them directly when there is no buffer
+    def _read_chars(self, offset: int, length: int) -> str:
+        return self.get_data(offset, min(length, self.get_length() - offset))
+
+    # Built on the first position request since many parses never need one unless an error occurs. The starts of the
+    # lines from the first one in line_shift on are stored the second one less than they are.
+    def __get_line_starts(self) -> array:
+        if self.__line_starts is None:
+            self.__line_starts = array('q', [0])
+            self.__line_starts.extend([newline.end() for newline in _NEWLINE.finditer(self.__data)])
+
+        return self.__line_starts
+
+    def __get_line_start(self, line: int) -> int:
+        shifted, shift = self.__line_shift
+        return self.__get_line_starts()[line] + (shift if line >= shifted else 0)
+
+    # The index of the line the offset is on
+    def __find_line(self, offset: int) -> int:
+        line_starts = self.__get_line_starts()
+        shifted, shift = self.__line_shift
+
+        if shifted < len(line_starts) and line_starts[shifted] + shift <= offset:
+            return bisect_right(line_starts, offset - shift, shifted) - 1
+
+        return bisect_right(line_starts, offset, 0, shifted) - 1
+
     def get_offset_from_pos(self, pos: Position) -> int:
         assert pos.line >= 1 and pos.column >= 1
 
-        if pos.line > len(self.__line_starts) or pos.line == 0 or pos.column == 0:
+        num_lines = len(self.__get_line_starts())
+
+        if pos.line > num_lines or pos.line == 0 or pos.column == 0:
             raise Exception("Invalid position: " + str(pos))
 
-        line_start : int = self.__line_starts[pos.line - 1]
-        line_width : int = (len(self.__data) if pos.line == len(self.__line_starts) else self.__line_starts[pos.line]) - line_start
+        line_start : int = self.__get_line_start(pos.line - 1)
+        line_width : int = (self.__length if pos.line == num_lines else self.__get_line_start(pos.line)) - line_start
 
         if pos.column - 1 > line_width:
             raise Exception("Invalid position: " + str(pos))
 
         return line_start + pos.column - 1
 
+    def get_offset_from_location(self, loc: Location) -> int:
+        return self.get_offset_from_pos(loc.position) if loc.offset is None else loc.offset
+
+    def get_location(self, offset: Optional[int] = None) -> Location:
+        return Location(self.__name, None, self, self.__offset if offset is None else offset)
+
     def get_position(self) -> Position:
         return self.get_position_from_offset(self.__offset)
 
     def get_position_from_offset(self, offset: int) -> Position:
         assert offset >= 0
 
-        if offset > len(self.__data):
+        if offset > self.__length:
             raise Exception("Offset is out of range of data!")
 
-        line : int = 0
-        closest_line_start : int = 0
+        line_starts = self.__get_line_starts()
 
-        for line_start in self.__line_starts:
-            if line_start > offset:
-                break
+        if self.__line_shift[1] != 0:
+            line = self.__find_line(offset)
+            return Position(line + 1, offset - self.__get_line_start(line) + 1)
+
+        line = self.__line_cursor
+        num_lines = len(line_starts)
+
+        # Offsets mostly move forward by a little, so check the cached line and the one after it before searching
+        if line_starts[line] <= offset:
+            if line + 1 < num_lines and line_starts[line + 1] <= offset:
+                line += 1
 
-            closest_line_start = line_start
-            line += 1
+                if line + 1 < num_lines and line_starts[line + 1] <= offset:
+                    line = bisect_right(line_starts, offset) - 1
+        else:
+            line = bisect_right(line_starts, offset) - 1
 
-        return Position(line, offset - closest_line_start + 1)
+        self.__line_cursor = line
+        return Position(line + 1, offset - line_starts[line] + 1)
 
     def set_offset(self, offset: int) -> None:
         assert offset >= 0
-        self.__offset = min(offset, len(self.__data))
+        self.__offset = min(offset, self.__length)
+
+        if self.__offset > self.__furthest:
+            self.__furthest = self.__offset
 
     def set_position(self, pos: Position) -> None:
         assert pos.line >= 1 and pos.column >= 1
@@ -142,48 +1103,384 @@ class StringStream:
         assert start >= 0 and (length is None or length >= 0)
         
         if length is None:
-            length = len(self.__data) - start
+            length = self.__length - start
 
-        if start + length > len(self.__data):
+        if start + length > self.__length:
             raise Exception("Parameters out of range of data!")
 
+        if start + length > self.__reach:
+            self.__reach = start + length
+
         return self.__data[start:start + length]
 
     def is_eos(self) -> bool:
-        return self.__offset >= len(self.__data)
+        return self.__offset >= self.__length
+
+class FileStream(StringStream):
+    # Reads the file through a memory map and only decodes the chunks around the current offset. Chunks end on line
+    # boundaries and the chunk index records where each one starts in bytes, characters and lines, so it can be built
+    # with bulk scans of the raw bytes. The encoding must be ASCII compatible so newlines can be found in the bytes.
+    def __init__(self, path: str, name: Optional[str] = None, encoding: str = "utf-8", chunk_size: int = 1 << 20) -> None:
+        if "\n".encode(encoding) != b"\n" or "a".encode(encoding) != b"a":
+            raise ValueError(f"Encoding must be ASCII compatible: {encoding}")
+        elif chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+
+        super().__init__("", path if name is None else name)
+
+        self.__file : BinaryIO = open(path, "rb")
+        size = os.fstat(self.__file.fileno()).st_size
+        self.__buffer : Union[mmap.mmap, bytes] = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b""
+        self.__encoding : str = encoding
+        self.__chunk_chars : List[int] = [0]
+        self.__chunk_bytes : List[int] = [0]
+        self.__chunk_lines : List[int] = [0]
+        self.__window : str = ""
+        self.__window_start : int = 0
+        self.__window_chunks : Tuple[int, int] = (0, 0)
+
+        while self.__chunk_bytes[-1] < size:
+            start = self.__chunk_bytes[-1]
+            end = min(start + chunk_size, size)
+
+            if end < size:
+                newline = self.__buffer.rfind(b"\n", start, end)
+
+                if newline == -1:
+                    newline = self.__buffer.find(b"\n", end)
+
+                end = size if newline == -1 else newline + 1
+
+            block = self.__buffer[start:end]
+            self.__chunk_bytes.append(end)
+            self.__chunk_chars.append(self.__chunk_chars[-1] + (len(block) if block.isascii() else len(block.decode(encoding))))
+            self.__chunk_lines.append(self.__chunk_lines[-1] + block.count(b"\n"))
+
+        self._set_length(self.__chunk_chars[-1])
+
+    def close(self) -> None:
+        if isinstance(self.__buffer, mmap.mmap):
+            self.__buffer.close()
+
+        self.__file.close()
+
+    def __enter__(self) -> 'FileStream':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def get_num_chunks(self) -> int:
+        return len(self.__chunk_chars) - 1
+
+    def __get_chunk(self, offset: int) -> int:
+        return min(bisect_right(self.__chunk_chars, offset), len(self.__chunk_chars) - 1) - 1
+
+    def __load(self, first: int, last: int) -> None:
+        if self.__window_chunks != (first, last):
+            self.__window = self.__buffer[self.__chunk_bytes[first]:self.__chunk_bytes[last]].decode(self.__encoding)
+            self.__window_start = self.__chunk_chars[first]
+            self.__window_chunks = (first, last)
+
+    # Makes sure the window holds the chunk with the offset and the chunk after it, so matches can look ahead
+    def __load_around(self, offset: int) -> None:
+        first, last = self.__window_chunks
+        safe_end = self.get_length() + 1 if last == self.get_num_chunks() else self.__chunk_chars[last - 1]
+
+        if first == last or not (self.__chunk_chars[first] <= offset < safe_end):
+            first = self.__get_chunk(offset)
+            self.__load(first, min(first + 2, self.get_num_chunks()))
+
+    def __get_chunk_text(self, chunk: int) -> str:
+        first, last = self.__window_chunks
+
+        if first <= chunk < last:
+            start = self.__chunk_chars[chunk] - self.__window_start
+            return self.__window[start:start + self.__chunk_chars[chunk + 1] - self.__chunk_chars[chunk]]
+
+        return self.__buffer[self.__chunk_bytes[chunk]:self.__chunk_bytes[chunk + 1]].decode(self.__encoding)
+
+    def get(self) -> char:
+        c = self.peek()
+        self.ignore(len(c))
+        return c
+
+    def peek(self) -> char:
+        if self.is_eos():
+            return EOF
+
+        offset = self.get_offset()
+        self.__load_around(offset)
+        return self.__window[offset - self.__window_start]
+
+    # Returned matches are relative to the decoded window, so only the matched text should be relied on. The window is
+    # widened until the result can't depend on the text after it: until it holds as much as the pattern can look at if
+    # that is bounded, and otherwise until the pattern matches before the window's end or fails on a character it can't
+    # start with. Unbounded patterns that fail after their first character are retried up to the end of the file.
+    def match(self, regex: Regex) -> Optional[RegexMatch]:
+        offset = self.get_offset()
+        self.__load_around(offset)
+        window = self.__window_chunks
+        regex_match = regex.match(self.__window, offset - self.__window_start)
+
+        while self.__depends_on_rest(regex, offset, regex_match):
+            first, last = self.__window_chunks
+            self.__load(first, min(2 * last - first, self.get_num_chunks()))
+            regex_match = regex.match(self.__window, offset - self.__window_start)
+
+        # Widening the window only lasts for this match, so long matches don't leave the rest of the file decoded
+        if self.__window_chunks != window:
+            self.__load(*window)
+
+        return regex_match
+
+    def __depends_on_rest(self, regex: Regex, offset: int, regex_match: Optional[RegexMatch]) -> bool:
+        last = self.__window_chunks[1]
+
+        if last == self.get_num_chunks():
+            return False
+
+        analysis, window_end = regex.get_analysis(), self.__chunk_chars[last]
+
+        if analysis.lookahead is not None:
+            return (offset if regex_match is None else offset + len(regex_match[0])) + analysis.lookahead >= window_end
+        elif regex_match is not None:
+            return offset + len(regex_match[0]) >= window_end
+
+        first_chars = analysis.first_chars
+        return first_chars is None or analysis.nullable or self.__window[offset - self.__window_start] in first_chars
+
+    def _get_buffer(self) -> Optional[str]:
+        return None
+
+    def edit(self, offset: int, deleted: int, inserted: str) -> None:
+        raise Exception("A FileStream can't be edited")
+
+    def get_data(self, start: int = 0, length: Optional[int] = None) -> str:
+        assert start >= 0 and (length is None or length >= 0)
+
+        if length is None:
+            length = self.get_length() - start
+
+        if start + length > self.get_length():
+            raise Exception("Parameters out of range of data!")
+
+        window_offset = start - self.__window_start
+
+        if window_offset < 0 or window_offset + length > len(self.__window):
+            self.__load(self.__get_chunk(start), self.__get_chunk(max(start, start + length - 1)) + 1)
+            window_offset = start - self.__window_start
+
+        return self.__window[window_offset:window_offset + length]
+
+    def get_offset_from_pos(self, pos: Position) -> int:
+        assert pos.line >= 1 and pos.column >= 1
+
+        if pos.line > self.__chunk_lines[-1] + 1:
+            raise Exception("Invalid position: " + str(pos))
+
+        # Chunks end after a newline, so the line starts in the last chunk that starts at or before it
+        chunk = max(min(bisect_right(self.__chunk_lines, pos.line - 1), self.get_num_chunks()) - 1, 0)
+        text = self.__get_chunk_text(chunk) if chunk < self.get_num_chunks() else ""
+        line_start = 0
+
+        for _ in range(pos.line - 1 - self.__chunk_lines[chunk]):
+            line_start = text.index("\n", line_start) + 1
+
+        line_end = text.find("\n", line_start)
+        line_width = (len(text) if line_end == -1 else line_end + 1) - line_start
+
+        if pos.column - 1 > line_width:
+            raise Exception("Invalid position: " + str(pos))
+
+        return self.__chunk_chars[chunk] + line_start + pos.column - 1
+
+    def get_position_from_offset(self, offset: int) -> Position:
+        assert offset >= 0
+
+        if offset > self.get_length():
+            raise Exception("Offset is out of range of data!")
+
+        chunk = self.__get_chunk(offset)
+
+        if chunk < 0:
+            return Position(1, 1)
+
+        text = self.__get_chunk_text(chunk)
+        column_offset = offset - self.__chunk_chars[chunk]
+
+        return Position(self.__chunk_lines[chunk] + text.count("\n", 0, column_offset) + 1, column_offset - text.rfind("\n", 0, column_offset))
+
+# Applies the ParseError trace caps to a trace and returns it along with the resulting depth. Over-deep entries have
+# their own message elided and their trace spliced in, so both the outermost context and the innermost cause survive.
+def _limit_trace(trace: Sequence[Any]) -> Tuple[Sequence[Any], int]:
+    max_depth, max_breadth = ParseError.max_trace_depth, ParseError.max_trace_breadth
+
+    if max_breadth is not None and len(trace) > max_breadth:
+        trace = trace[:max_breadth]
+
+    depth : int = 1 + max((t.get_depth() for t in trace), default=0)
+
+    while max_depth is not None and depth > max_depth:
+        spliced : List[Any] = []
+
+        for t in trace:
+            if t.get_depth() >= max_depth:
+                spliced.extend(t.get_trace())
+            else:
+                spliced.append(t)
+
+        trace = spliced if max_breadth is None else spliced[:max_breadth]
+        depth = 1 + max((t.get_depth() for t in trace), default=0)
+
+    return trace, depth
 
 class ParseError(Exception):
-    def __init__(self, loc: Location, msg: str = "", trace: Optional[List['ParseError']] = None) -> None:
-        super().__init__(f"{loc} [Error] {msg}")
-        
+    # Caps on the depth and breadth of error traces; None means unlimited
+    max_trace_depth : Optional[int] = None
+    max_trace_breadth : Optional[int] = None
+
+    def __init__(self, loc: Location, msg: str = "", trace: Optional[Sequence[Union['ParseError', 'ParseFailure']]] = None, format_args: Tuple[Any, ...] = ()) -> None:
+        super().__init__(loc, msg)
+
         self.__location : Location = loc
         self.__message : str = msg
-        self.__trace : List[ParseError] = [] if trace is None else list(trace)
-        
+        self.__format_args : Tuple[Any, ...] = format_args
+        self.__formatted : Optional[str] = None
+        self.__trace : Sequence[Union[ParseError, ParseFailure]] = ()
+        self.__depth : int = 1
+        self.__materialized_trace : Optional[List[ParseError]] = None
+
+        if trace is not None and len(trace) != 0:
+            self.__trace, self.__depth = _limit_trace(trace)
+
+    def __str__(self) -> str:
+        return f"{self.__location} [Error] {self.get_message()}"
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.__location!r}, {self.get_message()!r})"
+
+    # Pickled with its message formatted and its trace materialized, since format arguments and failures can refer to
+    # objects that can't be pickled
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return type(self), (self.__location, self.get_message(), self.get_trace())
+
     def get_location(self) -> Location:
         return self.__location
 
+    def get_offset(self) -> Optional[int]:
+        return self.__location.offset
+
     def get_message(self) -> str:
-        return self.__message
+        if self.__formatted is None:
+            self.__formatted = self.__message.format(*self.__format_args) if len(self.__format_args) != 0 else self.__message
+
+        return self.__formatted
 
     def get_trace(self) -> List['ParseError']:
-        return self.__trace
+        if self.__materialized_trace is None:
+            self.__materialized_trace = [e if isinstance(e, ParseError) else e.to_error() for e in self.__trace]
+
+        return self.__materialized_trace
+
+    def get_depth(self) -> int:
+        return self.__depth
 
     def get_message_with_trace(self) -> str:
         trace_message : str = ""
 
-        for e in self.__trace:
+        for e in self.get_trace():
             trace_message += "\n\t" + e.get_message_with_trace().replace("\n", "\n\t")
 
         return str(self) + trace_message
 
     @staticmethod
-    def combine(e1: 'ParseError', e2: 'ParseError') -> 'ParseError':
-        return ParseError(e1.__location, e1.__message, e1.__trace + [e2])
+    def set_trace_limits(max_depth: Optional[int] = None, max_breadth: Optional[int] = None) -> None:
+        if max_depth is not None and max_depth <= 0:
+            raise ValueError("max_depth must be positive")
+
+        if max_breadth is not None and max_breadth < 0:
+            raise ValueError("max_breadth must be non-negative")
+
+        ParseError.max_trace_depth = max_depth
+        ParseError.max_trace_breadth = max_breadth
+
+    @staticmethod
+    def get_trace_limits() -> Tuple[Optional[int], Optional[int]]:
+        return ParseError.max_trace_depth, ParseError.max_trace_breadth
+
+    @staticmethod
+    def combine(e1: 'ParseError', e2: Union['ParseError', 'ParseFailure']) -> 'ParseError':
+        trace = e1.__trace if e1.__materialized_trace is None else e1.__materialized_trace
+        return ParseError(e1.__location, e1.__message, [*trace, e2], e1.__format_args)
 
     @staticmethod
     def expectation(expected: str, found: str, loc: Location) -> 'ParseError':
-        return ParseError(loc, f"Expected {expected}, but found {found}")
+        return ParseError(loc, "Expected {}, but found {}", format_args=(expected, found))
+
+# The internal, exception-free form of a ParseError. Combinators return it instead of raising, and the message and
+# trace are only turned into a ParseError when the failure escapes to the user. A committed failure happened after a
+# Commit, and combinators that would otherwise try something else pass it on instead.
+class ParseFailure:
+    __slots__ = ("location", "message", "args", "trace", "depth", "error", "committed")
+
+    def __init__(self, loc: Location, msg: str = "", args: Tuple[Any, ...] = (), trace: Sequence['ParseFailure'] = (), error: Optional[ParseError] = None, committed: bool = False) -> None:
+        self.location : Location = loc
+        self.message : str = msg
+        self.args : Tuple[Any, ...] = args
+        self.trace : Sequence[ParseFailure] = ()
+        self.depth : int = 1
+        self.error : Optional[ParseError] = error
+        self.committed : bool = committed
+
+        if error is not None:
+            self.depth = error.get_depth()
+        elif len(trace) != 0:
+            self.trace, self.depth = _limit_trace(trace)
+
+    def get_message(self) -> str:
+        if self.error is not None:
+            return self.error.get_message()
+
+        return self.message.format(*self.args) if len(self.args) != 0 else self.message
+
+    def get_trace(self) -> Sequence['ParseFailure']:
+        if self.error is not None:
+            return [ParseFailure.from_error(e) for e in self.error.get_trace()]
+
+        return self.trace
+
+    def get_depth(self) -> int:
+        return self.depth
+
+    def to_error(self) -> ParseError:
+        if self.error is None:
+            self.error = ParseError(self.location, self.message, self.trace, self.args)
+
+        return self.error
+
+    # A committed copy, since the failure itself may be memoized where it isn't committed
+    def commit(self) -> 'ParseFailure':
+        failure = ParseFailure(self.location, self.message, self.args, (), self.error, True)
+        failure.trace, failure.depth = self.trace, self.depth
+        return failure
+
+    @staticmethod
+    def from_error(e: ParseError) -> 'ParseFailure':
+        return ParseFailure(e.get_location(), error=e)
+
+    @staticmethod
+    def combine(f1: 'ParseFailure', f2: 'ParseFailure') -> 'ParseFailure':
+        committed = f1.committed or f2.committed
+
+        if f1.error is not None:
+            return ParseFailure(f1.location, error=ParseError.combine(f1.error, f2), committed=committed)
+
+        return ParseFailure(f1.location, f1.message, f1.args, [*f1.trace, f2], committed=committed)
+
+    @staticmethod
+    def expectation(expected: str, found: str, loc: Location) -> 'ParseFailure':
+        return ParseFailure(loc, "Expected {}, but found {}", (expected, found))
 
 T = TypeVar('T')
 Q = TypeVar('Q')
@@ -193,33 +1490,260 @@ class ParseResult(Generic[T]):
     location : Location
     value : T
 
+    @property
+    def offset(self) -> Optional[int]:
+        return self.location.offset
+
+# What the internal parse functions return. They never raise ParseError and leave the stream where it was on failure.
+ParseOutcome = Union[ParseResult[T], ParseFailure]
+ParseFunction = Callable[[StringStream], ParseOutcome[T]]
+
+# The characters, or with a lexer the token ids, that a parser can start with when it succeeds. EOF means it can succeed
+# at the end of the stream, and a nullable parser can succeed anywhere without consuming anything. Parsers whose first
+# set can't be worked out report None instead.
+@dataclass(frozen=True)
+class FirstSet:
+    elements : FrozenSet[Hashable]
+    nullable : bool = False
+    lexer : Optional['Parser[Any]'] = None
+
+    def is_compatible(self, other: 'FirstSet') -> bool:
+        return len(self.elements) == 0 or len(other.elements) == 0 or self.lexer is other.lexer
+
+    @staticmethod
+    def sequence(sets: Sequence[Optional['FirstSet']]) -> Optional['FirstSet']:
+        result = FirstSet(frozenset(), True)
+
+        for s in sets:
+            if s is None or not result.is_compatible(s):
+                return None
+
+            result = FirstSet(result.elements | s.elements, s.nullable, result.lexer if len(s.elements) == 0 else s.lexer)
+
+            if not s.nullable:
+                break
+
+        return result
+
+    @staticmethod
+    def union(sets: Sequence[Optional['FirstSet']]) -> Optional['FirstSet']:
+        result = FirstSet(frozenset())
+
+        for s in sets:
+            if s is None or not result.is_compatible(s):
+                return None
+
+            result = FirstSet(result.elements | s.elements, result.nullable or s.nullable, result.lexer if len(s.elements) == 0 else s.lexer)
+
+        return result
+
+FirstSetFunction = Callable[[], Optional[FirstSet]]
+
+# Parsers made from a function keep it in the _parse slot, so calling it doesn't go through a wrapper method. The
+# combinators are subclasses that implement _parse as a method and describe their kind, the parsers they are built from
+# (children) and any other arguments, which makes grammars printable, comparable, hashable and easy to analyze.
 class Parser(Generic[T]):
+    __slots__ = ("_parse", "__parsable", "__first_set", "__first_set_version", "__computing_first_set", "__hash")
+
+    # Bumped whenever a grammar changes shape (a Reference is set) so that cached first sets get recomputed
+    _grammar_version : int = 0
+    _kind : str = "Parser"
+
+    _parse : ParseFunction[T]
+    __first_set : Optional[FirstSet]
+    __first_set_version : int
+    __computing_first_set : bool
+
     def __init__(self, parsable: Callable[[Location, StringStream], ParseResult[T]]) -> None:
-        super().__init__()
+        function : Optional[ParseFunction[T]] = getattr(parsable, "_parse", None)
 
-        self.__function : Callable[[Location, StringStream], ParseResult[T]] = lambda position, stream: parsable(position, stream)
+        if function is None:
+            def function(stream: StringStream) -> ParseOutcome[T]:
+                stream_start : int = stream.get_offset()
+
+                try:
+                    return parsable(stream.get_location(stream_start), stream)
+                except ParseError as e:
+                    stream.set_offset(stream_start)
+                    return ParseFailure.from_error(e)
+
+        self._parse = function
+        self.__parsable : Any = parsable
+
+    @staticmethod
+    def create(function: ParseFunction[T], first: Optional[FirstSetFunction] = None, kind: str = "Function", children: Sequence[Any] = (), args: Sequence[Any] = ()) -> 'Parser[T]':
+        return FunctionParser(function, first, kind, children, args)
+
+    def get_kind(self) -> str:
+        return self._kind
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parsable,) if hasattr(self.__parsable, "_parse") else ()
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return () if hasattr(self.__parsable, "_parse") else (self.__parsable,)
+
+    def _first_set(self) -> Optional[FirstSet]:
+        get_first_set = getattr(self.__parsable, "get_first_set", None)
+        return None if get_first_set is None else get_first_set()
+
+    # Computed on demand and cached until the grammar changes. A parser that is reached again while its own first set
+    # is being computed (left recursion) reports None, which only makes the result more conservative.
+    def get_first_set(self) -> Optional[FirstSet]:
+        try:
+            if self.__first_set_version == Parser._grammar_version:
+                return self.__first_set
+        except AttributeError:
+            pass
+
+        if getattr(self, "_Parser__computing_first_set", False):
+            return None
+
+        self.__computing_first_set = True
+
+        try:
+            first_set = self._first_set()
+        finally:
+            self.__computing_first_set = False
+
+        self.__first_set, self.__first_set_version = first_set, Parser._grammar_version
+        return first_set
 
     def parse(self, input: Union[StringStream, str]) -> ParseResult[T]:
         stream = input if isinstance(input, StringStream) else StringStream(input)
-        stream_start : int = stream.get_offset()
+        result = self._parse(stream)
+
+        if isinstance(result, ParseFailure):
+            raise result.to_error()
+
+        return result
 
+    def __lshift__(self, discard: 'Parser[Q]') -> 'Parser[T]':
+        return LShiftNode(self, discard)
+
+    def __rshift__(self, keep: 'Parser[Q]') -> 'Parser[Q]':
+        return RShiftNode(self, keep)
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+
+        if type(self) is not type(other):
+            return False
+
+        other_parser = cast(Parser[Any], other)
+        return self.get_kind() == other_parser.get_kind() and self.get_args() == other_parser.get_args() and self.get_children() == other_parser.get_children()
+
+    def __hash__(self) -> int:
         try:
-            return self.__function(Location(stream.get_name(), stream.get_position()), stream)
-        except ParseError as e:
+            return self.__hash
+        except AttributeError:
+            pass
+
+        args : List[int] = []
+
+        for arg in self.get_args():
+            try:
+                args.append(hash(arg))
+            except TypeError:
+                args.append(hash(type(arg))) # Equal unhashable arguments still have to hash the same
+
+        self.__hash : int = hash((type(self), self.get_kind(), tuple(args), self.get_children()))
+        return self.__hash
+
+    def __repr__(self) -> str:
+        return f"{self.get_kind()}({', '.join(repr(x) for x in self.get_children() + self.get_args())})"
+
+# An opaque parser made from a parse function, optionally describing itself like the combinator nodes do
+class FunctionParser(Parser[T]):
+    __slots__ = ("__first", "__kind", "__children", "__args")
+
+    def __init__(self, function: ParseFunction[T], first: Optional[FirstSetFunction] = None, kind: str = "Function", children: Sequence[Any] = (), args: Sequence[Any] = ()) -> None:
+        self._parse = function
+        self.__first : Optional[FirstSetFunction] = first
+        self.__kind : str = kind
+        self.__children : Tuple[Any, ...] = tuple(children)
+        self.__args : Tuple[Any, ...] = tuple(args)
+
+    def get_kind(self) -> str:
+        return self.__kind
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return self.__children
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return self.__args
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return None if self.__first is None else self.__first()
+
+    def __eq__(self, other: object) -> bool:
+        return self is other
+
+    __hash__ = object.__hash__
+
+    def __repr__(self) -> str:
+        return f"{self.__kind}({self._parse!r})" if self.__kind == "Function" else super().__repr__()
+
+class LShiftNode(Parser[T]):
+    __slots__ = ("__parser", "__discard")
+    _kind = "LShift"
+
+    def __init__(self, parser: Parser[T], discard: Parser[Any]) -> None:
+        self.__parser : Parser[T] = parser
+        self.__discard : Parser[Any] = discard
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        stream_start = stream.get_offset()
+        result = self.__parser._parse(stream)
+
+        if isinstance(result, ParseFailure):
+            return result
+
+        discarded = self.__discard._parse(stream)
+
+        if isinstance(discarded, ParseFailure):
             stream.set_offset(stream_start)
-            raise e
+            return discarded
 
-    def __lshift__(self, discard: 'Parser[Q]') -> 'Parser[T]':
-        def function(loc: Location, stream: StringStream) -> ParseResult[T]:
-            result = self.parse(stream)
-            discard.parse(stream)
+        return result
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet.sequence([self.__parser.get_first_set(), self.__discard.get_first_set()])
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__parser, self.__discard)
+
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
+
+class RShiftNode(Parser[T]):
+    __slots__ = ("__discard", "__parser")
+    _kind = "RShift"
+
+    def __init__(self, discard: Parser[Any], parser: Parser[T]) -> None:
+        self.__discard : Parser[Any] = discard
+        self.__parser : Parser[T] = parser
+
+    def _parse(self, stream: StringStream) -> ParseOutcome[T]:
+        stream_start = stream.get_offset()
+        result = self.__discard._parse(stream)
+
+        if isinstance(result, ParseFailure):
             return result
 
-        return Parser(function)
+        kept = self.__parser._parse(stream)
 
-    def __rshift__(self, keep: 'Parser[Q]') -> 'Parser[Q]':
-        def function(loc: Location, stream: StringStream) -> ParseResult[Q]:
-            self.parse(stream)
-            return keep.parse(stream)
+        if isinstance(kept, ParseFailure):
+            stream.set_offset(stream_start)
+
+        return kept
+
+    def _first_set(self) -> Optional[FirstSet]:
+        return FirstSet.sequence([self.__discard.get_first_set(), self.__parser.get_first_set()])
+
+    def get_children(self) -> Tuple[Any, ...]:
+        return (self.__discard, self.__parser)
 
-        return Parser(function)
+    def get_args(self) -> Tuple[Any, ...]:
+        return ()
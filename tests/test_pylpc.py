@@ -1,6 +1,19 @@
-from pylpc import __version__
-from pylpc.parsers import AlphaNums, Char, Chars, Count, Digits, FirstSuccess, Letter, Letters, Longest, Map, Maybe, Reference, Seq, Try, Value, Whitespaces
-from pylpc.pylpc import Location, ParseError, ParseResult, Parser, char, Position, StringStream
+import json
+import pickle
+import random
+import re
+
+import pylpc.lexer
+import pylpc.pylpc
+from benchmarks import suite
+from pylpc import __version__, cache
+from pylpc.batch import parse_many, parse_many_unordered
+from pylpc.compiler import _Compiler, compile
+from pylpc.lexer import CompiledLexer, EOS_PATTERN_ID, EOSLexeme, Lexeme, Lexer, Pattern, TokenInfo, TokenStream, UNKNOWN_PATTERN_ID
+from pylpc.parsers import AlphaNums, Between, Callback, Char, Chars, Commit, Count, Digit, Digits, EOS, FirstSuccess, Keywords, Letter, Letters, Literals, Longest, Map, Maybe, Memo, Named, Reference, Seq, Terminal, Try, Value, Whitespaces, ZeroOrMore
+from pylpc.optimizer import optimize
+from pylpc.profiling import profile
+from pylpc.pylpc import EOF, FileStream, FirstSet, Location, MemoTable, OffsetCache, ParseError, ParseFailure, ParseResult, Parser, Regex, TokenCache, char, Position, StringStream
 
 def test_version():
     assert __version__ == '0.1.0'
@@ -62,12 +75,470 @@ def test_StringStream():
     assert False # set_token
     assert False # clear_tokens
 
+def test_StringStream_position_lookup():
+    data = "a\nbc\n\ndef\n"
+    ss = StringStream(data)
+    expected = []
+    line, column = 1, 1
+
+    for c in data + " ":
+        expected.append(Position(line, column))
+        line, column = (line + 1, 1) if c == '\n' else (line, column + 1)
+
+    for offset in list(range(len(data) + 1)) + list(reversed(range(len(data) + 1))) + [9, 0, 4, 2, 10, 3]:
+        assert ss.get_position_from_offset(offset) == expected[offset]
+
+def test_StringStream_line_index(monkeypatch):
+    scans = []
+
+    class CountingNewline:
+        def finditer(self, data):
+            scans.append(data)
+            return re.finditer("\n", data)
+
+    monkeypatch.setattr(pylpc.pylpc, "_NEWLINE", CountingNewline())
+
+    # Parsing without errors or position requests never builds the index
+    data = "ab\r\ncd\n\nef"
+    stream = StringStream(data)
+    assert Seq(Letters(), Terminal(Regex("\\s+")), Letters()).parse(stream).value[2].value == "cd"
+    stream.edit(0, 1, "x\n")
+    assert scans == []
+
+    assert stream.get_position_from_offset(0) == Position(1, 1)
+    assert scans == ["x\nb\r\ncd\n\nef"]
+
+    assert [stream.get_position_from_offset(offset) for offset in [2, 4, 5, 8, 9, 11]] == [Position(2, 1), Position(2, 3), Position(3, 1), Position(4, 1), Position(5, 1), Position(5, 3)]
+    assert stream.get_offset_from_pos(Position(3, 2)) == 6
+    assert len(scans) == 1
+
+    try:
+        stream.get_offset_from_pos(Position(6, 1))
+        assert False
+    except Exception as e:
+        assert str(e) == "Invalid position: (6, 1)"
+
+def test_StringStream_edit():
+    stream = StringStream("ab\ncd\nef")
+    assert stream.get_position_from_offset(7) == Position(3, 2)
+
+    stream.edit(1, 3, "x\ny\nz")
+    assert stream.get_data() == "ax\ny\nzd\nef"
+    assert [stream.get_position_from_offset(offset) for offset in [0, 2, 5, 7, 9]] == [Position(1, 1), Position(1, 3), Position(3, 1), Position(3, 3), Position(4, 2)]
+    assert stream.get_offset_from_pos(Position(4, 1)) == 8
+
+    try:
+        stream.edit(5, 10, "")
+        assert False
+    except Exception:
+        pass
+
+    calls = []
+    ws = Terminal(Regex("[ \n]*"))
+    word = Memo(Callback(Terminal(Regex("[a-z]+")) << ws, lambda result: calls.append(result.value)))
+    line = Memo(Map(Seq(word, ZeroOrMore(word), Char(';')), lambda r: r.location) << ws)
+    parser = ZeroOrMore(line) << EOS()
+    stream = StringStream("one two;\nthree four;\nfive;")
+    first = parser.parse(stream).value
+
+    stream.edit(15, 4, "x")
+    stream.set_offset(0)
+    second = parser.parse(stream).value
+
+    assert calls == ["one", "two", "three", "four", "five", "three", "x"]
+    assert [r.value for r in second] == [Location("", Position(1, 1)), Location("", Position(2, 1)), Location("", Position(3, 1))]
+    assert second[2] is first[2] and second[2].offset == 18
+
+    stream.edit(7, 0, " six")
+    stream.set_offset(0)
+    assert [r.value.position for r in parser.parse(stream).value] == [Position(1, 1), Position(2, 1), Position(3, 1)]
+    assert calls[7:] == ["two", "six"]
+
+    lexer = CompiledLexer([Pattern("WS", Regex(" +")), Pattern("ID", Regex("[a-z]+"))])
+    stream = StringStream("ab cd ef")
+    assert [lexer.parse(stream).value.text for _ in range(5)] == ["ab", " ", "cd", " ", "ef"]
+
+    stream.edit(3, 1, "xy")
+    assert len(stream.get_token_cache()) == 3
+    stream.set_offset(0)
+    assert [lexer.parse(stream).value.text for _ in range(5)] == ["ab", " ", "xyd", " ", "ef"]
+    assert stream.get_location(6).position == Position(1, 7)
+
+    # Results before an edit can depend on text past where they stopped, so those that looked at it are parsed again
+    parser = Seq(Memo(FirstSuccess([Terminal(Regex("abc")), Terminal(Regex("a"))])), Maybe(Chars()))
+    stream = StringStream("abd")
+    assert parser.parse(stream).value[0].value == "a"
+
+    stream.edit(2, 1, "c")
+    stream.set_offset(0)
+    first, rest = parser.parse(stream).value
+    assert first.value == "abc" and not rest.value.IsSuccess()
+
+    for lexer in [Lexer([Pattern("LONG", Regex("abcd")), Pattern("A", Regex("a")), Pattern("W", Regex("[a-z]"))]), CompiledLexer([Pattern("LONG", Regex("abcd")), Pattern("A", Regex("a")), Pattern("W", Regex("[a-z]"))])]:
+        stream = StringStream("abcx")
+        assert lexer.parse(stream).value.id == "A"
+
+        stream.edit(3, 1, "d")
+        stream.set_offset(0)
+        assert lexer.parse(stream).value.id == "LONG"
+
+    # Positions stay right over edits far apart and close together, before and after the earlier ones
+    data = "".join(f"line {i}\n" for i in range(50))
+    stream = StringStream(data)
+    stream.get_position_from_offset(0)
+
+    for offset, deleted, inserted in [(200, 3, "a\nb\n"), (20, 0, "\n\n\n"), (300, 10, ""), (21, 1, "c"), (150, 40, "\nd"), (0, 5, "")]:
+        location = stream.get_location(offset + deleted + 1)
+        stream.edit(offset, deleted, inserted)
+        data = data[:offset] + inserted + data[offset + deleted:]
+        fresh = StringStream(data)
+
+        assert location.offset == offset + len(inserted) + 1
+        assert [stream.get_position_from_offset(i) for i in range(len(data) + 1)] == [fresh.get_position_from_offset(i) for i in range(len(data) + 1)]
+        assert all(stream.get_offset_from_pos(fresh.get_position_from_offset(i)) == i for i in range(len(data) + 1))
+
+def test_FileStream(tmp_path):
+    data = "ab\n\u00e9 cd\n\nlonger line of text\nend"
+    path = tmp_path / "input.txt"
+    path.write_bytes(data.encode("utf-8"))
+
+    with FileStream(str(path), chunk_size=4) as fs:
+        ss = StringStream(data)
+
+        assert fs.get_name() == str(path)
+        assert fs.get_length() == len(data)
+        assert fs.get_num_chunks() > 1
+        assert fs.get_data(3, 4) == ss.get_data(3, 4)
+        assert fs.get_data() == data
+
+        for offset in range(len(data) + 1):
+            assert fs.get_position_from_offset(offset) == ss.get_position_from_offset(offset)
+            assert fs.get_offset_from_pos(ss.get_position_from_offset(offset)) == offset
+
+        parser = ZeroOrMore(FirstSuccess([Terminal(Regex("[a-z \\n]+")), Char()]))
+        assert [r.value for r in parser.parse(fs).value] == [r.value for r in parser.parse(ss).value]
+        assert fs.is_eos() and fs.get() == ''
+
+    # Tokens longer than a chunk that cross chunk boundaries, and patterns that look further than they match
+    data = "x\n/* a\nbb\ncc */\nlonger line\nlast"
+    path.write_bytes(data.encode("utf-8"))
+
+    ss = StringStream(data)
+
+    for pattern in ["/\\*[\\s\\S]*?\\*/", "[\\S\\s]+", "[^\\n]*\\n[^\\n]*\\n[a-z]", "x\\n/\\*(?= a\\nbb)", "(?:/\\* a\\nbb\\ncc \\*/\\nlongerX|/)", "a\\nbb\\ncc \\*/\\nlonger line\\nlast$"]:
+        for offset in range(len(data) + 1):
+            with FileStream(str(path), chunk_size=4) as fs:
+                assert fs.get_num_chunks() > 3
+                fs.set_offset(offset)
+                ss.set_offset(offset)
+                fs_match, ss_match = fs.match(Regex(pattern)), ss.match(Regex(pattern))
+                assert (fs_match is None and ss_match is None) or (fs_match is not None and ss_match is not None and fs_match[0] == ss_match[0])
+
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+
+    with FileStream(str(empty)) as fs:
+        assert fs.is_eos() and fs.peek() == '' and fs.get_position() == Position(1, 1)
+
+    try:
+        FileStream(str(path), encoding="utf-16")
+        assert False
+    except ValueError:
+        pass
+
+    with FileStream(str(path)) as fs:
+        try:
+            fs.edit(0, 1, "x")
+            assert False
+        except Exception:
+            pass
+
+def test_Location():
+    stream = StringStream("ab\ncd", "name")
+    stream.ignore(4)
+
+    loc = stream.get_location()
+    assert loc.offset == 4
+    assert loc == Location("name", Position(2, 2))
+    assert str(loc) == "name:2:2"
+    assert Location("name").position == Position(1, 1)
+    assert stream.get_offset_from_location(Location("name", Position(2, 1))) == 3
+
+    result = Letters().parse(stream)
+    assert result.offset == 4 and result.location.position == Position(2, 2)
+
+    try:
+        Letters().parse(stream)
+        assert False
+    except ParseError as e:
+        assert e.get_offset() == 5
+        assert str(e) == "name:2:3 [Error] No match found for regular expression: [a-zA-Z]+"
+
+def test_ParseFailure():
+    stream = StringStream("abc")
+    failure = FirstSuccess([Digits(), Seq(Letters(), Char('!'))])._parse(stream)
+
+    assert isinstance(failure, ParseFailure)
+    assert failure.location.offset == 3 and stream.get_offset() == 0
+    assert failure.get_message() == "No match found for regular expression: [\\S\\s]"
+
+    error = failure.to_error()
+    assert failure.to_error() is error
+    assert str(error) == ":1:4 [Error] " + failure.get_message()
+
+    user_error = ParseError(Location("", Position(1, 1)), "{not a format}", [ParseError(Location(""), "inner")])
+    combined = ParseFailure.combine(ParseFailure.from_error(user_error), ParseFailure(Location(""), "{} more", (1,)))
+    assert combined.get_message() == "{not a format}"
+    assert [e.get_message() for e in combined.to_error().get_trace()] == ["inner", "1 more"]
+
+def test_ParseError_trace_limits():
+    error = ParseError.expectation("'a'", "'{b}'", Location(""))
+    assert error.get_message() == "Expected 'a', but found '{b}'"
+    assert repr(error) == "ParseError(Location(name='', position=Position(line=1, column=1)), \"Expected 'a', but found '{b}'\")"
+
+    parser = Char('!')
+    for i in range(10):
+        parser = Named(f"n{i}", parser)
+
+    assert ParseError.get_trace_limits() == (None, None)
+    assert parser._parse(StringStream("?")).get_depth() == 11
+
+    ParseError.set_trace_limits(3, 2)
+
+    try:
+        error = parser._parse(StringStream("?")).to_error()
+        assert error.get_depth() == 3
+        assert error.get_message() == "Unable to parse n9"
+        assert error.get_trace()[0].get_message() == "Unable to parse n0"
+        assert error.get_trace()[0].get_trace()[0].get_message() == "Expected '!', but found '?'"
+
+        failure = FirstSuccess([Char('a'), Char('b'), Char('c')])._parse(StringStream("?"))
+        assert failure.get_message() == "No option parsed!" and len(failure.get_trace()) == 2
+
+        combined = ParseError.combine(ParseError(Location(""), "outer", [failure.to_error()]), error)
+        assert combined.get_depth() == 3 and len(combined.get_trace()) == 2
+    finally:
+        ParseError.set_trace_limits()
+
+def test_Regex():
+    assert Regex("[a-z]+").match("123abc", 3)[0] == "abc"
+    assert Regex("[a-z]+").match("123abc", 2) is None
+    assert Regex("^abc").match("123abc", 3)[0] == "abc"
+    assert Regex("\\babc").match("123abc", 3)[0] == "abc"
+    assert Regex("(?<=3)abc").match("123abc", 3) is None
+
+    # Positions are in the whole string whether the pattern was matched in place or on the rest of it
+    for pattern in ["(a)(x)?(bc)", "^(a)(x)?(bc)"]:
+        regex_match = Regex(pattern).match("123abc", 3)
+        assert regex_match.span() == (3, 6) and regex_match.start(2) == 3 and regex_match.end(4) == 6 and regex_match.span(3) == (-1, -1)
+        assert regex_match.groups() == ("abc", "a", None, "bc") and regex_match.string == "123abc" and regex_match.pos == 3
+
+    stream = StringStream("123abc")
+    stream.ignore(3)
+    assert stream.match(Regex("[a-z]+"))[0] == "abc"
+    assert stream.get_offset() == 3
+
+    assert [Regex(p).get_literal() for p in ["let", "\\+=", "(?:a)[b]", "a|b", "a+", "(?i:a)", "a\\b", ""]] == ["let", "+=", "ab", None, None, None, None, None]
+
 def test_Lexer():
     assert False
 
+def test_CompiledLexer():
+    patterns = [
+        Pattern("WS", Regex("[\\s]+")),
+        Pattern("LET", Regex("let")),
+        Pattern("ID", Regex("[a-zA-Z_]+")),
+        Pattern("NUM", Regex("[0-9]+(?:\\.[0-9]+)?")),
+        Pattern("OP", Regex("==|=|\\+|\\.")),
+        Pattern("EMPTY", Regex("x*")),
+        Pattern("ANY_DIGIT", Regex("\\d")),
+        Pattern("EQ", Regex("==")),
+        Pattern("PLUS_EQ", Regex("\\+=")),
+        Pattern("LETX", Regex("letx")),
+        Pattern("LET_AGAIN", Regex("let")),
+    ]
+
+    alphabet = "let x=1.5+y==\n\t!_.9"
+
+    for _ in range(50):
+        data = "".join(random.choice(alphabet) for _ in range(random.randint(0, 40)))
+        expected_stream, actual_stream = StringStream(data), StringStream(data)
+        lexer, compiled = Lexer(patterns), CompiledLexer(patterns)
+
+        while True:
+            expected, actual = lexer.parse(expected_stream), compiled.parse(actual_stream)
+            assert expected == actual
+            assert expected_stream.get_offset() == actual_stream.get_offset()
+
+            if actual.value.id == EOS_PATTERN_ID():
+                break
+
+    # Under IGNORECASE re also pairs ſ with s, the Kelvin sign with k and İ with i
+    folded = [Pattern("S", Regex("(?i:s)+")), Pattern("K", Regex("(?i:k)")), Pattern("I", Regex("(?i:i)")), Pattern("A", Regex("(?ai:k)"))]
+    assert Regex("(?i:s)+").get_first_chars() is None and Regex("(?ai:k)").get_first_chars() == frozenset("kK")
+
+    for lexer in [Lexer(folded), CompiledLexer(folded)]:
+        stream = StringStream("ſSs\u212a\u0130k")
+        assert [(token.value.id, token.value.text) for token in [lexer.parse(stream) for _ in range(5)]] == [("S", "ſSs"), ("K", "\u212a"), ("I", "\u0130"), ("K", "k"), (EOS_PATTERN_ID(), "")]
+
+    stream = StringStream("let!")
+    compiled = CompiledLexer(patterns)
+    assert [compiled.parse(stream).value.id for _ in range(3)] == ["LET", UNKNOWN_PATTERN_ID(), EOS_PATTERN_ID()]
+
+    try:
+        CompiledLexer([Pattern("A", Regex("a")), Pattern("A", Regex("b"))])
+        assert False
+    except ValueError:
+        pass
+
+def test_Lexer_tokenize():
+    patterns = [Pattern("WS", Regex("[\\s]+")), Pattern("LET", Regex("let")), Pattern("ID", Regex("[a-zA-Z_]+"))]
+    expected = [
+        TokenInfo("LET", "let", 0),
+        TokenInfo("WS", " ", 3),
+        TokenInfo("ID", "x", 4),
+        TokenInfo(UNKNOWN_PATTERN_ID(), "!", 5),
+        TokenInfo(EOS_PATTERN_ID(), "", 6),
+    ]
+
+    for lexer in [Lexer(patterns), CompiledLexer(patterns)]:
+        stream = StringStream("let x!")
+        assert list(lexer.tokenize(stream)) == expected
+        assert stream.is_eos() and stream.peek_token() is None
+        assert list(lexer.tokenize("")) == [TokenInfo(EOS_PATTERN_ID(), "", 0)]
+
+def test_Lexer_tokenize_parallel(monkeypatch):
+    patterns = [
+        Pattern("COMMENT", Regex("/\\*(?:[^*]|\\*(?!/))*\\*/")),
+        Pattern("WS", Regex("[\\s]+")),
+        Pattern("ID", Regex("[a-z]+")),
+        Pattern("OP", Regex("[-+*/=;]")),
+        Pattern("END", Regex("e(?=\\n*$)")),
+    ]
+    pieces = ["/* a\n b */", "/*\n\n*/", "abc", "\n", "  \n  ", "+", ";", "\n\n", "/", "*", "?", "e"]
+
+    for lexer in [Lexer(patterns), CompiledLexer(patterns)]:
+        for _ in range(10):
+            data = "".join(random.choice(pieces) for _ in range(random.randint(0, 100)))
+
+            # With less text after each chunk than its tokens look at, they are lexed again in this process
+            for overlap in [0, 3, 4096]:
+                monkeypatch.setattr(pylpc.lexer, "_LEX_OVERLAP", overlap)
+
+                for chunk_size in [1, 5, 40]:
+                    assert list(lexer.tokenize_parallel(data, workers=2, chunk_size=chunk_size)) == list(lexer.tokenize(data))
+
+        stream = StringStream("x\ny\nz")
+        stream.set_offset(2)
+        assert [t.text for t in lexer.tokenize_parallel(stream, workers=2, chunk_size=1)] == ["y", "\n", "z", ""]
+        assert stream.is_eos()
+
+    monkeypatch.setattr(pylpc.lexer, "_MIN_PARALLEL_LEX_SIZE", 0)
+    data = "abc /* x\n*/ e\n" * 10000
+    lexer = CompiledLexer(patterns)
+    tokens = TokenStream(lexer, data, workers=2)
+    assert tokens.get_ids() == TokenStream(lexer, data).get_ids() and tokens.get_starts() == TokenStream(lexer, data).get_starts()
+
+    # Short inputs are lexed without starting any worker processes unless a chunk size is given
+    monkeypatch.undo()
+    monkeypatch.setattr(pylpc.lexer.multiprocessing, "Pool", None)
+    assert list(CompiledLexer(patterns).tokenize_parallel("abc\n" * 100, workers=2))[-2:] == [TokenInfo("WS", "\n", 399), TokenInfo(EOS_PATTERN_ID(), "", 400)]
+
+def test_TokenStream():
+    patterns = [Pattern("WS", Regex("[\\s]+")), Pattern("ID", Regex("[a-z]+")), Pattern("NUM", Regex("[0-9]+")), Pattern("EQ", Regex("="))]
+
+    for lexer in [Lexer(patterns), CompiledLexer(patterns)]:
+        ws = ZeroOrMore(Lexeme(lexer, "WS"))
+        token = lambda id, value=None: Lexeme(lexer, id, value) << ws
+        statement = Map(Seq(token("ID", "let"), token("ID"), token("EQ"), token("NUM")), lambda r: (r.value[1].value, r.value[3].value))
+        grammar = ws >> ZeroOrMore(FirstSuccess([statement, token("NUM")])) << EOSLexeme(lexer)
+
+        stream = TokenStream(lexer, "let a = 1\n let bc = 22")
+        assert list(stream.get_ids()) == [2, 1, 2, 1, 4, 1, 3, 1, 2, 1, 2, 1, 4, 1, 3, 0]
+        assert list(stream.get_starts()) == [0, 3, 4, 5, 6, 7, 8, 9, 11, 14, 15, 17, 18, 19, 20, 22]
+        assert stream.get_length() == 15 and stream.get_data(8, 3) == "let bc"
+        assert stream.get_position_from_offset(10) == Position(2, 6) and stream.get_offset_from_pos(Position(2, 7)) == 10
+
+        for parser in [grammar, compile(grammar)]:
+            stream = TokenStream(lexer, "let a = 1\n let bc = 22", "f")
+            result = parser.parse(stream)
+            assert [r.value for r in result.value] == [("a", "1"), ("bc", "22")]
+            assert result.value[1].location == Location("f", Position(2, 2)) and stream.get_offset() == 15
+
+            for input in ["let a = 1\nlet b", "let ="]:
+                try:
+                    parser.parse(input)
+                    assert False
+                except ParseError as expected:
+                    try:
+                        parser.parse(TokenStream(lexer, input))
+                        assert False
+                    except ParseError as e:
+                        assert e.get_message_with_trace() == expected.get_message_with_trace()
+
+        assert lexer.parse(TokenStream(lexer, "a")).value.text == "a"
+
+        try:
+            Lexeme(Lexer(patterns), "ID").parse(TokenStream(lexer, "a"))
+            assert False
+        except Exception:
+            pass
+
+        for parser in [Char("a"), Map(lexer, lambda r: r.value.text)]:
+            try:
+                parser.parse(TokenStream(Lexer(patterns), "a"))
+                assert False
+            except Exception:
+                pass
+
+        # Literals can't compare the input's characters either, rather than comparing the tokens' text run together
+        for parser in [Literals(["let a"]), Keywords(["let"])]:
+            try:
+                parser.parse(TokenStream(lexer, "let a"))
+                assert False
+            except Exception as e:
+                assert str(e) == "A TokenStream can only be parsed with its lexer and lexemes"
+
+def test_TokenCache():
+    lexer = CompiledLexer([Pattern("WS", Regex("[\\s]+")), Pattern("ID", Regex("[a-z]+"))])
+    stream = StringStream("a b c d")
+    stream.set_token_cache(TokenCache(max_size=2))
+
+    assert [lexer.parse(stream).value.text for _ in range(4)] == ["a", " ", "b", " "]
+    assert len(stream.get_token_cache()) == 2
+
+    stream.set_offset(2)
+    assert lexer.parse(stream).value.text == "b"
+
+    stream.set_offset(0)
+    assert stream.peek_token() is None
+    assert lexer.parse(stream).value.text == "a"
+
+    stats = stream.get_token_cache().get_stats()
+    assert (stats.hits, stats.misses, stats.evictions) == (1, 5, 3)
+
+    stream.set_offset(4)
+    stream.commit()
+    assert len(stream.get_token_cache()) == 0
+    assert lexer.parse(stream).value.text == "c"
+    assert stream.get_token_cache().peek(4) is not None
+
+    stream.set_offset(0)
+    lexer.parse(stream)
+    assert stream.get_token_cache().peek(0) is None
+
 def test_Map():
     assert Map(Value(5), lambda input: 6).parse("").value == 6
 
+    # A function raising ParseError fails the alternative it's in, and the next one starts where it did
+    def reject(result):
+        raise ParseError(result.location, "Rejected")
+
+    for parser in [FirstSuccess([Map(Digit(), reject), Letter(), Char()]), FirstSuccess([Callback(Digit(), reject), Letter(), Char()])]:
+        for candidate in [parser, compile(parser)]:
+            stream = StringStream("1x")
+            assert candidate.parse(stream).value == '1' and stream.get_offset() == 1
+
 def test_Reference():
     reference = Reference[char]()
     function = Parser(lambda loc, stream: Parser(reference).parse(stream))
@@ -88,6 +559,56 @@ def test_Reference():
     except ParseError as e:
         pass
 
+def test_Reference_left_recursive():
+    expr = Reference[int](left_recursive=True)
+    parser = Parser(expr)
+    number = Map(Digits(), lambda result: int(result.value))
+
+    expr.set(FirstSuccess([
+        Map(Seq(parser, Char('-'), number), lambda result: result.value[0].value - result.value[2].value),
+        Map(Seq(parser, Char('+'), number), lambda result: result.value[0].value + result.value[2].value),
+        number,
+    ]))
+
+    stream = StringStream("10-3-2+1!")
+    assert parser.parse(stream).value == 6
+    assert stream.get_offset() == 8
+
+    stream = StringStream("-1")
+
+    try:
+        parser.parse(stream)
+        assert False
+    except ParseError as e:
+        assert stream.get_offset() == 0
+
+    long_input = "+".join(["1"] * 2000)
+    assert parser.parse(long_input).value == 2000
+
+def test_Reference_mutually_left_recursive():
+    # x := y 'a' | 'b'; y := x 'c' | 'd', with both rules growing seeds
+    x, y = Reference[str](left_recursive=True), Reference[str](left_recursive=True)
+    concat = lambda result: result.value[0].value + result.value[1].value
+    x.set(FirstSuccess([Map(Seq(Parser(y), Char('a')), concat), Char('b')]))
+    y.set(FirstSuccess([Map(Seq(Parser(x), Char('c')), concat), Char('d')]))
+
+    for parser in [Parser(x), compile(Parser(x))]:
+        stream = StringStream("bcaca")
+        assert parser.parse(stream).value == "bcaca"
+        assert stream.get_offset() == 5
+
+        assert parser.parse("dacab!").value == "daca"
+
+    for parser in [Parser(y), compile(Parser(y))]:
+        stream = StringStream("bcac")
+        assert parser.parse(stream).value == "bcac"
+        assert stream.get_offset() == 4
+
+    # Only the outermost rule's result is stored
+    stream = StringStream("bcaca")
+    Parser(x).parse(stream)
+    assert len(stream.get_memo_table()) == 1
+
 def test_Try():
     expected_error = ParseError(Location("", Position(100, 250)), "The error!")
 
@@ -105,6 +626,54 @@ def test_Try():
     error = parser.parse("a").value
     assert error.IsError() and error.ExtractError() == expected_error
 
+def test_Commit():
+    statement = FirstSuccess([
+        Seq(Terminal(Regex("if\\b")), Commit(Seq(Char(" "), Digits(), Char(";")))),
+        Seq(Letters(), Char(";")),
+    ])
+
+    for prepare in [lambda p: p, compile, optimize]:
+        parser = prepare(statement)
+        assert len(parser.parse("if 1;").value) == 2
+        assert len(parser.parse("iff;").value) == 2
+
+        # Without the commit, "if" would be read as a word instead
+        for wrapper in [statement, Maybe(statement), ZeroOrMore(statement), FirstSuccess([statement, Value(None)]), Longest([statement, Value(None)])]:
+            try:
+                prepare(wrapper).parse("if;")
+                assert False
+            except ParseError as e:
+                assert e.get_offset() == 2
+
+        try:
+            prepare(ZeroOrMore(statement)).parse("if 1;x;if;")
+            assert False
+        except ParseError as e:
+            assert e.get_offset() == 9
+
+        assert prepare(Try(statement)).parse("if;").value.IsError()
+        assert len(prepare(ZeroOrMore(statement)).parse("x;if 1;").value) == 2
+
+        # Once an alternative crosses a commit, the longer one after it isn't tried
+        for alternatives in [[Seq(Char("a"), Commit(Char("b"))), Chars("abc")], [Chars("abc"), Seq(Char("a"), Commit(Char("b")))]]:
+            stream = StringStream("abc")
+            assert [r.value for r in prepare(Longest(alternatives)).parse(stream).value] == ["a", "b"] and stream.get_offset() == 2
+
+        # A Try catching the failure undoes the commit made before it, so what follows can memoize before it again
+        caught = Seq(Memo(Char("x")), Try(Seq(Char("i"), Commit(Char("f")), Char(";"))), Memo(Letter()))
+
+        for text, memoized in [("xif!", 1), ("xiy", 2)]:
+            stream = StringStream(text)
+            result = prepare(caught).parse(stream)
+            assert result.value[1].value.IsError() and result.value[2].value == "i" and stream.get_offset() == 2
+            assert stream.get_memo_table().get_committed() == 0 and stream.get_token_cache().get_committed() == 0
+            assert len(stream.get_memo_table()) == memoized
+
+    stream = StringStream("if 1;" * 100)
+    result = ZeroOrMore(Memo(statement)).parse(stream)
+    assert len(result.value) == 100
+    assert stream.get_memo_table().get_committed() == 497 and len(stream.get_memo_table()) <= 1
+
 def test_Count():
     def func(loc: Location, stream: StringStream) -> ParseResult[char]:
         if not stream.peek().isalpha():
@@ -174,6 +743,314 @@ def test_Maybe():
 
     assert input.get_offset() == 3
 
+def test_Memo():
+    calls = []
+    digits = Memo(Callback(Digits(), lambda result: calls.append(result.value)))
+    parser = FirstSuccess([Seq(digits, Char('a')), Seq(digits, Char('b')), digits])
+    stream = StringStream("123c")
+
+    assert parser.parse(stream).value == "123"
+    assert calls == ["123"]
+    assert stream.get_offset() == 3
+
+    stats = stream.get_memo_table().get_stats()
+    assert (stats.hits, stats.misses) == (2, 1)
+
+    try:
+        digits.parse(stream)
+        assert False
+    except ParseError as e:
+        pass
+
+    try:
+        digits.parse(stream)
+        assert False
+    except ParseError as e:
+        assert e.get_offset() == 3
+
+    assert (stats.hits, stats.misses) == (3, 2)
+
+def test_MemoTable():
+    # The caches fill in how keys and entries are read
+    try:
+        OffsetCache()  # type: ignore
+        assert False
+    except TypeError:
+        pass
+
+    table = MemoTable(max_size=2)
+    table.set("a", 0, (ParseResult(Location(""), 1), 1))
+    table.set("b", 1, (ParseResult(Location(""), 2), 2))
+    assert table.get("a", 0) is not None
+    table.set("c", 2, (ParseResult(Location(""), 3), 3))
+
+    assert len(table) == 2
+    assert table.get("b", 1) is None
+    assert table.get_stats().evictions == 1
+
+    table.commit(1)
+    assert table.get("a", 0) is None
+    assert table.get("c", 2) is not None
+
+    table.set("d", 0, (ParseResult(Location(""), 4), 4))
+    assert table.get("d", 0) is None
+
+    # An edit keeps the entries after it, moved, and those before it that stopped looking before it
+    table = MemoTable()
+    results = [ParseResult(Location(""), i) for i in range(5)]
+
+    for i, (offset, end, reach) in enumerate([(0, 2, 3), (0, 2, 5), (4, 6, 6), (8, 9, None), (2, 4, None)]):
+        table.set(i, offset, (results[i], end), reach)
+
+    table.edit(5, 7, 3, 23)
+    assert [table.get(i, offset) for i, offset in enumerate([0, 0, 4, 11, 2])] == [(results[0], 2), None, None, (results[3], 12), None]
+
+    table.set(5, 20, (results[4], 21), 21)
+    table.edit(1, 2, -1, 22)
+    assert [table.get(i, offset) for i, offset in [(0, 0), (3, 10), (5, 19)]] == [None, (results[3], 11), (results[4], 20)]
+
+    try:
+        MemoTable(0)
+        assert False
+    except ValueError:
+        pass
+
+def test_Parser_nodes():
+    digits = Terminal(Regex("[0-9]+"))
+    parser = Seq(Char('-'), Maybe(digits)) << EOS()
+
+    assert parser.get_kind() == "LShift"
+    assert repr(Maybe(digits)) == "Maybe(Terminal(Regex('[0-9]+'), None))"
+    assert parser == Seq(Char('-'), Maybe(Terminal(Regex("[0-9]+")))) << EOS()
+    assert hash(parser) == hash(Seq(Char('-'), Maybe(Terminal(Regex("[0-9]+")))) << EOS())
+    assert parser != Seq(Char('-'), Maybe(digits)) << Char('x')
+    assert Count(digits, 1, 2) != Count(digits, 1, 3)
+    assert len({Maybe(digits), Maybe(digits), Try(digits)}) == 2
+    assert not hasattr(parser, "__dict__") and not hasattr(Maybe(digits), "__dict__")
+
+    # Parsers made from functions, and the references inside them, are only equal to themselves
+    function_parser = Parser(lambda loc, stream: ParseResult(loc, None))
+    reference = Reference()
+    assert function_parser != Parser(lambda loc, stream: ParseResult(loc, None))
+    assert Parser(reference) == Parser(reference) and Parser(reference) != Parser(Reference())
+
+    lexer = Lexer([Pattern("a", Regex("a"))])
+    assert Lexeme(lexer, "a") == Lexeme(lexer, "a")
+    assert Lexeme(lexer, "a") != Lexeme(Lexer([Pattern("a", Regex("a"))]), "a")
+
+def test_optimize():
+    number = Map(Map(Digits(), lambda r: int(r.value)), lambda r: -r.value)
+    pair = Between(Char('('), Seq(number, Seq(Char(','), Whitespaces()), number), Char(')'))
+    parser = ZeroOrMore(pair << Maybe(Whitespaces()))
+    optimized = optimize(parser)
+
+    assert pair.get_kind() == "LShift" and pair.get_children()[1].get_kind() == "Terminal"
+    assert optimized.get_kind() == "Count" and optimized.get_children()[0].get_kind() == "Sequence"
+
+    for input in ["(1, 2) (3,  4)", "(1,2)", "(1, x)", "(1, 2", "(12, 345)(6, 7)"]:
+        stream, optimized_stream = StringStream(input), StringStream(input)
+        expected = parser.parse(stream)
+        result = optimized.parse(optimized_stream)
+
+        assert repr(result) == repr(expected)
+        assert optimized_stream.get_offset() == stream.get_offset()
+
+    for input in ["(1, x)", "[1, 2]", "(1 2)"]:
+        try:
+            pair.parse(input)
+            assert False
+        except ParseError as e:
+            expected_message = e.get_message_with_trace()
+
+        try:
+            optimize(pair).parse(input)
+            assert False
+        except ParseError as e:
+            assert e.get_message_with_trace() == expected_message
+
+    expression = Reference()
+    expression.set(FirstSuccess([Between(Char('('), Seq(Char('-'), expression), Char(')')), Digits()]))
+    assert repr(optimize(Parser(expression)).parse("(-(-1))")) == repr(Parser(expression).parse("(-(-1))"))
+
+def test_compile():
+    number = Map(Digits(), lambda r: int(r.value))
+    expression = Reference(True)
+    expression.set(FirstSuccess([
+        Map(Seq(Parser(expression), Char('-'), number), lambda r: r.value[0].value - r.value[2].value),
+        Between(Char('('), Parser(expression), Char(')')),
+        number,
+    ]))
+    parser = Seq(Count(Parser(expression) << Maybe(Char(',')), 1, None), Try(Char(';')), Named("end", EOS()))
+    compiled = compile(parser)
+
+    assert compiled.get_kind() == "Compiled" and "def " in compiled.get_source()
+
+    for input in ["10-2-3", "(10-2)-3,7", "1,(2-(3-4));", "1,x", "", "(1", "1-", "1;2"]:
+        stream, compiled_stream = StringStream(input), StringStream(input)
+
+        try:
+            expected = repr(parser.parse(stream).value[0])
+        except ParseError as e:
+            expected = e.get_message_with_trace()
+
+        try:
+            result = repr(compiled.parse(compiled_stream).value[0])
+        except ParseError as e:
+            result = e.get_message_with_trace()
+
+        assert result == expected
+        assert compiled_stream.get_offset() == stream.get_offset()
+
+    assert compile(parser).parse("5-1").value[0].value[0].value == 4
+
+def test_cache(tmp_path, monkeypatch):
+    def make() -> Parser:
+        number = Map(Terminal(Regex("[0-9]+")), lambda r: int(r.value))
+        lexer = CompiledLexer([Pattern("WORD", Regex("[a-z]+")), Pattern("WS", Regex(" +"))])
+        return Map(Seq(Count(number << Maybe(Char(',')), 1, None), Maybe(lexer)), lambda r: [n.value for n in r.value[0].value])
+
+    path = str(tmp_path / "grammar.cache")
+    parser = make()
+
+    assert cache.fingerprint(parser) == cache.fingerprint(make())
+    assert cache.fingerprint(parser) != cache.fingerprint(Seq(Terminal(Regex("[0-9]*")), Maybe(Char(','))))
+
+    loaded = cache.load(parser, path, compiled=True)
+    contents = (tmp_path / "grammar.cache").read_bytes()
+
+    for input in ["1,2,3abc", "12 ", "x"]:
+        try:
+            expected = repr(parser.parse(input).value)
+        except ParseError as e:
+            expected = e.get_message_with_trace()
+
+        for other in [loaded, cache.load(make(), path, compiled=True), cache.load(make(), path)]:
+            try:
+                assert repr(other.parse(input).value) == expected
+            except ParseError as e:
+                assert e.get_message_with_trace() == expected
+
+    assert (tmp_path / "grammar.cache").read_bytes() == contents
+
+    # Cached code is bound to the objects of the grammar it is loaded for without generating it again
+    class Scale:
+        def __init__(self, factor):
+            self.factor = factor
+
+        def __call__(self, result):
+            return int(result.value) * self.factor
+
+    scaled_path = str(tmp_path / "scaled.cache")
+    make_scaled = lambda factor: Count(Map(Terminal(Regex("[0-9]+")), Scale(factor)) << Maybe(Char(',')), 1, None)
+    assert cache.fingerprint(make_scaled(2)) == cache.fingerprint(make_scaled(3))
+    assert [r.value for r in cache.load(make_scaled(2), scaled_path, compiled=True).parse("1,2").value] == [2, 4]
+
+    def generate(self, parser):
+        assert False
+
+    monkeypatch.setattr(_Compiler, "generate", generate)
+    scaled = cache.load(make_scaled(3), scaled_path, compiled=True)
+    assert [r.value for r in scaled.parse("1,2").value] == [3, 6]
+    monkeypatch.undo()
+    assert scaled.get_source() == compile(make_scaled(3)).get_source()
+
+    (tmp_path / "grammar.cache").write_bytes(b"not a cache")
+    assert cache.load(make(), path, compiled=True).parse("7").value == [7]
+    assert (tmp_path / "grammar.cache").read_bytes() != b"not a cache"
+
+    invalid = Regex("(")
+
+    try:
+        invalid.match(StringStream("("))
+        assert False
+    except Exception:
+        pass
+
+def make_numbers() -> Parser:
+    return Map(Count(Map(Digits(), lambda r: int(r.value)) << Maybe(Char(',')), 1, None) << EOS(), lambda r: [n.value for n in r.value])
+
+def test_profile(tmp_path):
+    number = Named("number", Terminal(Regex("[0-9]+")))
+    call = Named("call", Seq(Terminal(Regex("[a-z]+")), Char('('), number, Char(')')))
+    value = Named("value", FirstSuccess([call, Named("name", Terminal(Regex("[a-z]+"))), number]))
+    parser = ZeroOrMore(value << Maybe(Char(',')))
+
+    with profile() as p:
+        parser.parse("f(1),g,12,h(x)")
+
+        try:
+            with profile():
+                pass
+
+            assert False
+        except Exception:
+            pass
+
+    stats = p.get_stats()
+    assert (stats["value"].calls, stats["value"].successes, stats["value"].failures) == (5, 4, 1)
+    assert (stats["call"].calls, stats["call"].successes, stats["call"].backtracks) == (4, 1, 2)
+    assert stats["name"].consumed == 2 and stats["number"].consumed == 3
+    assert stats["value"].inclusive >= stats["value"].exclusive >= 0
+
+    assert set(p.get_stacks()) == {("value",), ("value", "call"), ("value", "call", "number"), ("value", "name"), ("value", "number")}
+    assert p.report(limit=2).count("\n") == 2 and p.report(sort_by="calls").split("\n")[1].startswith("value")
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in p.get_folded().splitlines())
+
+    p.write_folded(str(tmp_path / "stacks.txt"))
+    assert (tmp_path / "stacks.txt").read_text() == p.get_folded()
+
+    try:
+        p.report(sort_by="name")
+        assert False
+    except ValueError:
+        pass
+
+    with profile() as p:
+        pass
+
+    parser.parse("f(1)")
+    assert p.get_stats() == {}
+
+def test_parse_many():
+    inputs = ["1,2,3", ("second", "4,x"), "", "56", ("fifth", "7,8,")]
+    expected = []
+
+    for input in inputs:
+        try:
+            expected.append(make_numbers().parse(StringStream(input) if isinstance(input, str) else StringStream(input[1], input[0])).value)
+        except ParseError as e:
+            expected.append(e.get_message_with_trace())
+
+    def summarize(outcome):
+        return outcome.get_message_with_trace() if isinstance(outcome, ParseError) else outcome.value
+
+    for workers in [1, 2]:
+        assert [summarize(o) for o in parse_many(make_numbers, inputs, workers=workers, chunk_size=2)] == expected
+        assert sorted((i, repr(summarize(o))) for i, o in parse_many_unordered(make_numbers, iter(inputs), workers=workers)) == [(i, repr(e)) for i, e in enumerate(expected)]
+
+    error = list(parse_many(make_numbers, [("name", "1,2,x")], workers=2))[0]
+    assert isinstance(error, ParseError) and str(error.get_location()) == "name:1:5" and error.get_offset() == 4
+
+    try:
+        list(parse_many(make_numbers, inputs, workers=-1))
+        assert False
+    except ValueError:
+        pass
+
+def test_pickle():
+    stream = StringStream("ab\ncd", "name")
+    stream.set_offset(4)
+    location = pickle.loads(pickle.dumps(stream.get_location()))
+
+    assert location == Location("name", Position(2, 2)) and location.offset == 4
+
+    error = ParseError.expectation("'x'", "'d'", stream.get_location())
+    error = ParseError.combine(ParseError(Location("outer"), "Outer {}", format_args=(object(),)), error)
+    copy = pickle.loads(pickle.dumps(error))
+
+    assert type(copy) is ParseError and copy.get_message_with_trace() == error.get_message_with_trace()
+    assert copy.get_location() == error.get_location() and copy.get_trace()[0].get_offset() == 4
+
 def test_Variant():
     assert False
 
@@ -194,6 +1071,78 @@ def test_FirstSuccess():
     assert FirstSuccess([Letters(), AlphaNums(), Digits()]).parse("123abc").value == "123abc"
     assert FirstSuccess([Letters(), AlphaNums(), Digits()]).parse("qwe123abc").value == "qwe"
 
+def test_FirstSet():
+    assert Letter().get_first_set() == FirstSet(frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    assert Char('x').get_first_set() == FirstSet(frozenset("x"))
+    assert Seq(Maybe(Char('-')), Digit()).get_first_set() == FirstSet(frozenset("-0123456789"))
+    assert (Maybe(Char('a')) >> Maybe(Char('b'))).get_first_set() == FirstSet(frozenset("ab"), True)
+    assert (EOS() << Char('a')).get_first_set() == FirstSet(frozenset([EOF]))
+    assert Chars().get_first_set() is None
+    assert Parser(lambda loc, stream: ParseResult(loc, None)).get_first_set() is None
+
+    lexer = CompiledLexer([Pattern("WS", Regex("[ ]+")), Pattern("ID", Regex("[a-z]+"))])
+    assert Lexeme(lexer, "ID").get_first_set() == FirstSet(frozenset(["ID"]), False, lexer)
+    assert Seq(Maybe(Char(' ')), Lexeme(lexer, "ID")).get_first_set() is None
+
+    calls = []
+
+    class CountingRegex(Regex):
+        def match(self, string, pos=0):
+            calls.append(self.get_pattern())
+            return super().match(string, pos)
+
+    parser = FirstSuccess([Terminal(CountingRegex("a")), Terminal(CountingRegex("x")), Terminal(CountingRegex("[a-z]"))])
+    assert parser.parse("xy").value == "x" and calls == ["x"]
+    assert parser.parse("q").value == "q" and calls == ["x", "[a-z]"]
+
+    try:
+        parser.parse("!")
+        assert False
+    except ParseError as e:
+        assert e.get_message() == "No option parsed!" and len(e.get_trace()) == 3
+
+    ref = Reference()
+    parser = FirstSuccess([Seq(ref, Char('!')), Char('?')])
+    ref.set(Char('a'))
+    assert parser.parse("a!").value[0].value == "a"
+    ref.set(Char('b'))
+    assert parser.parse("b!").value[0].value == "b"
+
+    statement = FirstSuccess([Lexeme(lexer, "ID", "let") >> Lexeme(lexer, "WS"), Lexeme(lexer, "WS"), Lexeme(lexer, "ID")])
+    assert [r.value for r in ZeroOrMore(statement).parse("let x y").value] == [" ", "x", " ", "y"]
+
+def test_FirstSet_dispatch():
+    # Choices dispatched on first sets must give what trying every alternative with re gives, including for
+    # ignore-case patterns, which re folds with characters (ſ, K, İ) that str's case mappings don't pair
+    patterns = ["(?i:s)+", "(?i:k)", "(?i:i)[a-z]*", "(?ai:k)", "s", "ab|(?i:SK)", "[a-c]+", "(?i:[r-t])"]
+    alphabet = "sSkKiIab!\u017f\u212a\u0130\u0131"
+    longest = Longest([Terminal(Regex(pattern)) for pattern in patterns])
+    first_success = FirstSuccess([Terminal(Regex(pattern)) for pattern in patterns])
+    lexer = CompiledLexer([Pattern(f"P{idx}", Regex(pattern)) for idx, pattern in enumerate(patterns)])
+    reference_lexer = Lexer([Pattern(f"P{idx}", Regex(pattern)) for idx, pattern in enumerate(patterns)])
+
+    for _ in range(200):
+        data = "".join(random.choice(alphabet) for _ in range(random.randint(1, 6)))
+        matches = [(idx, m[0]) for idx, m in enumerate(re.match(pattern, data) for pattern in patterns) if m is not None]
+        longest_match = max(matches, key=lambda match: (len(match[1]), -match[0]), default=None)
+
+        for parser, expected in [(longest, longest_match), (first_success, matches[0] if len(matches) != 0 else None)]:
+            if expected is not None:
+                assert parser.parse(data).value == expected[1]
+                continue
+
+            try:
+                parser.parse(data)
+                assert False
+            except ParseError:
+                pass
+
+        expected_token = (UNKNOWN_PATTERN_ID(), data[0]) if longest_match is None or longest_match[1] == "" else (f"P{longest_match[0]}", longest_match[1])
+
+        for lexer_parser in [lexer, reference_lexer]:
+            token = lexer_parser.parse(data).value
+            assert (token.id, token.text) == expected_token
+
 def test_Named():
     assert False
 
@@ -313,8 +1262,61 @@ def test_Whitespace():
 def test_Whitespaces():
     assert False
 
+def test_Literals(tmp_path):
+    path = tmp_path / "input.txt"
+    path.write_text("into in+=inx")
+
+    for parser in [Literals(["in", "int", "+", "+="]), compile(Literals(["in", "int", "+", "+="]))]:
+        stream = StringStream("into in+=inx")
+        assert parser.parse(stream).value == "int" and stream.get_offset() == 3
+        stream.set_offset(5)
+        assert [parser.parse(stream).value for _ in range(3)] == ["in", "+=", "in"]
+
+    assert Literals(["in", "int", "+"]).get_first_set() == FirstSet(frozenset(["i", "+"]))
+
+    for make in [lambda: StringStream("into in+=inx"), lambda: FileStream(str(path), chunk_size=4)]:
+        for parser in [Keywords(["in", "int", "+", "+="]), compile(Keywords(["in", "int", "+", "+="]))]:
+            stream = make()
+
+            try:
+                parser.parse(stream)
+                assert False
+            except ParseError as e:
+                assert e.get_message() == "Expected one of 'in', 'int', '+', '+=', but found 'i'"
+
+            stream.set_offset(5)
+            assert [parser.parse(stream).value for _ in range(2)] == ["in", "+="]
+
+            try:
+                parser.parse(stream)
+                assert False
+            except ParseError as e:
+                assert stream.get_offset() == 9
+
+    try:
+        Literals(["a", ""])
+        assert False
+    except ValueError:
+        pass
+
 def test_EOS():
     assert False
 
 def test_Error():
-    assert False
\ No newline at end of file
+    assert False
+
+def test_benchmark_compare(tmp_path, monkeypatch):
+    baseline = {"results": [{"workload": "json", "size": 1024, "mb_per_s": 2.0}, {"workload": "json", "size": 10240, "mb_per_s": 2.0}]}
+    results = [{"workload": "json", "size": 1024, "mb_per_s": 1.85}, {"workload": "json", "size": 10240, "mb_per_s": 1.5}, {"workload": "nested", "size": 1024, "mb_per_s": 0.1}]
+
+    assert suite.compare(results, baseline, 0.1) == ["json at 10 KB: 2.000 -> 1.500 MB/s"]
+    assert suite.compare(results, baseline, 0.05) == ["json at 1 KB: 2.000 -> 1.850 MB/s", "json at 10 KB: 2.000 -> 1.500 MB/s"]
+    assert suite.compare(results, baseline, 0.3) == []
+
+    monkeypatch.setattr(suite, "run_workload", lambda workload, size, repeat: {"workload": workload.name, "size": size, "mb_per_s": 1.5, "peak_memory": 0})
+    (tmp_path / "baseline.json").write_text(json.dumps(baseline))
+    args = ["--workloads", "json", "--max-size", "10240", "--output", str(tmp_path / "results.json"), "--compare", str(tmp_path / "baseline.json")]
+
+    assert suite.main(args) == 1
+    assert [r["size"] for r in json.loads((tmp_path / "results.json").read_text())["results"]] == [1024, 10240]
+    assert suite.main(args + ["--threshold", "0.3"]) == 0